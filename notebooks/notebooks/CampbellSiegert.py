@@ -54,7 +54,7 @@ S. Schrader, Siegert implementation by T. Tetzlaff
 import nest
 import numpy as np
 from scipy.optimize import fmin
-from scipy.special import erf
+from siegert import get_siegert_table, siegert_rate
 
 ###############################################################################
 # We first set the parameters of neurons, noise and the simulation. First
@@ -88,75 +88,81 @@ ms = 1e-3
 pA = 1e-12
 mV = 1e-3
 
-mu = 0.0
-sigma2 = 0.0
-J = []
-
 assert len(weights) == len(rates)
 
 ###############################################################################
 # In the following we analytically compute the firing rate of the neuron
 # based on Campbell's theorem [1]_ and Siegerts approximation [2]_.
-
-for rate, weight in zip(rates, weights):
-    if weight > 0:
-        tau_syn = tau_syn_ex
-    else:
-        tau_syn = tau_syn_in
-
-    # We define the form of a single PSP, which allows us to match the
-    # maximal value to or chosen weight.
-
-    def psp(x):
-        return -(
-            (C_m * pF)
-            / (tau_syn * ms)
-            * (1 / (C_m * pF))
-            * (np.exp(1) / (tau_syn * ms))
-            * (
-                ((-x * np.exp(-x / (tau_syn * ms))) / (1 / (tau_syn * ms) - 1 / (tau_m * ms)))
-                + (np.exp(-x / (tau_m * ms)) - np.exp(-x / (tau_syn * ms)))
-                / ((1 / (tau_syn * ms) - 1 / (tau_m * ms)) ** 2)
-            )
+#
+# We define the form of a single PSP, which allows us to match the maximal
+# value to or chosen weight. The shape of the PSP only depends on the synaptic
+# time constant, so its maximum is searched once per time constant.
+
+
+def psp(x, tau_syn):
+    return -(
+        (C_m * pF)
+        / (tau_syn * ms)
+        * (1 / (C_m * pF))
+        * (np.exp(1) / (tau_syn * ms))
+        * (
+            ((-x * np.exp(-x / (tau_syn * ms))) / (1 / (tau_syn * ms) - 1 / (tau_m * ms)))
+            + (np.exp(-x / (tau_m * ms)) - np.exp(-x / (tau_syn * ms))) / ((1 / (tau_syn * ms) - 1 / (tau_m * ms)) ** 2)
         )
+    )
 
-    min_result = fmin(psp, [0], full_output=1, disp=0)
 
-    # We need to calculate the PSC amplitude (i.e., the weight we set in NEST)
-    # from the PSP amplitude, that we have specified above.
+rates = np.array(rates)
+weights = np.array(weights)
+tau_syn = np.where(weights > 0, tau_syn_ex, tau_syn_in)
 
-    fudge = -1.0 / min_result[1]
-    J.append(C_m * weight / (tau_syn) * fudge)
+# We need to calculate the PSC amplitude (i.e., the weight we set in NEST)
+# from the PSP amplitude, that we have specified above.
 
-    # We now use Campbell's theorem to calculate mean and variance of
-    # the input due to the Poisson sources. The mean and variance add up
-    # for each Poisson source.
+fudge = {t: -1.0 / fmin(psp, [0], args=(t,), full_output=1, disp=0)[1] for t in np.unique(tau_syn)}
+J = C_m * weights / tau_syn * np.array([fudge[t] for t in tau_syn])
 
-    mu += rate * (J[-1] * pA) * (tau_syn * ms) * np.exp(1) * (tau_m * ms) / (C_m * pF)
+# We now use Campbell's theorem to calculate mean and variance of
+# the input due to the Poisson sources. The mean and variance add up
+# for each Poisson source.
 
-    sigma2 += (
-        rate
-        * (2 * tau_m * ms + tau_syn * ms)
-        * (J[-1] * pA * tau_syn * ms * np.exp(1) * tau_m * ms / (2 * (C_m * pF) * (tau_m * ms + tau_syn * ms))) ** 2
-    )
+mu = np.sum(rates * (J * pA) * (tau_syn * ms) * np.exp(1) * (tau_m * ms) / (C_m * pF))
+
+sigma2 = np.sum(
+    rates
+    * (2 * tau_m * ms + tau_syn * ms)
+    * (J * pA * tau_syn * ms * np.exp(1) * tau_m * ms / (2 * (C_m * pF) * (tau_m * ms + tau_syn * ms))) ** 2
+)
 
 mu += E_L * mV
 sigma = np.sqrt(sigma2)
 
 ###############################################################################
 # Having calculate mean and variance of the input, we can now employ
-# Siegert's rate approximation.
-
-num_iterations = 100
-upper = (V_th * mV - mu) / (sigma * np.sqrt(2))
-lower = (E_L * mV - mu) / (sigma * np.sqrt(2))
-interval = (upper - lower) / num_iterations
-tmpsum = 0.0
-for cu in range(0, num_iterations + 1):
-    u = lower + cu * interval
-    f = np.exp(u**2) * (1 + erf(u))
-    tmpsum += interval * np.sqrt(np.pi) * f
-r = 1.0 / (t_ref * ms + tau_m * ms * tmpsum)
+# Siegert's rate approximation. The integral of Siegert's formula is computed
+# by Gauss-Legendre quadrature (see :doc:`siegert`).
+
+r = siegert_rate(mu, sigma, tau_m * ms, t_ref * ms, V_th * mV, V_reset * mV)
+
+###############################################################################
+# For mean-field calculations that require the rates of many combinations of
+# mean and standard deviation, the rates can be interpolated from a table
+# instead, which is computed once for the given neuron parameters. Its error
+# is estimated from the deviations from the exact rates between the grid
+# points.
+
+table = get_siegert_table(
+    tau_m * ms,
+    t_ref * ms,
+    V_th * mV,
+    V_reset * mV,
+    mu_range=(-80.0 * mV, -40.0 * mV),
+    sigma_range=(0.5 * mV, 10.0 * mV),
+)
+print(
+    f"firing rate (interpolated / calculated): {table(mu, sigma)} / {r} "
+    f"(estimated table error {table.max_error:.2g} 1/s)"
+)
 
 ###############################################################################
 # We now simulate neurons receiving Poisson spike trains as input,
@@ -54,6 +54,38 @@ the basis of the network used in [1]_.
 The optimization algorithm (evolution strategies) is described in
 Wierstra et al. [2]_.
 
+The individuals of a generation are independent of each other and can
+therefore be simulated in parallel worker processes. Every network
+simulation is seeded with the same seed, so that the fitness of an
+individual does not depend on which process evaluates it, and the
+search yields the same results as when evaluating one individual after
+the other. The worker processes import the objective function from this
+script, so parallel evaluation is only available if the example is run
+as a script, for example with ``n_processes`` set to ``os.cpu_count()``,
+but not from an interactive session or a notebook.
+
+Near convergence, and when a search is restarted with the same settings,
+the same network parametrizations are simulated again and again. If a
+cache directory is given, the activity statistics of every simulated
+network are therefore stored in it, one file per parametrization, named
+after a hash of the simulation parameters with the candidate parameters
+rounded to a fixed number of decimals and of a version of the
+statistics. Cached statistics are reused instead of simulating the
+network again. Entries are written atomically, so that several worker
+processes can share the cache, and the least recently used entries are
+regularly removed once the cache exceeds its maximal size.
+
+Many candidates are obviously poor, for example because the network
+falls silent or its activity explodes. If screening parameters are
+given, every candidate is therefore first screened in a network of
+reduced size for a reduced simulation time. The screening simulation
+runs in chunks and is aborted as soon as the rate after the warmup time
+leaves the given bounds. Only candidates that pass the screening are
+promoted to a simulation of the full network. Since fitness values
+obtained at different fidelities are not comparable, the fitness
+shaping ranks all promoted candidates above the screened-out ones and
+sorts each group by its fitness. Screening is disabled by default.
+
 
 References
 ~~~~~~~~~~~~
@@ -76,11 +108,19 @@ Authors
 Jakob Jordan
 """
 
+import functools
+import hashlib
+import json
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import matplotlib.pyplot as plt
 import nest
 import numpy as np
 import scipy.special as sp
 from matplotlib.patches import Ellipse
+from spike_trains import SpikeTrains
 
 ###############################################################################
 # Analysis
@@ -99,43 +139,6 @@ def compute_rate(spikes, N_rec, sim_time):
     return 1.0 * len(spikes["times"]) / N_rec / sim_time * 1e3
 
 
-def sort_spikes(spikes):
-    # Sorts recorded spikes by node ID
-    unique_node_ids = sorted(np.unique(spikes["senders"]))
-    spiketrains = []
-    for node_id in unique_node_ids:
-        spiketrains.append(spikes["times"][spikes["senders"] == node_id])
-    return unique_node_ids, spiketrains
-
-
-def compute_cv(spiketrains):
-    # Computes coefficient of variation from sorted spikes
-    if spiketrains:
-        isis = np.hstack([np.diff(st) for st in spiketrains])
-        if len(isis) > 1:
-            return np.std(isis) / np.mean(isis)
-        else:
-            return 0.0
-    else:
-        return 0.0
-
-
-def bin_spiketrains(spiketrains, t_min, t_max, t_bin):
-    # Bins sorted spikes
-    bins = np.arange(t_min, t_max, t_bin)
-    return bins, [np.histogram(s, bins=bins)[0] for s in spiketrains]
-
-
-def compute_correlations(binned_spiketrains):
-    # Computes correlations from binned spiketrains
-    n = len(binned_spiketrains)
-    if n > 1:
-        cc = np.corrcoef(binned_spiketrains)
-        return 1.0 / (n * (n - 1.0)) * (np.sum(cc) - n)
-    else:
-        return 0.0
-
-
 def compute_statistics(parameters, espikes, ispikes):
     # Computes population-averaged rates coefficients of variation and
     # correlations from recorded spikes of excitatory and inhibitory
@@ -147,14 +150,19 @@ def compute_statistics(parameters, espikes, ispikes):
     erate = compute_rate(espikes, parameters["N_rec"], parameters["sim_time"])
     irate = compute_rate(espikes, parameters["N_rec"], parameters["sim_time"])
 
-    enode_ids, espiketrains = sort_spikes(espikes)
-    inode_ids, ispiketrains = sort_spikes(ispikes)
+    # spike trains of all neurons that spiked at least once
+    espiketrains = SpikeTrains.from_events(espikes["senders"], espikes["times"])
+    ispiketrains = SpikeTrains.from_events(ispikes["senders"], ispikes["times"])
 
-    ecv = compute_cv(espiketrains)
-    icv = compute_cv(ispiketrains)
+    ecv = espiketrains.cv()
+    icv = ispiketrains.cv()
 
-    ecorr = compute_correlations(bin_spiketrains(espiketrains, 0.0, parameters["sim_time"], 1.0)[1])
-    icorr = compute_correlations(bin_spiketrains(ispiketrains, 0.0, parameters["sim_time"], 1.0)[1])
+    # The mean correlation is computed from the variance of the population
+    # signal of the sparse spike counts, which gives the same value as the
+    # full correlation matrix without building it for every candidate.
+    bins = np.arange(0.0, parameters["sim_time"], 1.0)
+    ecorr = espiketrains.mean_correlation(bins, method="population")
+    icorr = ispiketrains.mean_correlation(bins, method="population")
 
     return (np.mean([erate, irate]), np.mean([ecv, icv]), np.mean([ecorr, icorr]))
 
@@ -163,9 +171,9 @@ def compute_statistics(parameters, espikes, ispikes):
 # Network simulation
 
 
-def simulate(parameters):
-    # Simulates the network and returns recorded spikes for excitatory
-    # and inhibitory population
+def create_network(parameters):
+    # Creates the network and returns the spike recorders of the
+    # excitatory and inhibitory population
 
     # Code taken from brunel_alpha_nest.py
 
@@ -257,11 +265,148 @@ def simulate(parameters):
     conn_parameters_in = {"rule": "fixed_indegree", "indegree": CI}
     nest.Connect(nodes_in, nodes_ex + nodes_in, conn_parameters_in, "inhibitory")
 
+    return espikes, ispikes
+
+
+def simulate(parameters):
+    # Simulates the network and returns recorded spikes for excitatory
+    # and inhibitory population
+
+    espikes, ispikes = create_network(parameters)
+
     nest.Simulate(parameters["sim_time"])
 
     return (espikes.events, ispikes.events)
 
 
+def screen(parameters, rate_bounds, chunk_time):
+    # Simulates the network in chunks and aborts the simulation as soon
+    # as the rate in a chunk after the warmup time is outside the given
+    # bounds. Returns the recorded spikes for excitatory and inhibitory
+    # population and whether the simulation was completed.
+
+    espikes, ispikes = create_network(parameters)
+
+    n_events = 0
+    # stop if less than half a time step is left to avoid simulating for a rounding error
+    while parameters["sim_time"] - nest.biological_time > 0.5 * nest.resolution:
+        t_start = nest.biological_time
+        t_chunk = min(chunk_time, parameters["sim_time"] - t_start)
+        nest.Simulate(t_chunk)
+
+        # count spikes in the chunk without retrieving them
+        n_events_chunk = espikes.n_events + ispikes.n_events - n_events
+        n_events += n_events_chunk
+        rate = 1.0 * n_events_chunk / (2 * parameters["N_rec"]) / t_chunk * 1e3
+
+        if t_start >= parameters["warmup_time"] and not rate_bounds[0] <= rate <= rate_bounds[1]:
+            return (espikes.events, ispikes.events, False)
+
+    return (espikes.events, ispikes.events, True)
+
+
+###############################################################################
+# Caching
+
+# Version of the cached statistics, which needs to be increased whenever
+# the simulation or the computation of the statistics changes, so that
+# outdated entries are not reused.
+STATISTICS_VERSION = 1
+
+# Number of entries stored by this process since the cache was last
+# checked for entries to remove
+n_stored_statistics = 0
+
+
+def get_cache_key(parameters):
+    # Returns a hash of all simulation parameters and the version of the
+    # statistics that identifies the resulting network activity
+
+    key = {"version": STATISTICS_VERSION, "parameters": parameters}
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def load_statistics(cache_dir, key):
+    # Returns cached statistics or None if they are not in the cache
+
+    path = os.path.join(cache_dir, f"{key}.json")
+    try:
+        with open(path) as f:
+            statistics = json.load(f)
+        # mark the entry as recently used
+        os.utime(path)
+    except FileNotFoundError:
+        # not cached or removed by another process in the meantime
+        return None
+
+    return tuple(statistics)
+
+
+def store_statistics(cache_dir, key, statistics, cache_size):
+    # Stores statistics in the cache. Since listing the cache directory
+    # is expensive for large caches, every process only checks for
+    # entries to remove after storing a tenth of cache_size entries.
+
+    global n_stored_statistics
+
+    os.makedirs(cache_dir, exist_ok=True)
+
+    # write to a temporary file first, so that other processes never
+    # read an incomplete entry
+    path = os.path.join(cache_dir, f"{key}.json")
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "w") as f:
+        json.dump([float(x) for x in statistics], f)
+    os.replace(tmp_path, path)
+
+    n_stored_statistics += 1
+    if n_stored_statistics >= max(1, cache_size // 10):
+        n_stored_statistics = 0
+        evict_statistics(cache_dir, cache_size)
+
+
+def evict_statistics(cache_dir, cache_size):
+    # Removes the least recently used entries if the cache holds more
+    # than cache_size entries
+
+    entries = []
+    for entry in os.scandir(cache_dir):
+        if entry.name.endswith(".json"):
+            try:
+                entries.append((entry.stat().st_mtime, entry.path))
+            except FileNotFoundError:
+                pass
+
+    if len(entries) <= cache_size:
+        return
+
+    for _, path in sorted(entries)[: len(entries) - cache_size]:
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def simulate_and_compute_statistics(parameters, cache_dir=None, cache_size=10000):
+    # Returns the population-averaged rate, coefficient of variation and
+    # correlation of the network, which is only simulated if the
+    # statistics are not cached yet
+
+    if cache_dir is not None:
+        key = get_cache_key(parameters)
+        statistics = load_statistics(cache_dir, key)
+        if statistics is not None:
+            return statistics
+
+    espikes, ispikes = simulate(parameters)
+    statistics = compute_statistics(parameters, espikes, ispikes)
+
+    if cache_dir is not None:
+        store_statistics(cache_dir, key, statistics, cache_size)
+
+    return statistics
+
+
 ###############################################################################
 # Optimization
 
@@ -288,12 +433,18 @@ def default_learning_rate_sigma(dimensions):
     return (3 + np.log(dimensions)) / (12.0 * np.sqrt(dimensions))
 
 
-def compute_utility(fitness):
+def compute_utility(fitness, fidelity=None):
     # Computes utility and order used for fitness shaping
     # See Wierstra et al. (2014)
+    # If the fidelities at which the individuals were evaluated are
+    # given, individuals of higher fidelity are ranked above all
+    # individuals of lower fidelity.
 
     n = len(fitness)
-    order = np.argsort(fitness)[::-1]
+    if fidelity is None:
+        order = np.argsort(fitness)[::-1]
+    else:
+        order = np.lexsort((fitness, fidelity))[::-1]
     fitness = fitness[order]
 
     utility = [np.max([0, np.log((n / 2) + 1)]) - np.log(k + 1) for k in range(n)]
@@ -302,6 +453,16 @@ def compute_utility(fitness):
     return order, utility
 
 
+def evaluate_population(func, z, executor=None):
+    # Evaluates the fitness of every individual in a population, in
+    # parallel if a process pool executor is given. The results of func
+    # are returned in the order of the individuals.
+
+    if executor is None:
+        return np.array([func(*zi) for zi in z], dtype=float)
+    return np.array(list(executor.map(func, *z.T)), dtype=float)
+
+
 def optimize(
     func,
     mu,
@@ -315,6 +476,8 @@ def optimize(
     max_generations=2000,
     min_sigma=1e-8,
     verbosity=0,
+    n_processes=1,
+    multi_fidelity=False,
 ):
     ###########################################################################
     # Optimizes an objective function via evolution strategies using the
@@ -354,6 +517,13 @@ def optimize(
     #     the search is stopped.
     # verbosity: bool
     #     Whether to continuously print progress information.
+    # n_processes: int
+    #     Number of worker processes evaluating the individuals of a
+    #     generation in parallel. If larger than one, func needs to be
+    #     picklable, for example a module-level function.
+    # multi_fidelity: bool
+    #     Whether func returns the fitness together with the fidelity at
+    #     which an individual was evaluated. Requires fitness shaping.
     #
     # Returns
     # -------
@@ -372,60 +542,80 @@ def optimize(
         learning_rate_sigma = default_learning_rate_sigma(mu.size)
     if population_size is None:
         population_size = default_population_size(mu.size)
+    if multi_fidelity and not fitness_shaping:
+        raise ValueError("multi_fidelity requires fitness_shaping")
 
     generation = 0
     mu_history = []
     sigma_history = []
     pop_history = []
     fitness_history = []
-
-    while True:
-        # create new population using the search distribution
-        s = np.random.normal(0, 1, size=(population_size,) + np.shape(mu))
-        z = mu + sigma * s
-
-        # add mirrored perturbations if enabled
-        if mirrored_sampling:
-            z = np.vstack([z, mu - sigma * s])
-            s = np.vstack([s, -s])
-
-        # evaluate fitness for every individual in population
-        fitness = np.fromiter((func(*zi) for zi in z), float)
-
-        # print status if enabled
-        if verbosity > 0:
-            print(
-                f"# Generation {generation:d} | fitness {np.mean(fitness):.3f} | "
-                f'mu {", ".join(str(np.round(mu_i, 3)) for mu_i in mu)} | '
-                f'sigma {", ".join(str(np.round(sigma_i, 3)) for sigma_i in sigma)}'
-            )
-
-        # apply fitness shaping if enabled
-        if fitness_shaping:
-            order, utility = compute_utility(fitness)
-            s = s[order]
-            z = z[order]
-        else:
-            utility = fitness
-
-        # bookkeeping
-        if record_history:
-            mu_history.append(mu.copy())
-            sigma_history.append(sigma.copy())
-            pop_history.append(z.copy())
-            fitness_history.append(fitness)
-
-        # exit if max generations reached or search distributions are
-        # very narrow
-        if generation == max_generations or np.all(sigma < min_sigma):
-            break
-
-        # update parameter of search distribution via natural gradient
-        # descent in natural coordinates
-        mu += learning_rate_mu * sigma * np.dot(utility, s)
-        sigma *= np.exp(learning_rate_sigma / 2.0 * np.dot(utility, s**2 - 1))
-
-        generation += 1
+    fidelity_history = []
+
+    # Worker processes are spawned rather than forked so that they do not
+    # inherit any state of an already initialized NEST kernel.
+    executor = None
+    if n_processes > 1:
+        executor = ProcessPoolExecutor(n_processes, mp_context=multiprocessing.get_context("spawn"))
+
+    try:
+        while True:
+            # create new population using the search distribution
+            s = np.random.normal(0, 1, size=(population_size,) + np.shape(mu))
+            z = mu + sigma * s
+
+            # add mirrored perturbations if enabled
+            if mirrored_sampling:
+                z = np.vstack([z, mu - sigma * s])
+                s = np.vstack([s, -s])
+
+            # evaluate fitness for every individual in population
+            fitness = evaluate_population(func, z, executor)
+            fidelity = None
+            if multi_fidelity:
+                fitness, fidelity = fitness.T
+
+            # print status if enabled
+            if verbosity > 0:
+                print(
+                    f"# Generation {generation:d} | fitness {np.mean(fitness):.3f} | "
+                    f'mu {", ".join(str(np.round(mu_i, 3)) for mu_i in mu)} | '
+                    f'sigma {", ".join(str(np.round(sigma_i, 3)) for sigma_i in sigma)}'
+                )
+
+            # apply fitness shaping if enabled
+            if fitness_shaping:
+                order, utility = compute_utility(fitness, fidelity)
+                s = s[order]
+                z = z[order]
+            else:
+                utility = fitness
+
+            # bookkeeping
+            if record_history:
+                mu_history.append(mu.copy())
+                sigma_history.append(sigma.copy())
+                pop_history.append(z.copy())
+                fitness_history.append(fitness)
+                if multi_fidelity:
+                    fidelity_history.append(fidelity)
+
+            # exit if max generations reached or search distributions are
+            # very narrow
+            if generation == max_generations or np.all(sigma < min_sigma):
+                break
+
+            # update parameter of search distribution via natural gradient
+            # descent in natural coordinates
+            mu += learning_rate_mu * sigma * np.dot(utility, s)
+            sigma *= np.exp(learning_rate_sigma / 2.0 * np.dot(utility, s**2 - 1))
+
+            generation += 1
+    finally:
+        # also terminate the worker processes if an evaluation fails or
+        # the search is interrupted
+        if executor is not None:
+            executor.shutdown()
 
     return {
         "mu": mu,
@@ -434,43 +624,97 @@ def optimize(
         "mu_history": np.array(mu_history),
         "sigma_history": np.array(sigma_history),
         "pop_history": np.array(pop_history),
+        "fidelity_history": np.array(fidelity_history),
     }
 
 
-def optimize_network(optimization_parameters, simulation_parameters):
-    # Searches for suitable network parameters to fulfill defined constraints
+def compute_fitness(statistics, optimization_parameters):
+    # Returns the fitness of network activity statistics
 
-    np.random.seed(simulation_parameters["seed"])
+    rate, cv, corr = statistics
+    return (
+        -optimization_parameters["fitness_weight_rate"] * (rate - optimization_parameters["target_rate"]) ** 2
+        - optimization_parameters["fitness_weight_cv"] * (cv - optimization_parameters["target_cv"]) ** 2
+        - optimization_parameters["fitness_weight_corr"] * (corr - optimization_parameters["target_corr"]) ** 2
+    )
 
-    def objective_function(g, eta):
-        # Returns the fitness of a specific network parametrization
 
-        # create local copy of parameters that uses parameters given
-        # by optimization algorithm
-        simulation_parameters_local = simulation_parameters.copy()
-        simulation_parameters_local["g"] = g
-        simulation_parameters_local["eta"] = eta
+def objective_function(g, eta, simulation_parameters, optimization_parameters):
+    # Returns the fitness of a specific network parametrization and, if
+    # screening is enabled, the fidelity at which it was evaluated:
+    # 0 if the candidate failed the screening and 1 otherwise
+
+    # create local copy of parameters that uses parameters given
+    # by optimization algorithm
+    simulation_parameters_local = simulation_parameters.copy()
+    simulation_parameters_local["g"] = g
+    simulation_parameters_local["eta"] = eta
+
+    # round the parameters if cached, so that revisited
+    # parametrizations hit the cache and a cached result is identical
+    # to a new simulation
+    cache_dir = optimization_parameters["cache_dir"]
+    if cache_dir is not None:
+        simulation_parameters_local["g"] = round(float(g), optimization_parameters["cache_decimals"])
+        simulation_parameters_local["eta"] = round(float(eta), optimization_parameters["cache_decimals"])
+
+    screening = optimization_parameters["screening"]
+    if screening is None:
+        # perform the network simulation and analyse the result
+        statistics = simulate_and_compute_statistics(
+            simulation_parameters_local, cache_dir, optimization_parameters["cache_size"]
+        )
+        return compute_fitness(statistics, optimization_parameters)
+
+    # candidates with cached statistics of the full network need no screening
+    if cache_dir is None or load_statistics(cache_dir, get_cache_key(simulation_parameters_local)) is None:
+        screening_parameters = simulation_parameters_local.copy()
+        screening_parameters["N"] = int(screening["scale"] * simulation_parameters["N"])
+        screening_parameters["N_rec"] = int(screening["scale"] * simulation_parameters["N_rec"])
+        screening_parameters["sim_time"] = screening["sim_time"]
+
+        espikes, ispikes, passed = screen(screening_parameters, screening["rate_bounds"], screening["chunk_time"])
+
+        if not passed:
+            # analyse the spikes up to the time the screening was aborted,
+            # which is always after the warmup time
+            t_abort = nest.biological_time
+            screening_parameters["sim_time"] = t_abort
+            rate, cv, corr = compute_statistics(screening_parameters, espikes, ispikes)
+            # average the rate over the analysed time only, otherwise the
+            # rate of candidates screened out early is underestimated
+            rate *= t_abort / (t_abort - screening_parameters["warmup_time"])
+            return compute_fitness((rate, cv, corr), optimization_parameters), 0
+
+    statistics = simulate_and_compute_statistics(
+        simulation_parameters_local, cache_dir, optimization_parameters["cache_size"]
+    )
+    return compute_fitness(statistics, optimization_parameters), 1
 
-        # perform the network simulation
-        espikes, ispikes = simulate(simulation_parameters_local)
 
-        # analyse the result and compute fitness
-        rate, cv, corr = compute_statistics(simulation_parameters, espikes, ispikes)
-        fitness = (
-            -optimization_parameters["fitness_weight_rate"] * (rate - optimization_parameters["target_rate"]) ** 2
-            - optimization_parameters["fitness_weight_cv"] * (cv - optimization_parameters["target_cv"]) ** 2
-            - optimization_parameters["fitness_weight_corr"] * (corr - optimization_parameters["target_corr"]) ** 2
-        )
+def optimize_network(optimization_parameters, simulation_parameters):
+    # Searches for suitable network parameters to fulfill defined constraints
 
-        return fitness
+    np.random.seed(simulation_parameters["seed"])
 
-    return optimize(
+    # The objective function is defined on module level and its
+    # parameters are bound with functools.partial, so that it can be
+    # sent to the worker processes.
+    func = functools.partial(
         objective_function,
+        simulation_parameters=simulation_parameters,
+        optimization_parameters=optimization_parameters,
+    )
+
+    return optimize(
+        func,
         np.array(optimization_parameters["mu"]),
         np.array(optimization_parameters["sigma"]),
         max_generations=optimization_parameters["max_generations"],
         record_history=True,
         verbosity=optimization_parameters["verbosity"],
+        n_processes=optimization_parameters["n_processes"],
+        multi_fidelity=optimization_parameters["screening"] is not None,
     )
 
 
@@ -496,6 +740,21 @@ if __name__ == "__main__":
 
     optimization_parameters = {
         "verbosity": 1,  # print progress over generations
+        "n_processes": 1,  # number of worker processes evaluating individuals, only
+        # available if the example is run as a script
+        "cache_dir": None,  # directory of the statistics cache, None to disable
+        # caching, e.g. "brunel_alpha_evolution_strategies_cache"
+        "cache_size": 10000,  # maximal number of cached statistics
+        "cache_decimals": 4,  # decimals to which g and eta are rounded if cached
+        # screening of candidates at reduced fidelity, None to simulate
+        # every candidate at full fidelity, e.g.
+        # {
+        #     "scale": 0.5,  # relative size of the screened network
+        #     "sim_time": 500.0,  # (ms) duration of the screening
+        #     "chunk_time": 50.0,  # (ms) interval at which the rate is checked
+        #     "rate_bounds": [0.2, 20.0],  # (spikes/s) rates of promoted candidates
+        # }
+        "screening": None,
         "max_generations": 20,  # maximal number of generations
         "target_rate": 1.89,  # (spikes/s) target rate
         "target_corr": 0.0,  # target correlation
@@ -26,8 +26,9 @@ Auto- and crosscorrelation functions for spike trains
 A time bin of size `tbin` is centered around the time difference it
 represents. If the correlation function is calculated for `tau` in
 `[-tau_max, tau_max]`, the pair events contributing to the left-most
-bin are those for which `tau` in `[-tau_max-tbin/2, tau_max+tbin/2)` and
-so on.
+bin are those for which `tau` in `[-tau_max-tbin/2, -tau_max+tbin/2)` and
+so on. These are the bins of the histogram of the ``correlation_detector``
+with ``delta_tau = tbin``.
 
 Correlate two spike trains with each other assumes spike times to be ordered in
 time. `tau > 0` means spike2 is later than spike1
@@ -37,29 +38,88 @@ time. `tau > 0` means spike2 is later than spike1
 * spike1:  first spike train [tspike...]
 * spike2:  second spike train [tspike...]
 
+Spike times are given in simulation steps, as recorded by a spike recorder
+with ``time_in_steps`` set.
+
+Two implementations are provided. ``corr_spikes_sorted`` counts the pairs
+exactly: for a chunk of spikes of the first train, the window of spikes of the
+second train within the maximum time lag is found by a binary search with
+``np.searchsorted``, and the time differences of all pairs in the windows are
+histogrammed at once. ``corr_spikes_fft`` bins many spike trains on the
+simulation grid and computes the correlograms of many pairs of trains from the
+Fourier transforms of the binned trains, each of which is computed only once.
+As the trains are binned with the resolution of the simulation, both
+implementations return the same counts.
+
 """
 
 import nest
 import numpy as np
 
 
-def corr_spikes_sorted(spike1, spike2, tbin, tau_max, resolution):
+def get_bin_limits(tbin, tau_max, resolution):
+    # Returns the maximum time lag and the bin size in steps, the time lag in
+    # steps up to which pairs are counted, and the number of bins
+
     tau_max_i = int(tau_max / resolution)
     tbin_i = int(tbin / resolution)
+    return tau_max_i, tbin_i, tau_max_i + tbin_i / 2.0, int(2 * tau_max_i / tbin_i + 1)
+
+
+def corr_spikes_sorted(spike1, spike2, tbin, tau_max, resolution, chunk_size=10000):
+    tau_max_i, tbin_i, tau_lim, n_bins = get_bin_limits(tbin, tau_max, resolution)
+
+    spike1 = np.asarray(spike1)
+    spike2 = np.asarray(spike2)
+
+    cross = np.zeros(n_bins, "d")
+
+    for start in range(0, len(spike1), chunk_size):
+        spk1 = spike1[start : start + chunk_size]
+
+        # window of spikes of spike2 with -tau_lim <= spike2 - spike1 < tau_lim
+        lo = np.searchsorted(spike2, spk1 - tau_lim, side="left")
+        hi = np.searchsorted(spike2, spk1 + tau_lim, side="left")
+        n_pairs = hi - lo
 
-    cross = np.zeros(int(2 * tau_max_i / tbin_i + 1), "d")
+        # indices into spike2 of all pairs in the windows
+        idx2 = np.arange(np.sum(n_pairs)) + np.repeat(lo - np.cumsum(n_pairs) + n_pairs, n_pairs)
+        tau = spike2[idx2] - np.repeat(spk1, n_pairs)
 
-    j0 = 0
+        bin_idx = ((tau + tau_max_i + 0.5 * tbin_i) / tbin_i).astype(int)
+        cross += np.bincount(bin_idx, minlength=n_bins)
 
-    for spki in spike1:
-        j = j0
-        while j < len(spike2) and spike2[j] - spki < -tau_max_i - tbin_i / 2.0:
-            j += 1
-        j0 = j
+    return cross
+
+
+def corr_spikes_fft(spike_trains, pairs, tbin, tau_max, resolution):
+    # Computes the correlograms of the given pairs (i, j) of spike trains,
+    # where spike_trains[i] plays the role of spike1 and spike_trains[j] the
+    # role of spike2. Pairs with i == j give autocorrelations.
+
+    tau_max_i, tbin_i, tau_lim, n_bins = get_bin_limits(tbin, tau_max, resolution)
+
+    # integer time lags of the counted pairs and their bins
+    lags = np.arange(int(np.ceil(-tau_lim)), int(np.ceil(tau_lim)))
+    bin_idx = ((lags + tau_max_i + 0.5 * tbin_i) / tbin_i).astype(int)
 
-        while j < len(spike2) and spike2[j] - spki < tau_max_i + tbin_i / 2.0:
-            cross[int((spike2[j] - spki + tau_max_i + 0.5 * tbin_i) / tbin_i)] += 1.0
-            j += 1
+    t_min = min(np.min(spikes) for spikes in spike_trains if len(spikes) > 0)
+    t_max = max(np.max(spikes) for spikes in spike_trains if len(spikes) > 0)
+
+    # zero padding by the maximum lag avoids circular wrap-around
+    n_steps = int(t_max - t_min) + 1
+    n_fft = 2 ** int(np.ceil(np.log2(n_steps + lags[-1] + 1)))
+
+    spectra = {}
+    for i in np.unique(pairs):
+        binned = np.bincount(np.asarray(spike_trains[i] - t_min, dtype=int), minlength=n_fft)
+        spectra[i] = np.fft.rfft(binned)
+
+    cross = np.zeros((len(pairs), n_bins), "d")
+    for k, (i, j) in enumerate(pairs):
+        # entry tau of the circular correlation counts the pairs with spike2 - spike1 = tau
+        correlation = np.fft.irfft(np.conj(spectra[i]) * spectra[j], n_fft)
+        cross[k] = np.bincount(bin_idx, np.rint(correlation[lags]), minlength=n_bins)
 
     return cross
 
@@ -106,15 +166,25 @@ n_events_1, n_events_2 = cd.n_events
 lmbd1 = (n_events_1 / (T - tau_max)) * 1000.0
 lmbd2 = (n_events_2 / (T - tau_max)) * 1000.0
 
-spikes = sr.get("events", "senders")
+events = sr.get("events")
 
-sp1 = spikes[spikes == 4]
-sp2 = spikes[spikes == 5]
+sp1 = events["times"][events["senders"] == pn1.global_id]
+sp2 = events["times"][events["senders"] == pn2.global_id]
 
 # Find crosscorrelation
 cross = corr_spikes_sorted(sp1, sp2, t_bin, tau_max, resolution)
 
+# The FFT implementation gives the autocorrelations along with the
+# crosscorrelation
+auto1, auto2, cross_fft = corr_spikes_fft([sp1, sp2], [(0, 0), (1, 1), (0, 1)], t_bin, tau_max, resolution)
+
 print("Crosscorrelation:")
 print(cross)
 print("Sum of crosscorrelation:")
 print(sum(cross))
+print("Crosscorrelation of the correlation detector:")
+print(cd.histogram)
+print("Same counts with the FFT implementation:", np.array_equal(cross, cross_fft))
+print("Autocorrelations:")
+print(auto1)
+print(auto2)
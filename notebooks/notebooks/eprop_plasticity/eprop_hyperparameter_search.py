@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+#
+# eprop_hyperparameter_search.py
+#
+# This file is part of NEST.
+#
+# Copyright (C) 2004 The NEST Initiative
+#
+# NEST is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# NEST is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NEST.  If not, see <http://www.gnu.org/licenses/>.
+
+r"""Hyperparameter search for the N-MNIST e-prop tutorial
+----------------------------------------------------------------
+
+This script searches a grid of parameters of
+:doc:`eprop_supervised_classification_neuromorphic_mnist`, such as the
+learning rate, the number of recurrent neurons, the firing rate
+regularization, and the sparsity levels.
+
+Every configuration is trained by running the tutorial script with the
+corresponding command-line arguments in a separate process, so that every
+run has its own NEST kernel and several runs proceed in parallel. Before the
+runs are started, the N-MNIST dataset is downloaded and preprocessed once;
+all runs then memory-map the same read-only cache (see :doc:`helpers_eprop`).
+
+Poor configurations are discarded early by successive halving. All
+configurations are first trained for ``min_iter`` iterations. Only the
+fraction ``1 / reduction`` with the lowest validation error, that is, the
+error of the validation at the end of the training, is then trained
+further to ``reduction`` times as many iterations, and so on until
+``max_iter`` is reached. Each round continues the training from the checkpoint
+written at the end of the previous round, so no iteration is simulated twice,
+and the weights validated at the end of the previous round are not validated
+again.
+
+Every finished run is appended to a CSV file as soon as it is available,
+together with the round, the number of training iterations, and the wall-clock
+time. The log of each configuration is written to its own directory in
+``out_dir``.
+
+See Also
+~~~~~~~~
+
+:doc:`eprop_supervised_classification_neuromorphic_mnist`
+
+:doc:`Helper functions <helpers_eprop>`
+"""
+import argparse
+import csv
+import itertools
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import numpy as np
+from helpers_eprop import (
+    download_and_extract_nmnist_dataset,
+    get_nmnist_pixels_dict,
+    load_nmnist_dataset,
+    nmnist_duration_sequence,
+)
+
+script_dir = os.path.dirname(os.path.abspath(__file__))
+training_script = os.path.join(script_dir, "eprop_supervised_classification_neuromorphic_mnist.py")
+
+# parameters of the training script that can be searched
+search_parameters = [
+    "eta_train",
+    "n_rec",
+    "c_reg",
+    "f_target",
+    "sparsity_level_in_rec",
+    "sparsity_level_rec_rec",
+    "sparsity_level_rec_out",
+    "rng_seed",
+]
+
+default_space = {
+    "eta_train": [2e-3, 5e-3, 1e-2],
+    "n_rec": [100, 150, 200],
+    "sparsity_level_rec_rec": [0.9, 0.99],
+}
+
+result_fields = ["config", "round", "n_iter", "validation_error", "wall_time"]
+
+
+def get_configurations(space):
+    """Returns all combinations of the parameter values of a search space.
+
+    Parameters
+    ----------
+    space : dict
+        list of values for every parameter, see ``search_parameters``
+
+    Returns
+    -------
+    list
+        one dictionary of parameter values per configuration
+    """
+    unknown = set(space) - set(search_parameters)
+    if unknown:
+        raise ValueError(f"cannot search parameters {sorted(unknown)}, choose from {search_parameters}")
+
+    return [dict(zip(space, values)) for values in itertools.product(*space.values())]
+
+
+def prepare_dataset():
+    """Downloads and preprocesses the N-MNIST dataset as the training script
+    does, so that the runs only memory-map the cache.
+    """
+    pixels_blocklist = np.loadtxt(os.path.join(script_dir, "NMNIST_pixels_blocklist.txt"))
+    pixels_dict = get_nmnist_pixels_dict(pixels_blocklist)
+
+    for path in download_and_extract_nmnist_dataset(script_dir):
+        load_nmnist_dataset(path, pixels_dict, nmnist_duration_sequence)
+
+
+def train(config_id, config, n_iter, round_id, out_dir, n_iter_validate_every, checkpoint_every, n_threads):
+    """Trains a configuration up to a number of iterations, continuing from
+    its checkpoint, and returns the error of the validation at the end of the
+    training.
+
+    Parameters
+    ----------
+    config_id : int
+        index of the configuration
+    config : dict
+        parameter values passed to the training script
+    n_iter : int
+        number of training iterations to reach
+    round_id : int
+        round of the successive halving
+    out_dir : str
+        directory for the checkpoints, results, and logs of all configurations
+    n_iter_validate_every : int
+        number of training iterations between validations
+    checkpoint_every : int
+        number of training iterations between checkpoints
+    n_threads : int
+        number of NEST virtual processes per run
+
+    Returns
+    -------
+    dict
+        one row of the result table, see ``result_fields``
+    """
+    config_dir = os.path.join(out_dir, f"config_{config_id:03d}")
+    os.makedirs(config_dir, exist_ok=True)
+    results_path = os.path.join(config_dir, "results.npz")
+
+    command = [
+        sys.executable,
+        training_script,
+        f"--n_iter_train={n_iter}",
+        "--n_iter_test=0",
+        "--do_validation",
+        f"--n_iter_validate_every={n_iter_validate_every}",
+        "--do_checkpointing",
+        f"--n_iter_checkpoint_every={checkpoint_every}",
+        f"--checkpoint_path={os.path.join(config_dir, 'checkpoint.pkl')}",
+        f"--results_path={results_path}",
+        f"--total_num_virtual_procs={n_threads}",
+        "--no_export",
+        "--no_plotting",
+    ] + [f"--{key}={value}" for key, value in config.items()]
+
+    if round_id > 0:
+        command.append("--do_resume")
+
+    start = time.time()
+    with open(os.path.join(config_dir, "log.txt"), "a") as log:
+        process = subprocess.run(
+            command, cwd=script_dir, stdout=log, stderr=subprocess.STDOUT, env={**os.environ, "MPLBACKEND": "Agg"}
+        )
+
+    # the training script validates the network once after the last training
+    # iteration, which is the last validation in the results
+    validation_error = np.nan
+    if process.returncode == 0:
+        results = np.load(results_path)
+        errors = results["error"][results["label"] == "validation"]
+        if len(errors) > 0:
+            validation_error = errors[-1]
+
+    return {
+        "config": config_id,
+        "round": round_id,
+        "n_iter": n_iter,
+        "validation_error": validation_error,
+        "wall_time": time.time() - start,
+        **config,
+    }
+
+
+def run_search(configs, min_iter, max_iter, reduction, out_file, out_dir, n_iter_validate_every, n_runs, n_threads):
+    """Runs the successive halving over all configurations and appends every
+    result to a CSV file as soon as it is available.
+
+    Returns
+    -------
+    int
+        index of the best configuration of the last round
+    """
+    survivors = list(range(len(configs)))
+    n_iter = min_iter
+    round_id = 0
+
+    # The runs are separate processes, so threads suffice to wait for them.
+    with open(out_file, "w", newline="") as f, ThreadPoolExecutor(n_runs) as executor:
+        writer = csv.DictWriter(f, fieldnames=result_fields + sorted(set().union(*configs)))
+        writer.writeheader()
+
+        while True:
+            logging.info(f"round {round_id}: training {len(survivors)} configurations to {n_iter} iterations...")
+
+            futures = [
+                executor.submit(
+                    train, i, configs[i], n_iter, round_id, out_dir, n_iter_validate_every, min_iter, n_threads
+                )
+                for i in survivors
+            ]
+
+            errors = {}
+            for future in as_completed(futures):
+                result = future.result()
+                writer.writerow(result)
+                f.flush()
+
+                errors[result["config"]] = result["validation_error"]
+                logging.info(
+                    f"config {result['config']} after {n_iter} iterations: "
+                    f"validation error {result['validation_error']:.3f} ({result['wall_time']:.0f}s)"
+                )
+
+            # failed runs have no validation error and are discarded first
+            survivors = sorted(survivors, key=lambda i: (np.nan_to_num(errors[i], nan=np.inf), i))
+
+            if n_iter >= max_iter or len(survivors) == 1:
+                return survivors[0]
+
+            survivors = survivors[: max(1, len(survivors) // reduction)]
+            n_iter = min(n_iter * reduction, max_iter)
+            round_id += 1
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--space",
+        type=str,
+        default=None,
+        help="JSON file mapping parameters to lists of values. Defaults to a grid over eta_train, n_rec, and \
+                        sparsity_level_rec_rec.",
+    )
+    parser.add_argument("--min_iter", type=int, default=20, help="Training iterations in the first round.")
+    parser.add_argument("--max_iter", type=int, default=200, help="Training iterations in the last round.")
+    parser.add_argument("--reduction", type=int, default=2, help="Factor by which the configurations are reduced.")
+    parser.add_argument("--n_iter_validate_every", type=int, default=10)
+    parser.add_argument("--runs", type=int, default=4, help="Number of runs in parallel.")
+    parser.add_argument("--threads", type=int, default=max(1, os.cpu_count() // 4), help="NEST threads per run.")
+    parser.add_argument("--out_dir", type=str, default="eprop_hyperparameter_search")
+    parser.add_argument("--out_file", type=str, default="eprop_hyperparameter_search.csv")
+
+    args, unknown = parser.parse_known_args()
+    logging.basicConfig(level=logging.INFO)
+
+    if args.space is None:
+        space = default_space
+    else:
+        with open(args.space) as f:
+            space = json.load(f)
+
+    configs = get_configurations(space)
+
+    prepare_dataset()
+
+    best = run_search(
+        configs,
+        args.min_iter,
+        args.max_iter,
+        args.reduction,
+        args.out_file,
+        os.path.abspath(args.out_dir),
+        args.n_iter_validate_every,
+        args.runs,
+        args.threads,
+    )
+
+    print(f"best configuration: {configs[best]}")
+    print(f"results stored in {args.out_file}")
@@ -75,15 +75,27 @@ References
 # ~~~~~~~~~~~~~~~~
 # We begin by importing all libraries required for the simulation, analysis, and visualization.
 
-import os
-import zipfile
+import argparse
+import pickle
+from concurrent.futures import ThreadPoolExecutor
 
 import matplotlib as mpl
 import matplotlib.pyplot as plt
 import nest
 import numpy as np
-import requests
 from cycler import cycler
+from helpers_eprop import (
+    WeightSampler,
+    connect_sparse,
+    download_and_extract_nmnist_dataset,
+    get_nmnist_pixels_dict,
+    get_params_gen_spk,
+    get_weights,
+    load_checkpoint,
+    load_nmnist_dataset,
+    nmnist_duration_sequence,
+    save_checkpoint,
+)
 from IPython.display import Image
 
 # %% ###########################################################################################################
@@ -102,13 +114,46 @@ except Exception:
 # Setup
 # ~~~~~
 
+# %% ###########################################################################################################
+# Parse command-line arguments
+# ............................
+# The parameters that are typically tuned can be overwritten from the command line, which is how the
+# hyperparameter search driver :doc:`eprop_hyperparameter_search` runs this script. Without arguments, the
+# default values of the tutorial are used.
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--rng_seed", type=int, default=1)
+parser.add_argument("--n_iter_train", type=int, default=200)
+parser.add_argument("--n_iter_test", type=int, default=10)
+parser.add_argument("--n_iter_validate_every", type=int, default=10)
+parser.add_argument("--do_validation", action="store_true", help="Validate in regular intervals.")
+parser.add_argument("--eta_train", type=float, default=5e-3, help="Learning rate before rescaling.")
+parser.add_argument("--n_rec", type=int, default=150)
+parser.add_argument("--c_reg", type=float, default=2.0, help="Coefficient of firing rate regularization per sequence.")
+parser.add_argument("--f_target", type=float, default=10.0)
+parser.add_argument("--sparsity_level_in_rec", type=float, default=0.75)
+parser.add_argument("--sparsity_level_rec_rec", type=float, default=0.99)
+parser.add_argument("--sparsity_level_rec_out", type=float, default=0.0)
+parser.add_argument("--total_num_virtual_procs", type=int, default=4)
+parser.add_argument("--do_checkpointing", action="store_true", help="Write checkpoints in regular intervals.")
+parser.add_argument("--n_iter_checkpoint_every", type=int, default=10)
+parser.add_argument(
+    "--checkpoint_path", type=str, default="./eprop_supervised_classification_neuromorphic_mnist_checkpoint.pkl"
+)
+parser.add_argument("--do_resume", action="store_true", help="Resume from the checkpoint if one exists.")
+parser.add_argument("--results_path", type=str, default=None, help="File to store the results in (.npz).")
+parser.add_argument("--no_export", action="store_true", help="Do not export the trained network.")
+parser.add_argument("--no_plotting", action="store_true", help="Do not plot the results.")
+
+args, unknown = parser.parse_known_args()
+
 # %% ###########################################################################################################
 # Initialize random generator
 # ...........................
 # We seed the numpy random generator, which will generate random initial weights as well as random input and
 # output.
 
-rng_seed = 1  # numpy random seed
+rng_seed = args.rng_seed  # numpy random seed
 np.random.seed(rng_seed)  # fix numpy random seed
 
 # %% ###########################################################################################################
@@ -122,17 +167,26 @@ np.random.seed(rng_seed)  # fix numpy random seed
 # learning performance up to the point where overfitting occurs. If early stopping is enabled, the
 # classification error is tested in regular intervals and the training stopped as soon as the error selected as
 # stop criterion is reached. After training, the performance can be tested over a number of test iterations.
+# If checkpointing is enabled, the state of the training is written to a file in regular intervals, so that a
+# run that was interrupted can be resumed from the last checkpoint by setting `do_resume` to True. A resumed run
+# continues the training, but does not reproduce an uninterrupted run exactly, as detailed below. Among the
+# e-prop tutorials, checkpointing is only implemented in this one, whose training takes the longest.
 
 group_size = 100  # number of instances over which to evaluate the learning performance, 100 for convergence
-n_iter_train = 200  # number of training iterations, 200 for convergence
-n_iter_test = 10  # number of iterations for final test
+n_iter_train = args.n_iter_train  # number of training iterations, 200 for convergence
+n_iter_test = args.n_iter_test  # number of iterations for final test
 do_early_stopping = False  # if True, stop training as soon as stop criterion fulfilled
-n_iter_validate_every = 10  # number of training iterations before validation
+do_validation = args.do_validation or do_early_stopping  # if True, validate in regular intervals
+n_iter_validate_every = args.n_iter_validate_every  # number of training iterations before validation
 n_iter_early_stop = 8  # number of iterations to average over to evaluate early stopping condition
 stop_crit = 0.07  # error value corresponding to stop criterion for early stopping
+do_checkpointing = args.do_checkpointing  # if True, write a checkpoint of the training in regular intervals
+n_iter_checkpoint_every = args.n_iter_checkpoint_every  # number of training iterations between checkpoints
+checkpoint_path = args.checkpoint_path  # path of checkpoint
+do_resume = args.do_resume  # if True, resume the training from the checkpoint if one exists
 
 steps = {
-    "sequence": 300,  # time steps of one full sequence
+    "sequence": round(nmnist_duration_sequence),  # time steps of one full sequence
     "learning_window": 10,  # time steps of window with non-zero learning signals
 }
 
@@ -162,7 +216,8 @@ duration.update({key: value * duration["step"] for key, value in steps.items()})
 params_setup = {
     "print_time": False,  # if True, print time progress bar during simulation, set False if run as code cell
     "resolution": duration["step"],
-    "total_num_virtual_procs": 4,  # number of virtual processes, set in case of distributed computing
+    # number of virtual processes, set in case of distributed computing
+    "total_num_virtual_procs": args.total_num_virtual_procs,
 }
 
 ####################
@@ -184,18 +239,10 @@ nest.set_verbosity("M_FATAL")
 
 pixels_blocklist = np.loadtxt("./NMNIST_pixels_blocklist.txt")
 
-pixels_dict = {
-    "n_x": 34,  # number of pixels in horizontal direction
-    "n_y": 34,  # number of pixels in vertical direction
-    "n_polarity": 2,  # number of pixels in the dimension coding for polarity
-}
-
-pixels_dict["n_total"] = pixels_dict["n_x"] * pixels_dict["n_y"] * pixels_dict["n_polarity"]  # total number of pixels
-pixels_dict["active"] = sorted(set(range(pixels_dict["n_total"])) - set(pixels_blocklist))  # active pixels
-pixels_dict["n_active"] = len(pixels_dict["active"])  # number of active pixels
+pixels_dict = get_nmnist_pixels_dict(pixels_blocklist)
 
 n_in = pixels_dict["n_active"]  # number of input neurons
-n_rec = 150  # number of recurrent neurons
+n_rec = args.n_rec  # number of recurrent neurons
 n_out = 10  # number of readout neurons
 
 model_nrn_rec = "eprop_iaf"
@@ -212,10 +259,10 @@ params_nrn_out = {
 params_nrn_rec = {
     "beta": 1.7,  # width scaling of the pseudo-derivative
     "C_m": 1.0,
-    "c_reg": 2.0 / duration["sequence"],  # coefficient of firing rate regularization
+    "c_reg": args.c_reg / duration["sequence"],  # coefficient of firing rate regularization
     "E_L": 0.0,
     "eprop_isi_trace_cutoff": 100,
-    "f_target": 10.0,  # spikes/s, target firing rate for firing rate regularization
+    "f_target": args.f_target,  # spikes/s, target firing rate for firing rate regularization
     "gamma": 0.5,  # height scaling of the pseudo-derivative
     "I_e": 0.0,
     "kappa": 0.99,  # low-pass filter of the eligibility trace
@@ -235,7 +282,7 @@ if model_nrn_rec == "eprop_iaf_adapt":
 
 if model_nrn_rec in ["eprop_iaf_psc_delta", "eprop_iaf_psc_delta_adapt"]:
     params_nrn_rec["V_reset"] = -0.5  # mV, reset membrane voltage
-    params_nrn_rec["c_reg"] = 2.0 / duration["sequence"] / scale_factor**2
+    params_nrn_rec["c_reg"] = args.c_reg / duration["sequence"] / scale_factor**2
     params_nrn_rec["V_th"] = 0.5
 
 ####################
@@ -280,13 +327,6 @@ params_mm_out = {
     "label": "multimeter_out",
 }
 
-params_wr = {
-    "senders": nrns_in[:n_record_w] + nrns_rec[:n_record_w],  # limit senders to subsample weights to record
-    "targets": nrns_rec[:n_record_w] + nrns_out,  # limit targets to subsample weights to record from
-    "start": duration["total_offset"],
-    "label": "weight_recorder",
-}
-
 params_sr_in = {
     "start": duration["offset_gen"],
     "label": "spike_recorder_in",
@@ -303,7 +343,6 @@ mm_rec = nest.Create("multimeter", params_mm_rec)
 mm_out = nest.Create("multimeter", params_mm_out)
 sr_in = nest.Create("spike_recorder", params_sr_in)
 sr_rec = nest.Create("spike_recorder", params_sr_rec)
-wr = nest.Create("weight_recorder", params_wr)
 
 nrns_rec_record = nrns_rec[:n_record]
 
@@ -333,10 +372,11 @@ def calculate_glorot_dist(fan_in, fan_out):
 
 
 def create_mask(weights, sparsity_level):
-    return np.random.choice([0, 1], weights.shape, p=[sparsity_level, 1 - sparsity_level])
+    # boolean mask, drawn from the same random numbers as np.random.choice([0, 1], p=[s, 1 - s])
+    return np.random.random_sample(weights.shape) >= sparsity_level
 
 
-def get_weight_recorder_senders_targets(weights, sender_pop, target_pop):
+def get_sampled_senders_targets(weights, sender_pop, target_pop):
     target_idc, sender_idc = np.where(weights)
     senders = sender_pop[np.unique(sender_idc[:n_record_w])]
     targets = target_pop[np.unique(target_idc[:n_record_w])]
@@ -349,22 +389,27 @@ np.fill_diagonal(weights_rec_rec, 0.0)  # since no autapses set corresponding we
 weights_rec_out = np.array(calculate_glorot_dist(n_rec, n_out).T) * scale_factor
 weights_out_rec = np.array(np.random.randn(n_rec, n_out)) / scale_factor
 
-sparsity_level_in_rec = 0.75
-sparsity_level_rec_rec = 0.99
-sparsity_level_rec_out = 0.0
+sparsity_level_in_rec = args.sparsity_level_in_rec
+sparsity_level_rec_rec = args.sparsity_level_rec_rec
+sparsity_level_rec_out = args.sparsity_level_rec_out
 
 weights_in_rec *= create_mask(weights_in_rec, sparsity_level_in_rec)
 weights_rec_rec *= create_mask(weights_rec_rec, sparsity_level_rec_rec)
 weights_rec_out *= create_mask(weights_rec_out, sparsity_level_rec_out)
 
-senders_in_rec, targets_in_rec = get_weight_recorder_senders_targets(weights_in_rec, nrns_in, nrns_rec)
-senders_rec_rec, targets_rec_rec = get_weight_recorder_senders_targets(weights_rec_rec, nrns_rec, nrns_rec)
-senders_rec_out, targets_rec_out = get_weight_recorder_senders_targets(weights_rec_out, nrns_rec, nrns_out)
+senders_in_rec, targets_in_rec = get_sampled_senders_targets(weights_in_rec, nrns_in, nrns_rec)
+senders_rec_rec, targets_rec_rec = get_sampled_senders_targets(weights_rec_rec, nrns_rec, nrns_rec)
+senders_rec_out, targets_rec_out = get_sampled_senders_targets(weights_rec_out, nrns_rec, nrns_out)
 
-params_wr["senders"] = np.unique(np.concatenate([senders_in_rec, senders_rec_rec, senders_rec_out]))
-params_wr["targets"] = np.unique(np.concatenate([targets_in_rec, targets_rec_rec, targets_rec_out]))
+# When resuming, the network is rebuilt with the sparse weight matrices of the checkpoint. Since the random numbers
+# are drawn as in the original run, all other parameters, such as the feedback weights, are identical.
 
-nest.SetStatus(wr, params_wr)
+checkpoint = load_checkpoint(checkpoint_path) if do_resume else None
+
+if checkpoint is not None:
+    weights_in_rec = checkpoint["weights"]["in_rec"]
+    weights_rec_rec = checkpoint["weights"]["rec_rec"]
+    weights_rec_out = checkpoint["weights"]["rec_out"]
 
 params_common_syn_eprop = {
     "optimizer": {
@@ -375,11 +420,13 @@ params_common_syn_eprop = {
         "Wmin": -100.0,  # pA, minimal limit of the synaptic weights
         "Wmax": 100.0,  # pA, maximal limit of the synaptic weights
     },
-    "weight_recorder": wr,
 }
 
+if checkpoint is not None:
+    params_common_syn_eprop["optimizer"].update(checkpoint["optimizer"])
+
 eta_test = 0.0  # learning rate for test phase
-eta_train = 5e-3 * scale_factor**2  # learning rate for training phase
+eta_train = args.eta_train * scale_factor**2  # learning rate for training phase
 
 params_syn_base = {
     "synapse_model": "eprop_synapse",
@@ -419,19 +466,11 @@ nest.SetDefaults("eprop_synapse", params_common_syn_eprop)
 
 nest.Connect(gen_spk_in, nrns_in, params_conn_one_to_one, params_syn_static)  # connection 1
 
+# The connections are created from the index arrays of the (sparse) weight matrices, see `connect_sparse`.
 
-def sparsely_connect(weights, params_syn, nrns_pre, nrns_post):
-    targets, sources = np.where(weights)
-    params_syn["weight"] = weights[targets, sources].flatten()
-    params_syn["delay"] = [params_syn["delay"] for _ in params_syn["weight"]]
-    nrns_pre_arr = np.array(nrns_pre.tolist())
-    nrns_post_arr = np.array(nrns_post.tolist())
-    nest.Connect(nrns_pre_arr[sources], nrns_post_arr[targets], params_conn_one_to_one, params_syn)
-
-
-sparsely_connect(weights_in_rec, params_syn_in, nrns_in, nrns_rec)  # connection 2
-sparsely_connect(weights_rec_rec, params_syn_rec, nrns_rec, nrns_rec)  # connection 3
-sparsely_connect(weights_rec_out, params_syn_out, nrns_rec, nrns_out)  # connection 4
+connect_sparse(weights_in_rec, params_syn_in, nrns_in, nrns_rec)  # connection 2
+connect_sparse(weights_rec_rec, params_syn_rec, nrns_rec, nrns_rec)  # connection 3
+connect_sparse(weights_rec_out, params_syn_out, nrns_rec, nrns_out)  # connection 4
 
 nest.Connect(nrns_out, nrns_rec, params_conn_all_to_all, params_syn_feedback)  # connection 5
 nest.Connect(gen_rate_target, nrns_out, params_conn_one_to_one, params_syn_rate_target)  # connection 6
@@ -454,9 +493,12 @@ nest.Connect(mm_out, nrns_out, params_conn_all_to_all, params_syn_static)
 # After downloading, it extracts the main dataset zip file, followed by further extraction of nested zip files
 # for training and test data, ensuring that the dataset is ready for loading and processing.
 
-# The `load_image` function reads a single image file from the dataset, converting the event-based neuromorphic
-# data into a format suitable for processing by spiking neural networks. It filters events based on specified
-# pixel blocklists, arranging the remaining events into a structured format representing the image.
+# The `load_nmnist_dataset` function converts the event-based neuromorphic data into a format suitable for
+# processing by spiking neural networks. Since decoding the binary sample files is costly, this is done only once
+# for the whole training and test set; the result is cached on disk next to the dataset. Events on pixels of the
+# blocklist are discarded, and the remaining events are stored as compact arrays of input channels and spike times,
+# sorted by channel, plus an index of where each sample starts. These arrays are memory-mapped, so that samples
+# can be served as slices without copying.
 
 # The `DataLoader` class facilitates the loading of the dataset for neural network training and testing. It
 # supports selecting specific labels for inclusion, allowing for targeted training on subsets of the dataset.
@@ -464,86 +506,22 @@ nest.Connect(mm_out, nrns_out, params_conn_all_to_all, params_syn_static)
 # representative samples are used throughout the training process.
 
 
-def unzip(zip_file_path, extraction_path):
-    print(f"Extracting {zip_file_path}.")
-    with zipfile.ZipFile(zip_file_path, "r") as zip_file:
-        zip_file.extractall(extraction_path)
-    os.remove(zip_file_path)
-
-
-def download_and_extract_nmnist_dataset(save_path="./"):
-    nmnist_dataset = {
-        "url": "https://prod-dcd-datasets-cache-zipfiles.s3.eu-west-1.amazonaws.com/468j46mzdv-1.zip",
-        "directory": "468j46mzdv-1",
-        "zip": "dataset.zip",
-    }
-
-    path = os.path.join(save_path, nmnist_dataset["directory"])
-
-    train_path = os.path.join(path, "Train")
-    test_path = os.path.join(path, "Test")
-
-    downloaded_zip_path = os.path.join(save_path, nmnist_dataset["zip"])
-
-    if not (os.path.exists(path) and os.path.exists(train_path) and os.path.exists(test_path)):
-        if not os.path.exists(downloaded_zip_path):
-            print("\nDownloading the N-MNIST dataset.")
-            response = requests.get(nmnist_dataset["url"], timeout=10)
-            with open(downloaded_zip_path, "wb") as file:
-                file.write(response.content)
-
-        unzip(downloaded_zip_path, save_path)
-        unzip(f"{train_path}.zip", path)
-        unzip(f"{test_path}.zip", path)
-
-    return train_path, test_path
-
-
-def load_image(file_path, pixels_dict):
-    with open(file_path, "rb") as f:
-        byte_array = np.asarray([x for x in f.read()])
-
-    n_byte_columns = 5
-    byte_columns = [byte_array[column::n_byte_columns] for column in range(n_byte_columns)]
-
-    x_coords = byte_columns[0]  # in pixels
-    y_coords = byte_columns[1]  # in pixels
-    polarities = byte_columns[2] >> 7  # 0 for OFF, 1 for ON
-    mask_22_bit = 0x7FFFFF  # mask to keep only lower 22 bits
-    times = (byte_columns[2] << 16 | byte_columns[3] << 8 | byte_columns[4]) & mask_22_bit  # in microseconds
-    time_max = 336040  # in microseconds, longest recording over training and test set
-    times = np.around(times * duration["sequence"] / time_max)  # map sample to sequence length
-
-    pixels = polarities * pixels_dict["n_x"] * pixels_dict["n_y"] + y_coords * pixels_dict["n_x"] + x_coords
-    image = [times[pixels == pixel] for pixel in pixels_dict["active"]]
-    return image
-
-
 class DataLoader:
-    def __init__(self, path, selected_labels, group_size, pixels_dict):
-        self.path = path
+    def __init__(self, dataset, selected_labels, group_size):
+        self.dataset = dataset
         self.selected_labels = selected_labels
         self.group_size = group_size
-        self.pixels_dict = pixels_dict
 
         self.current_index = 0
-        self.all_sample_paths, self.all_labels = self.get_all_sample_paths_with_labels()
-        self.n_all_samples = len(self.all_sample_paths)
+        self.all_sample_indices = np.concatenate(
+            [np.flatnonzero(self.dataset["labels"] == label) for label in self.selected_labels]
+        )
+        self.n_all_samples = len(self.all_sample_indices)
         self.shuffled_indices = np.random.permutation(self.n_all_samples)
 
-    def get_all_sample_paths_with_labels(self):
-        all_sample_paths = []
-        all_labels = []
-
-        for label in self.selected_labels:
-            label_dir_path = os.path.join(self.path, str(label))
-            all_files = sorted(os.listdir(label_dir_path))
-
-            for sample in all_files:
-                all_sample_paths.append(os.path.join(label_dir_path, sample))
-                all_labels.append(label)
-
-        return all_sample_paths, all_labels
+    def get_sample(self, sample_index):
+        start, end = self.dataset["offsets"][sample_index : sample_index + 2]
+        return self.dataset["channels"][start:end], self.dataset["times"][start:end]
 
     def get_new_evaluation_group(self):
         end_index = self.current_index + self.group_size
@@ -552,53 +530,71 @@ class DataLoader:
 
         self.current_index = (self.current_index + self.group_size) % self.n_all_samples
 
-        images_group = [load_image(self.all_sample_paths[i], self.pixels_dict) for i in selected_indices]
-        labels_group = [self.all_labels[i] for i in selected_indices]
+        sample_indices = self.all_sample_indices[selected_indices]
+        images_group = [self.get_sample(i) for i in sample_indices]
+        labels_group = [int(self.dataset["labels"][i]) for i in sample_indices]
 
         return images_group, labels_group
 
 
-def get_params_task_input_output(n_iter_interval, loader):
+# The `get_params_task_input_output` function assembles the parameters of the input spike generators, the target
+# rate generators, and the learning window generator for the next evaluation group of a data loader. The times
+# are relative to the start of the iteration, so that the parameters can be prepared ahead of time, before it is
+# known in which iteration they will be used; `shift_params_task_input_output` then moves them to the actual
+# iteration.
+
+
+def get_params_task_input_output(loader):
     input_group, target_group = loader.get_new_evaluation_group()
 
-    spike_times = [[] for _ in range(n_in)]
+    sequence_starts = np.arange(group_size) * duration["sequence"]
 
-    iteration_offset = n_iter_interval * group_size * duration["sequence"]
+    n_events = [len(channels) for channels, _ in input_group]
+    channels = np.concatenate([channels for channels, _ in input_group])
+    spike_times = (
+        np.repeat(sequence_starts, n_events)
+        + np.concatenate([relative_times for _, relative_times in input_group])
+        + duration["offset_gen"]
+    )
+
+    params_gen_spk_in = get_params_gen_spk(channels, spike_times, n_in)
+
+    target_rate_changes = np.zeros((n_out, group_size))
+    target_rate_changes[np.array(target_group), np.arange(group_size)] = 1.0
 
     params_gen_rate_target = [
         {
-            "amplitude_times": np.arange(0.0, group_size * duration["sequence"], duration["sequence"])
-            + iteration_offset
-            + duration["total_offset"],
-            "amplitude_values": np.zeros(group_size),
+            "amplitude_times": sequence_starts + duration["total_offset"],
+            "amplitude_values": target_rate_changes[nrn_out_idx],
         }
-        for _ in range(n_out)
+        for nrn_out_idx in range(n_out)
     ]
 
-    for group_element in range(group_size):
-        params_gen_rate_target[target_group[group_element]]["amplitude_values"][group_element] = 1.0
-
-        for n, relative_times in enumerate(input_group[group_element]):
-            if len(relative_times) > 0:
-                relative_times = np.array(relative_times)
-                spike_times[n].extend(
-                    iteration_offset + group_element * duration["sequence"] + relative_times + duration["offset_gen"]
-                )
-
     params_gen_learning_window = {
-        "amplitude_times": np.hstack(
-            [
-                np.array([0.0, duration["sequence"] - duration["learning_window"]])
-                + iteration_offset
-                + group_element * duration["sequence"]
-                + duration["total_offset"]
-                for group_element in range(group_size)
-            ]
-        ),
+        "amplitude_times": (
+            sequence_starts[:, np.newaxis]
+            + np.array([0.0, duration["sequence"] - duration["learning_window"]])
+            + duration["total_offset"]
+        ).flatten(),
         "amplitude_values": np.tile([0.0, 1.0], group_size),
     }
 
-    params_gen_spk_in = [{"spike_times": spk_times} for spk_times in spike_times]
+    return params_gen_spk_in, params_gen_rate_target, params_gen_learning_window
+
+
+def shift_params_task_input_output(params_task_input_output, n_iter_interval):
+    params_gen_spk_in, params_gen_rate_target, params_gen_learning_window = params_task_input_output
+
+    iteration_offset = n_iter_interval * group_size * duration["sequence"]
+
+    params_gen_spk_in = [{"spike_times": params["spike_times"] + iteration_offset} for params in params_gen_spk_in]
+    params_gen_rate_target = [
+        {**params, "amplitude_times": params["amplitude_times"] + iteration_offset} for params in params_gen_rate_target
+    ]
+    params_gen_learning_window = {
+        **params_gen_learning_window,
+        "amplitude_times": params_gen_learning_window["amplitude_times"] + iteration_offset,
+    }
 
     return params_gen_spk_in, params_gen_rate_target, params_gen_learning_window
 
@@ -608,8 +604,11 @@ train_path, test_path = download_and_extract_nmnist_dataset(save_path)
 
 selected_labels = [label for label in range(n_out)]
 
-data_loader_train = DataLoader(train_path, selected_labels, group_size, pixels_dict)
-data_loader_test = DataLoader(test_path, selected_labels, group_size, pixels_dict)
+dataset_train = load_nmnist_dataset(train_path, pixels_dict, duration["sequence"])
+dataset_test = load_nmnist_dataset(test_path, pixels_dict, duration["sequence"])
+
+data_loader_train = DataLoader(dataset_train, selected_labels, group_size)
+data_loader_test = DataLoader(dataset_test, selected_labels, group_size)
 
 # %% ###########################################################################################################
 # Force final update
@@ -628,18 +627,7 @@ nest.Connect(gen_spk_final_update, nrns_in + nrns_rec, "all_to_all", {"weight":
 # Read out pre-training weights
 # ~~~~~~~~~~~~~~~~~~~~~~~~~~~~~~
 # Before we begin training, we read out the initial weight matrices so that we can eventually compare them to
-# the optimized weights.
-
-
-def get_weights(pop_pre, pop_post):
-    conns = nest.GetConnections(pop_pre, pop_post).get(["source", "target", "weight"])
-    conns["senders"] = np.array(conns["source"]) - np.min(conns["source"])
-    conns["targets"] = np.array(conns["target"]) - np.min(conns["target"])
-
-    conns["weight_matrix"] = np.zeros((len(pop_post), len(pop_pre)))
-    conns["weight_matrix"][conns["targets"], conns["senders"]] = conns["weight"]
-    return conns
-
+# the optimized weights. The weight matrices are read out as sparse matrices, see `get_weights`.
 
 weights_pre_train = {
     "in_rec": get_weights(nrns_in, nrns_rec),
@@ -647,16 +635,47 @@ weights_pre_train = {
     "rec_out": get_weights(nrns_rec, nrns_out),
 }
 
+# %% ###########################################################################################################
+# Set up weight sampling
+# ~~~~~~~~~~~~~~~~~~~~~~
+# To track the time courses of the weights, we sample the weights of the connections among a few senders and
+# targets every few iterations. The weights of each connection type are read at once and stored in preallocated
+# arrays, so that, unlike the events of a weight recorder, the memory does not grow with the number of weight
+# updates.
+
+n_iter_sample_w_every = 1  # number of iterations between two weight samples
+n_samples_w = (n_iter_train + n_iter_test) // n_iter_sample_w_every + 2  # expected number of weight samples
+
+weight_samplers = {
+    "in_rec": WeightSampler(senders_in_rec, targets_in_rec, n_samples_w),
+    "rec_rec": WeightSampler(senders_rec_rec, targets_rec_rec, n_samples_w),
+    "rec_out": WeightSampler(senders_rec_out, targets_rec_out, n_samples_w),
+}
+
 # %% ###########################################################################################################
 # Simulate and evaluate
 # ~~~~~~~~~~~~~~~~~~~~~
 # We train the network by simulating for a number of training iterations with the set learning rate. If early
 # stopping is turned on, we evaluate the network's performance on the validation set in regular intervals and,
 # if the error is below a certain threshold, we stop the training early. If the error is not below the
-# threshold, we continue training until the end of the set number of iterations. Finally, we evaluate the
-# network's performance on the test set.
+# threshold, we continue training until the end of the set number of iterations. If validation is turned on,
+# the network is also validated once after the last training iteration, so that the latest validation error
+# reflects the fully trained network. Finally, we evaluate the network's performance on the test set.
 # Furthermore, we evaluate the network's training error by calculating a loss - in this case, the cross-entropy
 # error between the integrated recurrent network activity and the target rate.
+# To keep both NEST and Python busy, the input and output parameters of the next evaluation group of each data
+# loader are prepared by a background worker while the current iteration is simulated. Since each data loader
+# hands out its groups in the same order as without prefetching, the results are unchanged.
+# For the evaluation, only the readout samples recorded since the previous evaluation are retrieved from the
+# multimeter, which is cleared afterwards, so that the cost of an evaluation does not grow with the simulated time.
+# A checkpoint holds the plastic weights as sparse matrices, the optimizer parameters, the position of each data
+# loader, the results, and the number of simulated iterations. After resuming, the simulation time of the new NEST
+# kernel starts from zero at the checkpointed iteration, which is therefore subtracted when computing times. The
+# membrane potentials and traces of the neurons start from their initial values. The iteration preceding the
+# checkpoint is not evaluated, since its last readout samples are only recorded in the following iteration, so
+# the results of a resumed run lack one entry per resume. Weight updates that a synapse has not applied yet
+# because it has not transmitted a spike since are not included in a checkpoint and are lost when resuming.
+# Since the run that wrote a checkpoint already validated its weights, a resumed run does not validate them again.
 
 
 class TrainingPipeline:
@@ -668,28 +687,61 @@ class TrainingPipeline:
             "label": [],
         }
         self.n_iter_sim = 0
+        self.n_iter_offset = 0  # iteration at which the simulation time of the NEST kernel starts
         self.phase_label_previous = ""
         self.error = 0
         self.k_iter = 0
+        self.k_iter_resumed = None  # training iteration at which the training was resumed
         self.early_stop = False
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.prefetched = {}
+        self.loader_positions = {}  # position of each data loader before its prefetched group
+        self.events_mm_out_carry = None
+        self.events_mm_out_windows = []  # samples of the first and the latest evaluated window
 
-    def evaluate(self):
+    def prefetch(self, loader):
+        self.loader_positions[loader] = loader.current_index
+        self.prefetched[loader] = self.executor.submit(get_params_task_input_output, loader)
+
+    def fetch_params_task_input_output(self, loader):
+        if loader not in self.prefetched:
+            self.prefetch(loader)
+
+        params_task_input_output = self.prefetched[loader].result()
+        self.prefetch(loader)  # prepare the next group while the current one is simulated
+
+        return shift_params_task_input_output(params_task_input_output, self.n_iter_sim - self.n_iter_offset)
+
+    def read_mm_out(self):
         events_mm_out = mm_out.get("events")
+        mm_out.n_events = 0  # clear the multimeter so that each sample is retrieved only once
+
+        if self.events_mm_out_carry is not None:
+            events_mm_out = {k: np.concatenate([v, events_mm_out[k]]) for k, v in self.events_mm_out_carry.items()}
+
+        return events_mm_out
+
+    def evaluate(self):
+        events_mm_out = self.read_mm_out()
 
-        readout_signal = events_mm_out["readout_signal"]
-        target_signal = events_mm_out["target_signal"]
-        senders = events_mm_out["senders"]
         times = events_mm_out["times"]
+        n_iter_kernel = self.n_iter_sim - self.n_iter_offset
 
-        cond1 = times > (self.n_iter_sim - 1) * group_size * duration["sequence"] + duration["total_offset"]
-        cond2 = times <= self.n_iter_sim * group_size * duration["sequence"] + duration["total_offset"]
+        cond1 = times > (n_iter_kernel - 1) * group_size * duration["sequence"] + duration["total_offset"]
+        cond2 = times <= n_iter_kernel * group_size * duration["sequence"] + duration["total_offset"]
         idc = cond1 & cond2
 
-        readout_signal = np.array([readout_signal[idc][senders[idc] == i] for i in set(senders)])
-        target_signal = np.array([target_signal[idc][senders[idc] == i] for i in set(senders)])
+        # samples recorded after the end of the window belong to the next evaluation
+        self.events_mm_out_carry = {k: v[~cond2] for k, v in events_mm_out.items()}
 
-        readout_signal = readout_signal.reshape((n_out, 1, group_size, steps["sequence"]))
-        target_signal = target_signal.reshape((n_out, 1, group_size, steps["sequence"]))
+        events_mm_out = {k: v[idc] for k, v in events_mm_out.items()}
+        self.events_mm_out_windows = self.events_mm_out_windows[:1] + [events_mm_out]
+
+        # sort the samples by sender (stable, so in time order per sender) to reshape them without masking
+        order = np.argsort(events_mm_out["senders"], kind="stable")
+
+        readout_signal = events_mm_out["readout_signal"][order].reshape((n_out, 1, group_size, steps["sequence"]))
+        target_signal = events_mm_out["target_signal"][order].reshape((n_out, 1, group_size, steps["sequence"]))
 
         readout_signal = readout_signal[:, :, :, -steps["learning_window"] :]
         target_signal = target_signal[:, :, :, -steps["learning_window"] :]
@@ -712,8 +764,8 @@ class TrainingPipeline:
         params_common_syn_eprop["optimizer"]["eta"] = eta
         nest.SetDefaults("eprop_synapse", params_common_syn_eprop)
 
-        params_gen_spk_in, params_gen_rate_target, params_gen_learning_window = get_params_task_input_output(
-            self.n_iter_sim, loader
+        params_gen_spk_in, params_gen_rate_target, params_gen_learning_window = self.fetch_params_task_input_output(
+            loader
         )
         nest.SetStatus(gen_spk_in, params_gen_spk_in)
         nest.SetStatus(gen_rate_target, params_gen_rate_target)
@@ -722,7 +774,7 @@ class TrainingPipeline:
         self.simulate("total_offset")
         self.simulate("extension_sim")
 
-        if self.n_iter_sim > 0:
+        if self.n_iter_sim > self.n_iter_offset:
             self.evaluate()
 
         duration["sim"] = group_size * duration["sequence"] - duration["total_offset"] - duration["extension_sim"]
@@ -732,11 +784,18 @@ class TrainingPipeline:
         self.n_iter_sim += 1
         self.phase_label_previous = phase_label
 
+        if self.n_iter_sim % n_iter_sample_w_every == 0:
+            self.sample_weights()
+
     def run_training(self):
         self.run_phase("training", eta_train, data_loader_train)
 
     def run_validation(self):
-        if do_early_stopping and self.k_iter % n_iter_validate_every == 0:
+        # the weights of a checkpoint were already validated by the run that wrote it
+        if self.k_iter == self.k_iter_resumed:
+            return
+
+        if do_validation and (self.k_iter % n_iter_validate_every == 0 or self.k_iter == n_iter_train):
             self.run_phase("validation", eta_test, data_loader_test)
 
     def run_early_stopping(self):
@@ -756,37 +815,106 @@ class TrainingPipeline:
     def simulate(self, k):
         nest.Simulate(duration[k])
 
+    def sample_weights(self):
+        for weight_sampler in weight_samplers.values():
+            weight_sampler.sample()
+
+    def save_checkpoint(self):
+        data_loaders = {"train": data_loader_train, "test": data_loader_test}
+
+        checkpoint = {
+            "weights": {
+                "in_rec": get_weights(nrns_in, nrns_rec)["weight_matrix"],
+                "rec_rec": get_weights(nrns_rec, nrns_rec)["weight_matrix"],
+                "rec_out": get_weights(nrns_rec, nrns_out)["weight_matrix"],
+            },
+            "optimizer": params_common_syn_eprop["optimizer"].copy(),
+            "data_loaders": {
+                name: {"shuffled_indices": loader.shuffled_indices, "current_index": self.loader_positions[loader]}
+                for name, loader in data_loaders.items()
+            },
+            "results_dict": self.results_dict,
+            "n_iter_sim": self.n_iter_sim,
+            "k_iter": self.k_iter,
+            "phase_label_previous": self.phase_label_previous,
+            "error": self.error,
+            "early_stop": self.early_stop,
+        }
+
+        save_checkpoint(checkpoint_path, checkpoint)
+
+    def load_checkpoint(self, checkpoint):
+        data_loaders = {"train": data_loader_train, "test": data_loader_test}
+
+        for name, loader in data_loaders.items():
+            loader.shuffled_indices = checkpoint["data_loaders"][name]["shuffled_indices"]
+            loader.current_index = checkpoint["data_loaders"][name]["current_index"]
+
+        self.results_dict = checkpoint["results_dict"]
+        self.n_iter_sim = checkpoint["n_iter_sim"]
+        self.n_iter_offset = checkpoint["n_iter_sim"]
+        self.k_iter = checkpoint["k_iter"]
+        self.k_iter_resumed = checkpoint["k_iter"]
+        self.phase_label_previous = checkpoint["phase_label_previous"]
+        self.error = checkpoint["error"]
+        self.early_stop = checkpoint["early_stop"]
+
     def run(self):
+        self.sample_weights()
+
+        self.prefetch(data_loader_train)
+        self.prefetch(data_loader_test)
+
         while self.k_iter < n_iter_train and not self.early_stop:
             self.run_validation()
             self.run_early_stopping()
             self.run_training()
             self.k_iter += 1
 
+            if do_checkpointing and self.k_iter % n_iter_checkpoint_every == 0:
+                self.save_checkpoint()
+
+        if not self.early_stop:
+            self.run_validation()
+
         self.run_test()
+        self.executor.shutdown()
 
         self.simulate("total_offset")
         self.simulate("extension_sim")
 
         self.evaluate()
 
-        duration["task"] = self.n_iter_sim * group_size * duration["sequence"] + duration["total_offset"]
+        n_iter_kernel = self.n_iter_sim - self.n_iter_offset
+        duration["task"] = n_iter_kernel * group_size * duration["sequence"] + duration["total_offset"]
 
         gen_spk_final_update.set({"spike_times": [duration["task"] + duration["extension_sim"] + 1]})
 
         self.simulate("final_update")
 
+        self.sample_weights()
+
     def get_results(self):
         for k, v in self.results_dict.items():
             self.results_dict[k] = np.array(v)
         return self.results_dict
 
+    def get_events_mm_out(self):
+        return {k: np.concatenate([w[k] for w in self.events_mm_out_windows]) for k in self.events_mm_out_windows[0]}
+
 
 training_pipeline = TrainingPipeline()
+
+if checkpoint is not None:
+    training_pipeline.load_checkpoint(checkpoint)
+
 training_pipeline.run()
 
 results_dict = training_pipeline.get_results()
-n_iter_sim = training_pipeline.n_iter_sim
+n_iter_sim = training_pipeline.n_iter_sim - training_pipeline.n_iter_offset  # iterations simulated by this kernel
+
+if args.results_path is not None:
+    np.savez(args.results_path, **results_dict)
 
 # %% ###########################################################################################################
 # Read out post-training weights
@@ -799,16 +927,46 @@ weights_post_train = {
     "rec_out": get_weights(nrns_rec, nrns_out),
 }
 
+# %% ###########################################################################################################
+# Export trained network
+# ~~~~~~~~~~~~~~~~~~~~~~
+# The test phase above runs on the full e-prop machinery, which costs nearly as much as training. To evaluate the
+# trained network on many test samples, we export the trained weights together with the neuron models and the
+# timing of the task. The script :doc:`eprop_supervised_classification_neuromorphic_mnist_inference` rebuilds the
+# network from this file with static synapses only and evaluates it on the test set in parallel batches.
+
+do_export = not args.no_export  # if True, export the trained network for fast inference
+export_path = "./eprop_supervised_classification_neuromorphic_mnist_trained.pkl"  # path of exported network
+
+network_trained = {
+    "model_nrn_rec": model_nrn_rec,
+    "params_nrn_rec": params_nrn_rec,
+    "params_nrn_out": params_nrn_out,
+    "n_in": n_in,
+    "n_rec": n_rec,
+    "n_out": n_out,
+    "pixels_dict": pixels_dict,
+    "steps": steps,
+    "duration": duration,
+    "weights": {label: weights["weight_matrix"] for label, weights in weights_post_train.items()},
+}
+
+if do_export:
+    with open(export_path, "wb") as f:
+        pickle.dump(network_trained, f, protocol=pickle.HIGHEST_PROTOCOL)
+
 # %% ###########################################################################################################
 # Read out recorders
 # ~~~~~~~~~~~~~~~~~~
-# We can also retrieve the recorded history of the dynamic variables and weights, as well as detected spikes.
+# We can also retrieve the recorded history of the dynamic variables, as well as detected spikes.
+# The readout multimeter is an exception: during training, it is cleared every time its latest iteration has
+# been evaluated, so that its memory does not grow with the number of iterations. The training pipeline keeps the
+# samples of the first and the last evaluated iteration for plotting.
 
 events_mm_rec = mm_rec.get("events")
-events_mm_out = mm_out.get("events")
+events_mm_out = training_pipeline.get_events_mm_out()
 events_sr_in = sr_in.get("events")
 events_sr_rec = sr_rec.get("events")
-events_wr = wr.get("events")
 
 
 # %% ###########################################################################################################
@@ -816,7 +974,7 @@ events_wr = wr.get("events")
 # ~~~~~~~~~~~~
 # Then, we plot a series of plots.
 
-do_plotting = True  # if True, plot the results
+do_plotting = not args.no_plotting  # if True, plot the results
 
 if not do_plotting:
     exit()
@@ -918,47 +1076,25 @@ for title, xlims in zip(
 # %% ###########################################################################################################
 # Plot weight time courses
 # ........................
-# Similarly, we can plot the weight histories. Note that the weight recorder, attached to the synapses, works
-# differently than the other recorders. Since synapses only get activated when they transmit a spike, the weight
-# recorder only records the weight in those moments. That is why the first weight registrations do not start in
-# the first time step and we add the initial weights manually.
-
-
-def plot_weight_time_course(ax, events, nrns, label, ylabel):
-    sender_label, target_label = label.split("_")
-    nrns_senders = nrns[sender_label]
-    nrns_targets = nrns[target_label]
-
-    for sender in set(events_wr["senders"]):
-        for target in set(events_wr["targets"]):
-            if sender in nrns_senders and target in nrns_targets:
-                idc_syn = (events["senders"] == sender) & (events["targets"] == target)
-                if np.any(idc_syn):
-                    idc_syn_pre = (weights_pre_train[label]["source"] == sender) & (
-                        weights_pre_train[label]["target"] == target
-                    )
-                    times = np.concatenate([[0.0], events["times"][idc_syn]])
-
-                    weights = np.concatenate(
-                        [np.array(weights_pre_train[label]["weight"])[idc_syn_pre], events["weights"][idc_syn]]
-                    )
-                    ax.step(times, weights, c=colors["blue"])
-        ax.set_ylabel(ylabel)
-        ax.set_ylim(-0.6, 0.6)
+# Similarly, we can plot the weight histories. The weight samplers return the sampled weights directly as a
+# matrix of shape (number of samples, number of connections), in which each column is the time course of one
+# synapse. Since synapses only apply their weight updates when they transmit a spike, each sample holds the weight
+# after the last update before the sampling time.
+
+
+def plot_weight_time_course(ax, weight_sampler, ylabel):
+    times, weights = weight_sampler.get_samples()
+    ax.step(times, weights, c=colors["blue"])
+    ax.set_ylabel(ylabel)
+    ax.set_ylim(-0.6, 0.6)
 
 
 fig, axs = plt.subplots(3, 1, sharex=True, figsize=(3, 4))
 fig.suptitle("Weight time courses")
 
-nrns = {
-    "in": nrns_in.tolist(),
-    "rec": nrns_rec.tolist(),
-    "out": nrns_out.tolist(),
-}
-
-plot_weight_time_course(axs[0], events_wr, nrns, "in_rec", r"$W_\text{in}$ (pA)")
-plot_weight_time_course(axs[1], events_wr, nrns, "rec_rec", r"$W_\text{rec}$ (pA)")
-plot_weight_time_course(axs[2], events_wr, nrns, "rec_out", r"$W_\text{out}$ (pA)")
+plot_weight_time_course(axs[0], weight_samplers["in_rec"], r"$W_\text{in}$ (pA)")
+plot_weight_time_course(axs[1], weight_samplers["rec_rec"], r"$W_\text{rec}$ (pA)")
+plot_weight_time_course(axs[2], weight_samplers["rec_out"], r"$W_\text{out}$ (pA)")
 
 axs[-1].set_xlabel(r"$t$ (ms)")
 axs[-1].set_xlim(0, duration["task"])
@@ -970,8 +1106,8 @@ fig.tight_layout()
 # Plot weight matrices
 # ....................
 # If one is not interested in the time course of the weights, it is possible to read out only the initial and
-# final weights, which requires less computing time and memory than the weight recorder approach. Here, we plot
-# the corresponding weight matrices before and after the optimization.
+# final weights, which requires less computing time and memory than sampling the weights during the training.
+# Here, we plot the corresponding weight matrices before and after the optimization.
 
 cmap = mpl.colors.LinearSegmentedColormap.from_list(
     "cmap", ((0.0, colors["blue"]), (0.5, colors["white"]), (1.0, colors["red"]))
@@ -990,9 +1126,9 @@ for k in weights_pre_train.keys():
 args = {"cmap": cmap, "vmin": np.min(all_w_extrema), "vmax": np.max(all_w_extrema)}
 
 for i, weights in zip([0, 1], [weights_pre_train, weights_post_train]):
-    axs[0, i].pcolormesh(weights["in_rec"]["weight_matrix"].T, **args)
-    axs[1, i].pcolormesh(weights["rec_rec"]["weight_matrix"], **args)
-    cmesh = axs[2, i].pcolormesh(weights["rec_out"]["weight_matrix"], **args)
+    axs[0, i].pcolormesh(weights["in_rec"]["weight_matrix"].toarray().T, **args)
+    axs[1, i].pcolormesh(weights["rec_rec"]["weight_matrix"].toarray(), **args)
+    cmesh = axs[2, i].pcolormesh(weights["rec_out"]["weight_matrix"].toarray(), **args)
 
     axs[2, i].set_xlabel("recurrent\nneurons")
 
@@ -0,0 +1,235 @@
+# -*- coding: utf-8 -*-
+#
+# eprop_supervised_classification_neuromorphic_mnist_inference.py
+#
+# This file is part of NEST.
+#
+# Copyright (C) 2004 The NEST Initiative
+#
+# NEST is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# NEST is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NEST.  If not, see <http://www.gnu.org/licenses/>.
+
+r"""Fast inference with a trained N-MNIST e-prop network
+----------------------------------------------------------------
+
+This script evaluates a network trained with
+:doc:`eprop_supervised_classification_neuromorphic_mnist` on the N-MNIST
+test set.
+
+In the test phase of the training script, the network still runs on
+``eprop_synapse`` connections with a learning rate of zero, together with
+the learning signal feedback, the target and learning window generators,
+and the recorders. Here, the network is rebuilt from the trained weights
+exported by the training script with static synapses only. The input spike
+generators are connected directly to the recurrent neurons with the summed
+delay of the connections via the parrot neurons.
+
+The recurrent and readout neurons keep their e-prop models, by default
+``eprop_iaf`` and ``eprop_readout``, and their parameters, so that their
+dynamics are the same as in the test phase. Plain neuron models are not
+equivalent: after a spike, ``eprop_iaf`` subtracts the threshold from the
+membrane voltage, whereas ``iaf_psc_delta`` resets it to a fixed value, so
+the trained weights would yield different spike trains. Without incoming
+``eprop_synapse`` connections and learning signal connections, the e-prop
+neurons only differ from plain ones by the surrogate gradient and the
+firing rate regularization, which they still compute in every time step;
+this overhead is small compared with the delivery of the spikes.
+
+The test samples are simulated back to back in batches, and every batch is
+simulated in a fresh NEST kernel in a worker process, so that several
+batches run in parallel. All workers read the same preprocessed, memory-mapped
+copy of the test set (see :doc:`helpers_eprop`). From the readout signals in
+the learning window of each sample, the loss and the classification error are
+computed as in ``TrainingPipeline.evaluate`` of the training script.
+
+See Also
+~~~~~~~~
+
+:doc:`eprop_supervised_classification_neuromorphic_mnist`
+
+:doc:`Helper functions <helpers_eprop>`
+"""
+import argparse
+import logging
+import multiprocessing
+import os
+import pickle
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from helpers_eprop import connect_sparse, download_and_extract_nmnist_dataset, get_params_gen_spk, load_nmnist_dataset
+
+
+def simulate_batch(network, test_path, sample_indices, n_threads):
+    """Simulates the samples of one batch with static synapses and returns the
+    readout signals in the learning windows.
+
+    Parameters
+    ----------
+    network : dict
+        trained network as exported by the training script
+    test_path : str
+        directory of the N-MNIST test set
+    sample_indices : np.array
+        indices of the test samples in the batch, simulated in this order
+    n_threads : int
+        number of NEST threads used by the worker process
+
+    Returns
+    -------
+    np.array
+        readout signals of shape (n_out, number of samples, steps of the learning window)
+    """
+    # NEST is imported in the worker so that every process has its own kernel
+    import nest
+
+    steps = network["steps"]
+    duration = network["duration"]
+    n_in, n_rec, n_out = network["n_in"], network["n_rec"], network["n_out"]
+    n_samples = len(sample_indices)
+
+    dataset = load_nmnist_dataset(test_path, network["pixels_dict"], duration["sequence"])
+
+    nest.ResetKernel()
+    nest.set(resolution=duration["step"], local_num_threads=n_threads, print_time=False)
+    nest.set_verbosity("M_FATAL")
+
+    gen_spk_in = nest.Create("spike_generator", n_in)
+    nrns_rec = nest.Create(network["model_nrn_rec"], n_rec, network["params_nrn_rec"])
+    nrns_out = nest.Create("eprop_readout", n_out, network["params_nrn_out"])
+
+    mm_out = nest.Create(
+        "multimeter",
+        {"interval": duration["step"], "record_from": ["readout_signal"], "start": duration["total_offset"]},
+    )
+
+    # the parrot neurons of the training network add one delay between the generators and the recurrent neurons
+    delays = {
+        "in_rec": duration["step"] + duration["delay_in_rec"],
+        "rec_rec": duration["step"],
+        "rec_out": duration["step"],
+    }
+
+    for label, nrns_pre, nrns_post in [
+        ("in_rec", gen_spk_in, nrns_rec),
+        ("rec_rec", nrns_rec, nrns_rec),
+        ("rec_out", nrns_rec, nrns_out),
+    ]:
+        params_syn = {"synapse_model": "static_synapse", "delay": delays[label]}
+        connect_sparse(network["weights"][label], params_syn, nrns_pre, nrns_post)
+
+    nest.Connect(mm_out, nrns_out)
+
+    starts = dataset["offsets"][sample_indices]
+    ends = dataset["offsets"][sample_indices + 1]
+    channels = np.concatenate([dataset["channels"][s:e] for s, e in zip(starts, ends)])
+    relative_times = np.concatenate([dataset["times"][s:e] for s, e in zip(starts, ends)])
+
+    sequence_starts = np.arange(n_samples) * duration["sequence"]
+    spike_times = np.repeat(sequence_starts, ends - starts) + relative_times + duration["offset_gen"]
+
+    nest.SetStatus(gen_spk_in, get_params_gen_spk(channels, spike_times, n_in))
+
+    nest.Simulate(n_samples * duration["sequence"] + duration["total_offset"] + duration["extension_sim"])
+
+    events_mm_out = mm_out.get("events")
+    idc = events_mm_out["times"] <= n_samples * duration["sequence"] + duration["total_offset"]
+    order = np.argsort(events_mm_out["senders"][idc], kind="stable")
+
+    readout_signal = events_mm_out["readout_signal"][idc][order].reshape((n_out, n_samples, steps["sequence"]))
+    return readout_signal[:, :, -steps["learning_window"] :]
+
+
+def compute_loss_and_error(readout_signal, labels):
+    """Computes the mean squared error loss and the classification error of
+    the readout signals in the learning windows as in the training script.
+
+    Parameters
+    ----------
+    readout_signal : np.array
+        readout signals of shape (n_out, number of samples, steps of the learning window)
+    labels : np.array
+        labels of the samples
+
+    Returns
+    -------
+    float
+        loss averaged over the readout neurons and samples
+    float
+        fraction of misclassified samples
+    """
+    target_signal = np.zeros_like(readout_signal)
+    target_signal[labels, np.arange(len(labels)), :] = 1.0
+
+    loss = 0.5 * np.mean(np.sum((readout_signal - target_signal) ** 2, axis=2))
+
+    y_prediction = np.argmax(np.mean(readout_signal, axis=2), axis=0)
+    error = np.mean(y_prediction != labels)
+
+    return loss, error
+
+
+def run_inference(network, test_path, sample_indices, batch_size, n_processes, n_threads):
+    """Evaluates the trained network on the given test samples in parallel
+    batches and returns the readout signals of all samples in sample order.
+    """
+    batches = [sample_indices[i : i + batch_size] for i in range(0, len(sample_indices), batch_size)]
+    logging.info(f"evaluating {len(sample_indices)} samples in {len(batches)} batches in {n_processes} processes...")
+
+    # Worker processes are spawned rather than forked so that they do not
+    # inherit any state of an already initialized NEST kernel.
+    context = multiprocessing.get_context("spawn")
+
+    with ProcessPoolExecutor(n_processes, mp_context=context) as executor:
+        futures = [executor.submit(simulate_batch, network, test_path, batch, n_threads) for batch in batches]
+
+        readout_signals = []
+        for n_done, future in enumerate(futures, start=1):
+            readout_signals.append(future.result())
+            logging.info(f"[{n_done}/{len(batches)}] batches done")
+
+    return np.concatenate(readout_signals, axis=1)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--network",
+        type=str,
+        default="./eprop_supervised_classification_neuromorphic_mnist_trained.pkl",
+        help="Trained network exported by the training script.",
+    )
+    parser.add_argument("--save_path", type=str, default="./", help="Directory of the N-MNIST dataset.")
+    parser.add_argument("--n_samples", type=int, default=None, help="Number of test samples, all by default.")
+    parser.add_argument("--seed", type=int, default=1, help="Seed for selecting and ordering the test samples.")
+    parser.add_argument("--batch_size", type=int, default=500, help="Number of samples simulated per kernel.")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="Number of worker processes.")
+    parser.add_argument("--threads", type=int, default=1, help="NEST threads per worker process.")
+
+    args, unknown = parser.parse_known_args()
+    logging.basicConfig(level=logging.INFO)
+
+    with open(args.network, "rb") as f:
+        network = pickle.load(f)
+
+    _, test_path = download_and_extract_nmnist_dataset(args.save_path)
+
+    # preprocess the test set once before the workers memory-map it
+    dataset_test = load_nmnist_dataset(test_path, network["pixels_dict"], network["duration"]["sequence"])
+
+    sample_indices = np.random.default_rng(args.seed).permutation(len(dataset_test["labels"]))[: args.n_samples]
+
+    readout_signal = run_inference(network, test_path, sample_indices, args.batch_size, args.processes, args.threads)
+    loss, error = compute_loss_and_error(readout_signal, dataset_test["labels"][sample_indices])
+
+    print(f"test samples: {len(sample_indices)}, loss: {loss:.4f}, error: {error:.4f}")
@@ -79,6 +79,7 @@ import matplotlib.pyplot as plt
 import nest
 import numpy as np
 from cycler import cycler
+from helpers_eprop import WeightSampler, get_params_gen_spk, get_weights, simulate_and_sample_weights
 from IPython.display import Image
 
 # %% ###########################################################################################################
@@ -255,14 +256,6 @@ params_mm_out = {
     "label": "multimeter_out",
 }
 
-params_wr = {
-    "senders": nrns_in[:n_record_w] + nrns_rec[:n_record_w],  # limit senders to subsample weights to record
-    "targets": nrns_rec[:n_record_w] + nrns_out,  # limit targets to subsample weights to record from
-    "start": duration["total_offset"],
-    "stop": duration["total_offset"] + duration["task"],
-    "label": "weight_recorder",
-}
-
 params_sr_in = {
     "start": duration["offset_gen"],
     "stop": duration["total_offset"] + duration["task"],
@@ -281,7 +274,6 @@ mm_rec = nest.Create("multimeter", params_mm_rec)
 mm_out = nest.Create("multimeter", params_mm_out)
 sr_in = nest.Create("spike_recorder", params_sr_in)
 sr_rec = nest.Create("spike_recorder", params_sr_rec)
-wr = nest.Create("weight_recorder", params_wr)
 
 nrns_rec_record = nrns_rec[:n_record]
 
@@ -319,7 +311,6 @@ params_common_syn_eprop = {
         "Wmin": -100.0,  # pA, minimal limit of the synaptic weights
         "Wmax": 100.0,  # pA, maximal limit of the synaptic weights
     },
-    "weight_recorder": wr,
 }
 
 params_syn_base = {
@@ -390,11 +381,13 @@ dtype_in_spks = np.float32  # data type of input spikes - for reproducing TF res
 input_spike_bools = (np.random.rand(steps["sequence"], n_in) < input_spike_prob).swapaxes(0, 1)
 
 sequence_starts = np.arange(0.0, duration["task"], duration["sequence"]) + duration["offset_gen"]
-params_gen_spk_in = []
-for input_spike_bool in input_spike_bools:
-    input_spike_times = np.arange(0.0, duration["sequence"], duration["step"])[input_spike_bool]
-    input_spike_times_all = [input_spike_times + start for start in sequence_starts]
-    params_gen_spk_in.append({"spike_times": np.hstack(input_spike_times_all).astype(dtype_in_spks)})
+
+# all spikes of the frozen noise as (input channel, time) events, repeated for every sequence
+channels, input_spike_steps = np.nonzero(input_spike_bools)
+input_spike_times = np.arange(0.0, duration["sequence"], duration["step"])[input_spike_steps]
+input_spike_times_all = np.add.outer(sequence_starts, input_spike_times).astype(dtype_in_spks)
+
+params_gen_spk_in = get_params_gen_spk(np.tile(channels, len(sequence_starts)), input_spike_times_all.flatten(), n_in)
 
 ####################
 
@@ -471,30 +464,37 @@ nest.Connect(gen_spk_final_update, nrns_in + nrns_rec, "all_to_all", {"weight":
 # Before we begin training, we read out the initial weight matrices so that we can eventually compare them to
 # the optimized weights.
 
-
-def get_weights(pop_pre, pop_post):
-    conns = nest.GetConnections(pop_pre, pop_post).get(["source", "target", "weight"])
-    conns["senders"] = np.array(conns["source"]) - np.min(conns["source"])
-    conns["targets"] = np.array(conns["target"]) - np.min(conns["target"])
-
-    conns["weight_matrix"] = np.zeros((len(pop_post), len(pop_pre)))
-    conns["weight_matrix"][conns["targets"], conns["senders"]] = conns["weight"]
-    return conns
-
-
 weights_pre_train = {
     "in_rec": get_weights(nrns_in, nrns_rec),
     "rec_rec": get_weights(nrns_rec, nrns_rec),
     "rec_out": get_weights(nrns_rec, nrns_out),
 }
 
+# %% ###########################################################################################################
+# Set up weight sampling
+# ~~~~~~~~~~~~~~~~~~~~~~
+# To track the time courses of the weights, we sample the weights of the connections among the first senders and
+# targets every few iterations. The weights of each connection type are read at once and stored in preallocated
+# arrays, so that, unlike the events of a weight recorder, the memory does not grow with the number of weight
+# updates.
+
+n_iter_sample_w_every = 1  # number of iterations between two weight samples
+duration["sample_w"] = n_iter_sample_w_every * duration["task"] / n_iter  # ms, interval between two samples
+n_samples_w = int(np.ceil(duration["sim"] / duration["sample_w"])) + 1  # number of weight samples
+
+weight_samplers = {
+    "in_rec": WeightSampler(nrns_in[:n_record_w], nrns_rec[:n_record_w], n_samples_w),
+    "rec_rec": WeightSampler(nrns_rec[:n_record_w], nrns_rec[:n_record_w], n_samples_w),
+    "rec_out": WeightSampler(nrns_rec[:n_record_w], nrns_out, n_samples_w),
+}
+
 # %% ###########################################################################################################
 # Simulate
 # ~~~~~~~~
 # We train the network by simulating for a set simulation time, determined by the number of iterations and the
-# batch size and the length of one sequence.
+# batch size and the length of one sequence. In between, the weights are sampled in regular intervals.
 
-nest.Simulate(duration["sim"])
+simulate_and_sample_weights(duration["sim"], duration["sample_w"], weight_samplers)
 
 # %% ###########################################################################################################
 # Read out post-training weights
@@ -510,13 +510,12 @@ weights_post_train = {
 # %% ###########################################################################################################
 # Read out recorders
 # ~~~~~~~~~~~~~~~~~~
-# We can also retrieve the recorded history of the dynamic variables and weights, as well as detected spikes.
+# We can also retrieve the recorded history of the dynamic variables, as well as detected spikes.
 
 events_mm_rec = mm_rec.get("events")
 events_mm_out = mm_out.get("events")
 events_sr_in = sr_in.get("events")
 events_sr_rec = sr_rec.get("events")
-events_wr = wr.get("events")
 
 # %% ###########################################################################################################
 # Evaluate training error
@@ -632,47 +631,25 @@ for title, xlims in zip(
 # %% ###########################################################################################################
 # Plot weight time courses
 # ........................
-# Similarly, we can plot the weight histories. Note that the weight recorder, attached to the synapses, works
-# differently than the other recorders. Since synapses only get activated when they transmit a spike, the weight
-# recorder only records the weight in those moments. That is why the first weight registrations do not start in
-# the first time step and we add the initial weights manually.
-
-
-def plot_weight_time_course(ax, events, nrns, label, ylabel):
-    sender_label, target_label = label.split("_")
-    nrns_senders = nrns[sender_label]
-    nrns_targets = nrns[target_label]
-
-    for sender in set(events_wr["senders"]):
-        for target in set(events_wr["targets"]):
-            if sender in nrns_senders and target in nrns_targets:
-                idc_syn = (events["senders"] == sender) & (events["targets"] == target)
-                if np.any(idc_syn):
-                    idc_syn_pre = (weights_pre_train[label]["source"] == sender) & (
-                        weights_pre_train[label]["target"] == target
-                    )
-                    times = np.concatenate([[0.0], events["times"][idc_syn]])
-
-                    weights = np.concatenate(
-                        [np.array(weights_pre_train[label]["weight"])[idc_syn_pre], events["weights"][idc_syn]]
-                    )
-                    ax.step(times, weights, c=colors["blue"])
-        ax.set_ylabel(ylabel)
-        ax.set_ylim(-0.6, 0.6)
+# Similarly, we can plot the weight histories. The weight samplers return the sampled weights directly as a
+# matrix of shape (number of samples, number of connections), in which each column is the time course of one
+# synapse. Since synapses only apply their weight updates when they transmit a spike, each sample holds the weight
+# after the last update before the sampling time.
+
+
+def plot_weight_time_course(ax, weight_sampler, ylabel):
+    times, weights = weight_sampler.get_samples()
+    ax.step(times, weights, c=colors["blue"])
+    ax.set_ylabel(ylabel)
+    ax.set_ylim(-0.6, 0.6)
 
 
 fig, axs = plt.subplots(3, 1, sharex=True, figsize=(3, 4))
 fig.suptitle("Weight time courses")
 
-nrns = {
-    "in": nrns_in.tolist(),
-    "rec": nrns_rec.tolist(),
-    "out": nrns_out.tolist(),
-}
-
-plot_weight_time_course(axs[0], events_wr, nrns, "in_rec", r"$W_\text{in}$ (pA)")
-plot_weight_time_course(axs[1], events_wr, nrns, "rec_rec", r"$W_\text{rec}$ (pA)")
-plot_weight_time_course(axs[2], events_wr, nrns, "rec_out", r"$W_\text{out}$ (pA)")
+plot_weight_time_course(axs[0], weight_samplers["in_rec"], r"$W_\text{in}$ (pA)")
+plot_weight_time_course(axs[1], weight_samplers["rec_rec"], r"$W_\text{rec}$ (pA)")
+plot_weight_time_course(axs[2], weight_samplers["rec_out"], r"$W_\text{out}$ (pA)")
 
 axs[-1].set_xlabel(r"$t$ (ms)")
 axs[-1].set_xlim(0, duration["task"])
@@ -684,8 +661,8 @@ fig.tight_layout()
 # Plot weight matrices
 # ....................
 # If one is not interested in the time course of the weights, it is possible to read out only the initial and
-# final weights, which requires less computing time and memory than the weight recorder approach. Here, we plot
-# the corresponding weight matrices before and after the optimization.
+# final weights, which requires less computing time and memory than sampling the weights during the training.
+# Here, we plot the corresponding weight matrices before and after the optimization.
 
 cmap = mpl.colors.LinearSegmentedColormap.from_list(
     "cmap", ((0.0, colors["blue"]), (0.5, colors["white"]), (1.0, colors["red"]))
@@ -704,9 +681,9 @@ for k in weights_pre_train.keys():
 args = {"cmap": cmap, "vmin": np.min(all_w_extrema), "vmax": np.max(all_w_extrema)}
 
 for i, weights in zip([0, 1], [weights_pre_train, weights_post_train]):
-    axs[0, i].pcolormesh(weights["in_rec"]["weight_matrix"].T, **args)
-    axs[1, i].pcolormesh(weights["rec_rec"]["weight_matrix"], **args)
-    cmesh = axs[2, i].pcolormesh(weights["rec_out"]["weight_matrix"], **args)
+    axs[0, i].pcolormesh(weights["in_rec"]["weight_matrix"].toarray().T, **args)
+    axs[1, i].pcolormesh(weights["rec_rec"]["weight_matrix"].toarray(), **args)
+    cmesh = axs[2, i].pcolormesh(weights["rec_out"]["weight_matrix"].toarray(), **args)
 
     axs[2, i].set_xlabel("recurrent\nneurons")
 
@@ -0,0 +1,448 @@
+# -*- coding: utf-8 -*-
+#
+# helpers_eprop.py
+#
+# This file is part of NEST.
+#
+# Copyright (C) 2004 The NEST Initiative
+#
+# NEST is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# NEST is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NEST.  If not, see <http://www.gnu.org/licenses/>.
+
+r"""Helper functions for the e-prop tutorials
+----------------------------------------------------------------
+
+Functions shared by the e-prop tutorials for downloading and preprocessing the N-MNIST dataset, for building
+the parameters of the input spike generators, and for creating and reading out sparse connectivity.
+
+The N-MNIST dataset is decoded only once: all events of a split that fall on active (not blocklisted) pixels are
+stored as compact arrays of input channels (``uint16``) and spike times (``uint32``), together with an index of
+per-sample offsets and the sample labels. The event arrays are memory-mapped when loaded, so that samples can be
+served as zero-copy slices and several processes can share one read-only copy of the dataset.
+
+Sparse connectivity is exchanged as SciPy sparse matrices of shape (number of postsynaptic neurons, number of
+presynaptic neurons). Connections are created from the index arrays of such a matrix and read back into one
+without building a dense weight matrix.
+
+Training runs can be checkpointed with save_checkpoint() and resumed from load_checkpoint(); so far, only the
+N-MNIST tutorial implements checkpointing. The weights of selected connections can be sampled during the training
+with a WeightSampler, which stores them as a matrix of shape (number of samples, number of connections).
+"""
+
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import zipfile
+
+import nest
+import numpy as np
+import requests
+from scipy import sparse
+
+nmnist_time_max = 336040  # in microseconds, longest recording over training and test set
+nmnist_duration_sequence = 300.0  # in ms, duration of a sequence to which the recordings are mapped
+
+
+def unzip(zip_file_path, extraction_path):
+    print(f"Extracting {zip_file_path}.")
+    with zipfile.ZipFile(zip_file_path, "r") as zip_file:
+        zip_file.extractall(extraction_path)
+    os.remove(zip_file_path)
+
+
+def download_and_extract_nmnist_dataset(save_path="./"):
+    nmnist_dataset = {
+        "url": "https://prod-dcd-datasets-cache-zipfiles.s3.eu-west-1.amazonaws.com/468j46mzdv-1.zip",
+        "directory": "468j46mzdv-1",
+        "zip": "dataset.zip",
+    }
+
+    path = os.path.join(save_path, nmnist_dataset["directory"])
+
+    train_path = os.path.join(path, "Train")
+    test_path = os.path.join(path, "Test")
+
+    downloaded_zip_path = os.path.join(save_path, nmnist_dataset["zip"])
+
+    if not (os.path.exists(path) and os.path.exists(train_path) and os.path.exists(test_path)):
+        if not os.path.exists(downloaded_zip_path):
+            print("\nDownloading the N-MNIST dataset.")
+            response = requests.get(nmnist_dataset["url"], timeout=10)
+            with open(downloaded_zip_path, "wb") as file:
+                file.write(response.content)
+
+        unzip(downloaded_zip_path, save_path)
+        unzip(f"{train_path}.zip", path)
+        unzip(f"{test_path}.zip", path)
+
+    return train_path, test_path
+
+
+def get_nmnist_pixels_dict(pixels_blocklist):
+    """Returns the pixel grid of the N-MNIST recordings, 34x34 pixels times two polarities, together with the
+    pixels that are not on the blocklist and are thus active."""
+    pixels_dict = {
+        "n_x": 34,  # number of pixels in horizontal direction
+        "n_y": 34,  # number of pixels in vertical direction
+        "n_polarity": 2,  # number of pixels in the dimension coding for polarity
+    }
+
+    pixels_dict["n_total"] = pixels_dict["n_x"] * pixels_dict["n_y"] * pixels_dict["n_polarity"]  # total number
+    pixels_dict["active"] = sorted(set(range(pixels_dict["n_total"])) - set(pixels_blocklist))  # active pixels
+    pixels_dict["n_active"] = len(pixels_dict["active"])  # number of active pixels
+    return pixels_dict
+
+
+def get_channel_of_pixel(pixels_dict):
+    """Returns a lookup array mapping every pixel index to the index of its input channel, that is, its position
+    in the list of active pixels, or to -1 for blocklisted pixels."""
+    channel_of_pixel = np.full(pixels_dict["n_total"], -1, dtype=np.int64)
+    channel_of_pixel[np.asarray(pixels_dict["active"], dtype=np.int64)] = np.arange(pixels_dict["n_active"])
+    return channel_of_pixel
+
+
+def decode_nmnist_sample(file_path, channel_of_pixel, pixels_dict, duration_sequence):
+    """Decodes the 40-bit events of a single N-MNIST sample.
+
+    Parameters
+    ----------
+    file_path : str
+        path of the binary sample file
+    channel_of_pixel : np.array
+        lookup array from pixel index to input channel, see get_channel_of_pixel()
+    pixels_dict : dict
+        pixel grid dimensions ``n_x``, ``n_y`` and ``n_total``
+    duration_sequence : float
+        duration of a sequence in ms to which the recording is mapped
+
+    Returns
+    -------
+    np.array
+        input channels of the events on active pixels, sorted by channel (``uint16``)
+    np.array
+        spike times of these events in ms, rounded to integers; events of the same channel keep their recording
+        order (``uint32``)
+    """
+    byte_array = np.fromfile(file_path, dtype=np.uint8)
+    n_byte_columns = 5
+    events = byte_array[: len(byte_array) // n_byte_columns * n_byte_columns].reshape(-1, n_byte_columns)
+    events = events.astype(np.uint32)
+
+    x_coords = events[:, 0]  # in pixels
+    y_coords = events[:, 1]  # in pixels
+    polarities = events[:, 2] >> 7  # 0 for OFF, 1 for ON
+    mask_22_bit = 0x7FFFFF  # mask to keep only lower 22 bits
+    times = (events[:, 2] << 16 | events[:, 3] << 8 | events[:, 4]) & mask_22_bit  # in microseconds
+    times = np.around(times * duration_sequence / nmnist_time_max)  # map sample to sequence length
+
+    on_grid = (x_coords < pixels_dict["n_x"]) & (y_coords < pixels_dict["n_y"])
+    pixels = polarities * pixels_dict["n_x"] * pixels_dict["n_y"] + y_coords * pixels_dict["n_x"] + x_coords
+    channels = np.full(len(pixels), -1, dtype=np.int64)
+    channels[on_grid] = channel_of_pixel[pixels[on_grid]]
+
+    active = channels >= 0
+    channels = channels[active]
+    times = times[active]
+
+    order = np.argsort(channels, kind="stable")
+    return channels[order].astype(np.uint16), times[order].astype(np.uint32)
+
+
+def get_nmnist_cache_path(path, pixels_dict, duration_sequence, cache_root=None):
+    """Returns the directory in which the preprocessed version of a dataset split is stored. The directory name
+    contains a hash of the active pixels and the sequence duration, so that changing either creates a new cache."""
+    key = hashlib.sha1(np.asarray(pixels_dict["active"], dtype=np.int64).tobytes())
+    key.update(repr(float(duration_sequence)).encode())
+
+    path = os.path.normpath(path)
+    if cache_root is None:
+        cache_root = os.path.join(os.path.dirname(path), "cache")
+
+    return os.path.join(cache_root, f"{os.path.basename(path)}_{key.hexdigest()[:12]}")
+
+
+def preprocess_nmnist_dataset(path, cache_path, pixels_dict, duration_sequence, labels=None):
+    """Decodes all samples of a dataset split once and stores them as memory-mappable arrays.
+
+    The events are appended to the files ``channels.bin`` (``uint16``) and ``times.bin`` (``uint32``) sample by
+    sample, so that the memory required does not depend on the size of the dataset. The events of sample ``i``
+    are found between ``offsets[i]`` and ``offsets[i + 1]``. The cache is written to a temporary directory first
+    and only moved to ``cache_path`` when complete.
+
+    Parameters
+    ----------
+    path : str
+        directory of the dataset split with one subdirectory per label
+    cache_path : str
+        directory to store the preprocessed dataset in
+    pixels_dict : dict
+        pixel grid dimensions and active pixels
+    duration_sequence : float
+        duration of a sequence in ms to which the recordings are mapped
+    labels : iterable
+        labels to preprocess, by default all label subdirectories; samples are stored in order of the labels and,
+        within a label, of the file names
+    """
+    if labels is None:
+        labels = sorted(int(label) for label in os.listdir(path) if label.isdigit())
+
+    channel_of_pixel = get_channel_of_pixel(pixels_dict)
+
+    tmp_path = f"{cache_path}.tmp{os.getpid()}"
+    os.makedirs(tmp_path, exist_ok=True)
+
+    offsets = [0]
+    sample_labels = []
+
+    print(f"Preprocessing {path}.")
+    with open(os.path.join(tmp_path, "channels.bin"), "wb") as f_channels, open(
+        os.path.join(tmp_path, "times.bin"), "wb"
+    ) as f_times:
+        for label in labels:
+            label_dir_path = os.path.join(path, str(label))
+            for sample in sorted(os.listdir(label_dir_path)):
+                channels, times = decode_nmnist_sample(
+                    os.path.join(label_dir_path, sample), channel_of_pixel, pixels_dict, duration_sequence
+                )
+                f_channels.write(channels.tobytes())
+                f_times.write(times.tobytes())
+                offsets.append(offsets[-1] + len(channels))
+                sample_labels.append(label)
+
+    np.save(os.path.join(tmp_path, "offsets.npy"), np.array(offsets, dtype=np.int64))
+    np.save(os.path.join(tmp_path, "labels.npy"), np.array(sample_labels, dtype=np.uint8))
+    with open(os.path.join(tmp_path, "meta.json"), "w") as f:
+        json.dump({"source": os.path.abspath(path), "duration_sequence": duration_sequence}, f)
+
+    try:
+        os.rename(tmp_path, cache_path)
+    except OSError:
+        # another process finished the same cache in the meantime
+        shutil.rmtree(tmp_path)
+
+
+def load_nmnist_dataset(path, pixels_dict, duration_sequence, cache_root=None):
+    """Returns the preprocessed N-MNIST dataset split, preprocessing it first if no cache exists yet.
+
+    Parameters
+    ----------
+    path : str
+        directory of the dataset split with one subdirectory per label
+    pixels_dict : dict
+        pixel grid dimensions and active pixels
+    duration_sequence : float
+        duration of a sequence in ms to which the recordings are mapped
+    cache_root : str
+        directory containing the caches, by default a directory ``cache`` next to the split
+
+    Returns
+    -------
+    dict
+        read-only memory-mapped ``channels`` and ``times`` of all events, the per-sample ``offsets`` and the
+        sample ``labels``
+    """
+    cache_path = get_nmnist_cache_path(path, pixels_dict, duration_sequence, cache_root)
+
+    if not os.path.exists(cache_path):
+        preprocess_nmnist_dataset(path, cache_path, pixels_dict, duration_sequence)
+
+    return {
+        "channels": np.memmap(os.path.join(cache_path, "channels.bin"), dtype=np.uint16, mode="r"),
+        "times": np.memmap(os.path.join(cache_path, "times.bin"), dtype=np.uint32, mode="r"),
+        "offsets": np.load(os.path.join(cache_path, "offsets.npy")),
+        "labels": np.load(os.path.join(cache_path, "labels.npy")),
+    }
+
+
+def get_params_gen_spk(channels, times, n_gen):
+    """Distributes spike events over a population of spike generators.
+
+    The events are sorted by channel once with a stable sort, so that the events of each generator keep their
+    order, and then split into one ``spike_times`` array per generator.
+
+    Parameters
+    ----------
+    channels : np.array
+        index of the spike generator of every event
+    times : np.array
+        spike time of every event in ms
+    n_gen : int
+        number of spike generators
+
+    Returns
+    -------
+    list
+        one parameter dictionary with the entry ``spike_times`` per spike generator
+    """
+    order = np.argsort(channels, kind="stable")
+    bounds = np.cumsum(np.bincount(channels, minlength=n_gen))[:-1]
+    return [{"spike_times": spike_times} for spike_times in np.split(times[order], bounds)]
+
+
+def save_checkpoint(path, checkpoint):
+    """Writes a checkpoint of a training run to a file.
+
+    The checkpoint is pickled to a temporary file first, which then replaces the previous checkpoint, so that a
+    run killed while writing always leaves a complete checkpoint behind.
+
+    Parameters
+    ----------
+    path : str
+        path of the checkpoint file
+    checkpoint : dict
+        state of the training run; weights should be given as arrays, which are pickled efficiently
+    """
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, "wb") as f:
+        pickle.dump(checkpoint, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    """Returns the checkpoint stored in a file, or None if the file does not exist."""
+    if not os.path.exists(path):
+        return None
+
+    with open(path, "rb") as f:
+        return pickle.load(f)
+
+
+def connect_sparse(weights, params_syn, nrns_pre, nrns_post):
+    """Connects two populations one-to-one for every stored entry of a sparse weight matrix or every non-zero
+    entry of a dense one.
+
+    The connections are created in row-major order of the matrix, that is, sorted by target and then by source.
+
+    Parameters
+    ----------
+    weights : scipy.sparse matrix or np.array
+        weights of shape (len(nrns_post), len(nrns_pre))
+    params_syn : dict
+        synapse parameters with a single ``delay`` for all connections; ``weight`` is taken from ``weights``
+    nrns_pre : NodeCollection
+        presynaptic population
+    nrns_post : NodeCollection
+        postsynaptic population
+    """
+    weights = sparse.coo_matrix(weights)
+    weights.sum_duplicates()  # also sorts the entries in row-major order
+
+    params_syn = {
+        **params_syn,
+        "weight": weights.data,
+        "delay": np.full(weights.nnz, params_syn["delay"]),
+    }
+
+    nrns_pre_arr = np.array(nrns_pre.tolist())
+    nrns_post_arr = np.array(nrns_post.tolist())
+    nest.Connect(nrns_pre_arr[weights.col], nrns_post_arr[weights.row], {"rule": "one_to_one"}, params_syn)
+
+
+def get_weights(pop_pre, pop_post):
+    """Reads out the connections between two populations.
+
+    Parameters
+    ----------
+    pop_pre : NodeCollection
+        presynaptic population
+    pop_post : NodeCollection
+        postsynaptic population
+
+    Returns
+    -------
+    dict
+        node IDs ``source`` and ``target`` and ``weight`` of every connection, the indices ``senders`` and
+        ``targets`` of the neurons within the populations, and the ``weight_matrix`` as CSR matrix of shape
+        (len(pop_post), len(pop_pre))
+    """
+    conns = nest.GetConnections(pop_pre, pop_post).get(["source", "target", "weight"])
+    conns = {key: np.atleast_1d(np.array(values)) for key, values in conns.items()}
+
+    conns["senders"] = conns["source"] - pop_pre[0].global_id
+    conns["targets"] = conns["target"] - pop_post[0].global_id
+
+    conns["weight_matrix"] = sparse.csr_matrix(
+        (conns["weight"], (conns["targets"], conns["senders"])), shape=(len(pop_post), len(pop_pre))
+    )
+    return conns
+
+
+class WeightSampler:
+    """Samples the weights of the connections between two populations during the simulation.
+
+    All weights are read at once with a single ``get`` call on the connections, and the samples are stored in
+    preallocated arrays, which are enlarged by doubling if more samples are taken than expected. In contrast to
+    a weight recorder, whose events grow with the number of transmitted spikes, the memory thus only grows with
+    the number of samples.
+
+    Parameters
+    ----------
+    pop_pre : NodeCollection
+        presynaptic neurons of the sampled connections
+    pop_post : NodeCollection
+        postsynaptic neurons of the sampled connections
+    n_samples : int
+        expected number of samples
+    """
+
+    def __init__(self, pop_pre, pop_post, n_samples=1):
+        self.conns = nest.GetConnections(pop_pre, pop_post)
+
+        conns = self.conns.get(["source", "target"])
+        self.sources = np.atleast_1d(np.array(conns["source"]))
+        self.targets = np.atleast_1d(np.array(conns["target"]))
+
+        self.times = np.zeros(max(1, n_samples))
+        self.weights = np.zeros((max(1, n_samples), len(self.sources)))
+        self.n_samples = 0
+
+    def sample(self):
+        """Stores the current simulation time and weights of all connections."""
+        if self.n_samples == len(self.times):
+            self.times = np.concatenate([self.times, np.zeros_like(self.times)])
+            self.weights = np.concatenate([self.weights, np.zeros_like(self.weights)])
+
+        self.times[self.n_samples] = nest.biological_time
+        self.weights[self.n_samples] = self.conns.get("weight")
+        self.n_samples += 1
+
+    def get_samples(self):
+        """Returns the sampling times and the weights of shape (number of samples, number of connections)."""
+        return self.times[: self.n_samples], self.weights[: self.n_samples]
+
+
+def simulate_and_sample_weights(duration_sim, interval, weight_samplers):
+    """Simulates for a given time and samples the weights at the start and after every interval.
+
+    Parameters
+    ----------
+    duration_sim : float
+        simulation time (ms)
+    interval : float
+        time between two samples (ms), a multiple of the resolution
+    weight_samplers : dict
+        WeightSampler objects to sample from
+    """
+    t_stop = nest.biological_time + duration_sim
+
+    for weight_sampler in weight_samplers.values():
+        weight_sampler.sample()
+
+    # stop if less than half a time step is left to avoid simulating for a rounding error
+    while t_stop - nest.biological_time > 0.5 * nest.resolution:
+        nest.Simulate(min(interval, t_stop - nest.biological_time))
+
+        for weight_sampler in weight_samplers.values():
+            weight_sampler.sample()
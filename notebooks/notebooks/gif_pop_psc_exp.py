@@ -50,6 +50,7 @@ References
 import matplotlib.pyplot as plt
 import nest
 import numpy as np
+from spike_trains import SpikeTrains
 
 ###############################################################################
 # We first set the parameters of the microscopic model:
@@ -337,9 +338,10 @@ nest.Simulate(t_end + dt)
 # excitatory population (in spks/s):
 
 for i in range(len(nest_pops)):
-    data_sr = nest_sr[i].get("events", "times") * dt - t0
+    events_sr = nest_sr[i].events
+    spiketrains = SpikeTrains.from_events(events_sr["senders"], events_sr["times"] * dt - t0)
     bins = np.concatenate((t, np.array([t[-1] + dt_rec])))
-    A = np.histogram(data_sr, bins=bins)[0] / float(N[i]) / dt_rec
+    A = spiketrains.psth(bins) / float(N[i]) / dt_rec
     A_N[:, i] = A * 1000  # in spks/s
 
 t = np.arange(dt, t_end + dt, dt_rec)
@@ -31,6 +31,16 @@ The program systematically drives the current through a series of  values in
 the two-dimensional `(I_mean, I_std)` space and measures the firing rate of
 the neurons.
 
+By default, the firing rates for many `(I_mean, I_std)` combinations are
+measured in a single simulation, in which every combination drives its own
+group of neurons. The combinations can also be measured one after the other,
+each in a new simulation.
+
+The rate of every combination is appended to a cache file as soon as it is
+measured. When the program is run again, for example after an interruption
+or with a finer grid, only the combinations missing from the cache are
+simulated.
+
 In this example, we measure the I-F curve of the adaptive exponential
 integrate and fire neuron (``aeif_cond_exp``), but any other neuron model that
 accepts current inputs is possible. The model and its parameters are
@@ -38,6 +48,8 @@ supplied when the IF_curve object is created.
 
 """
 
+import hashlib
+import json
 import shelve
 
 import nest
@@ -71,10 +83,14 @@ class IF_curve:
     t_sim = 1000.0  # Duration of a measurement trial
     n_neurons = 100  # Number of neurons
     n_threads = 4  # Nubmer of threads to run the simulation
+    max_neurons = 50000  # Largest number of neurons in a batched simulation
+    rng_seed = 143202461  # Seed of the random number generator, NEST's default
+    decimals = 9  # Decimals to which the currents are rounded in the cache
 
-    def __init__(self, model, params=None):
+    def __init__(self, model, params=None, cache_file=None):
         self.model = model
         self.params = params
+        self.cache_file = cache_file if cache_file is not None else model + "_transfer_cache.jsonl"
         self.build()
         self.connect()
 
@@ -85,6 +101,7 @@ class IF_curve:
 
         nest.ResetKernel()
         nest.local_num_threads = self.n_threads
+        nest.rng_seed = self.rng_seed
 
         #######################################################################
         # We create neurons and devices with specified parameters.
@@ -117,19 +134,151 @@ class IF_curve:
         rate = self.spike_recorder.n_events * 1000.0 / (1.0 * self.n_neurons * self.t_sim)
         return rate
 
-    def compute_transfer(self, i_mean=(400.0, 900.0, 50.0), i_std=(0.0, 600.0, 50.0)):
+    def output_rates(self, means, stds):
+        #######################################################################
+        # To measure the rates for many combinations of `(I_mean, I_std)` at
+        # once, we create one group of neurons and one noise generator per
+        # combination in a new kernel. Each noise generator only drives the
+        # neurons of its group, and the spikes of all neurons are recorded by
+        # one spike recorder.
+
+        nest.ResetKernel()
+        nest.local_num_threads = self.n_threads
+        nest.rng_seed = self.rng_seed
+
+        n_points = len(means)
+        neurons = nest.Create(self.model, n_points * self.n_neurons, self.params)
+        noise = nest.Create(
+            "noise_generator",
+            n_points,
+            {"mean": list(means), "std": list(stds), "start": 0.0, "stop": self.t_sim, "origin": 0.0},
+        )
+        spike_recorder = nest.Create("spike_recorder")
+
+        nest.Connect(numpy.repeat(noise.tolist(), self.n_neurons), numpy.array(neurons.tolist()), "one_to_one")
+        nest.Connect(neurons, spike_recorder, "all_to_all")
+
+        nest.Simulate(self.t_sim)
+
+        #######################################################################
+        # The neurons of a group have consecutive node IDs, so the group of
+        # the sender of every spike is found by integer division.
+
+        group = (spike_recorder.events["senders"] - min(neurons.tolist())) // self.n_neurons
+        n_events = numpy.bincount(group, minlength=n_points)
+        return n_events * 1000.0 / (1.0 * self.n_neurons * self.t_sim)
+
+    def get_batch_size(self, batched):
+        #######################################################################
+        # In the batched mode, at most `max_neurons` neurons are simulated
+        # together; otherwise, every combination is simulated on its own.
+
+        return max(1, self.max_neurons // self.n_neurons) if batched else 1
+
+    def get_cache_config(self, batched):
         #######################################################################
-        # We loop through all possible combinations of `(I_mean, I_sigma)`
-        # and measure the output rate of the neuron.
+        # The measured rates depend on the neuron model and its parameters,
+        # the duration of a trial, the number of neurons, the number of
+        # threads, the seed and on how the combinations are simulated. The
+        # parameters enter the cache entries as a hash. Since the random
+        # numbers drawn for a combination depend on the other combinations of
+        # its batch, a resumed batched measurement agrees with an
+        # uninterrupted one only statistically.
+
+        params_hash = hashlib.sha256(json.dumps(self.params, sort_keys=True).encode()).hexdigest()
+        return {
+            "model": self.model,
+            "params_hash": params_hash,
+            "t_sim": self.t_sim,
+            "n_neurons": self.n_neurons,
+            "n_threads": self.n_threads,
+            "rng_seed": self.rng_seed,
+            "batched": batched,
+            "batch_size": self.get_batch_size(batched),
+        }
+
+    def get_cache_key(self, mean, std):
+        #######################################################################
+        # The currents are rounded, so that combinations computed in
+        # different ways, for example with a different grid, are found in
+        # the cache.
+
+        return (round(float(mean), self.decimals), round(float(std), self.decimals))
+
+    def load_cache(self, batched):
+        #######################################################################
+        # We read the rates of all combinations of `(I_mean, I_std)` measured
+        # with the current configuration. A line that was only partly written
+        # when a run was interrupted is skipped.
+
+        config = self.get_cache_config(batched)
+        rates = {}
+        try:
+            with open(self.cache_file) as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except json.JSONDecodeError:
+                        continue
+                    if all(entry.get(key) == value for key, value in config.items()):
+                        rates[self.get_cache_key(entry["I_mean"], entry["I_std"])] = entry["rate"]
+        except FileNotFoundError:
+            pass
+        return rates
+
+    def append_to_cache(self, means, stds, rates, batched):
+        #######################################################################
+        # Measured rates are only ever appended to the cache file, one line
+        # per combination, so that no completed measurement is lost. A line
+        # left incomplete by an interrupted run is terminated first.
+
+        config = self.get_cache_config(batched)
+        lines = []
+        for mean, std, rate in zip(means, stds, rates):
+            mean, std = self.get_cache_key(mean, std)
+            lines.append(json.dumps(dict(config, I_mean=mean, I_std=std, rate=float(rate))) + "\n")
+        with open(self.cache_file, "a+b") as f:
+            if f.seek(0, 2) > 0:
+                f.seek(-1, 2)
+                if f.read(1) != b"\n":
+                    lines.insert(0, "\n")
+            f.write("".join(lines).encode())
+
+    def compute_transfer(self, i_mean=(400.0, 900.0, 50.0), i_std=(0.0, 600.0, 50.0), batched=True):
+        #######################################################################
+        # We measure the output rate of the neuron for all possible
+        # combinations of `(I_mean, I_sigma)` that are not in the cache yet.
+        # In the batched mode, the combinations are simulated together in
+        # chunks of at most `max_neurons` neurons; otherwise, we loop through
+        # them. Finally, the transfer surface is assembled from the cache.
 
         self.i_range = numpy.arange(*i_mean)
         self.std_range = numpy.arange(*i_std)
-        self.rate = numpy.zeros((self.i_range.size, self.std_range.size))
         nest.set_verbosity("M_WARNING")
-        for n, i in enumerate(self.i_range):
-            print("I  =  {0}".format(i))
-            for m, std in enumerate(self.std_range):
-                self.rate[n, m] = self.output_rate(i, std)
+
+        means, stds = numpy.meshgrid(self.i_range, self.std_range, indexing="ij")
+        points = [self.get_cache_key(mean, std) for mean, std in zip(means.ravel(), stds.ravel())]
+
+        cache = self.load_cache(batched)
+        missing = [point for point in dict.fromkeys(points) if point not in cache]
+        print("{0} of {1} points cached".format(len(points) - len(missing), len(points)))
+
+        if batched:
+            batch_size = self.get_batch_size(batched)
+            for start in range(0, len(missing), batch_size):
+                print("points {0} to {1} of {2}".format(start + 1, min(start + batch_size, len(missing)), len(missing)))
+                batch_means, batch_stds = zip(*missing[start : start + batch_size])
+                rates = self.output_rates(batch_means, batch_stds)
+                self.append_to_cache(batch_means, batch_stds, rates, batched)
+                cache.update(zip(missing[start : start + batch_size], rates))
+        else:
+            for mean, std in missing:
+                print("I  =  {0}, I_std = {1}".format(mean, std))
+                rate = self.output_rate(mean, std)
+                self.append_to_cache([mean], [std], [rate], batched)
+                cache[(mean, std)] = rate
+
+        self.rate = numpy.array([cache[point] for point in points]).reshape(means.shape)
 
 
 transfer = IF_curve(model, params)
@@ -38,15 +38,15 @@ four weight matrices are created and plotted.
 import matplotlib.gridspec as gridspec
 import matplotlib.pyplot as plt
 import nest
-import numpy as np
 from mpl_toolkits.axes_grid1 import make_axes_locatable
+from weight_matrices import block_average, weight_matrix
 
 ###############################################################################
 # We now specify a function to extract and plot weight matrices for all
 # connections among `E_neurons` and `I_neurons`.
 #
-# We initialize all the matrices, whose dimensionality is determined by the
-# number of elements in each population.
+# The dimensionality of the matrices is determined by the number of elements
+# in each population.
 # Since in this example, we have 2 populations (E/I), :math:`2^2` possible
 # synaptic connections exist (EE, EI, IE, II).
 #
@@ -55,17 +55,17 @@ from mpl_toolkits.axes_grid1 import make_axes_locatable
 # connection from inhibitory to excitatory neurons (I->E) as EI (post-pre) and
 # connections from excitatory to inhibitory neurons (E->I) as IE (post-pre).
 #
-# The script iterates through the list of all connections of each type.
-# To populate the corresponding weight matrix, we identify the source-node_id
-# and the target-node_id.
-# For each `node_id`, we subtract the minimum `node_id` within the corresponding
-# population, to assure the matrix indices range from 0 to the size of the
-# population.
-#
-# After determining the matrix indices `[i, j]`, for each connection object, the
-# corresponding weight is added to the entry `W[i,j]`. The procedure is then
+# For all connections of each type, we extract the source-node_id, the
+# target-node_id and the weight. The function ``weight_matrix`` (see
+# :doc:`weight_matrices`) determines the matrix indices `[i, j]` from the
+# position of the `node_id` within the corresponding population and adds the
+# weights of all connections to the entries `W[i,j]` at once. For sparse
+# connectivity, it returns a SciPy sparse matrix. The procedure is then
 # repeated for all the different connection types.
 #
+# Populations with more than ``max_shape`` neurons are shown with the average
+# weights of blocks of neurons, computed by ``block_average``.
+#
 # We then plot the figure, specifying the properties we want. For example, we
 # can display all the weight matrices in a single figure, which requires us to
 # use ``GridSpec`` to specify the spatial arrangement of the axes.
@@ -79,55 +79,25 @@ from mpl_toolkits.axes_grid1 import make_axes_locatable
 # Finally, the last three steps are repeated for each synapse type.
 
 
-def plot_weight_matrices(E_neurons, I_neurons):
-    W_EE = np.zeros([len(E_neurons), len(E_neurons)])
-    W_EI = np.zeros([len(I_neurons), len(E_neurons)])
-    W_IE = np.zeros([len(E_neurons), len(I_neurons)])
-    W_II = np.zeros([len(I_neurons), len(I_neurons)])
-
-    a_EE = nest.GetConnections(E_neurons, E_neurons)
-
-    # We extract the value of the connection weight for all the connections between these populations
-    c_EE = a_EE.weight
-
-    # Repeat the two previous steps for all other connection types
-    a_EI = nest.GetConnections(I_neurons, E_neurons)
-    c_EI = a_EI.weight
-    a_IE = nest.GetConnections(E_neurons, I_neurons)
-    c_IE = a_IE.weight
-    a_II = nest.GetConnections(I_neurons, I_neurons)
-    c_II = a_II.weight
-
-    # We now iterate through the range of all connections of each type.
-    # To populate the corresponding weight matrix, we begin by identifying
-    # the source-node_id (by using .source) and the target-node_id.
-    # For each node_id, we subtract the minimum node_id within the corresponding
-    # population, to assure the matrix indices range from 0 to the size of
-    # the population.
-
-    # After determining the matrix indices [i, j], for each connection
-    # object, the corresponding weight is added to the entry W[i,j].
-    # The procedure is then repeated for all the different connection types.
-    a_EE_src = a_EE.source
-    a_EE_trg = a_EE.target
-    a_EI_src = a_EI.source
-    a_EI_trg = a_EI.target
-    a_IE_src = a_IE.source
-    a_IE_trg = a_IE.target
-    a_II_src = a_II.source
-    a_II_trg = a_II.target
-
-    min_E = min(E_neurons.tolist())
-    min_I = min(I_neurons.tolist())
-
-    for idx in range(len(a_EE)):
-        W_EE[a_EE_src[idx] - min_E, a_EE_trg[idx] - min_E] += c_EE[idx]
-    for idx in range(len(a_EI)):
-        W_EI[a_EI_src[idx] - min_I, a_EI_trg[idx] - min_E] += c_EI[idx]
-    for idx in range(len(a_IE)):
-        W_IE[a_IE_src[idx] - min_E, a_IE_trg[idx] - min_I] += c_IE[idx]
-    for idx in range(len(a_II)):
-        W_II[a_II_src[idx] - min_I, a_II_trg[idx] - min_I] += c_II[idx]
+def plot_weight_matrices(E_neurons, I_neurons, max_shape=(500, 500)):
+    E_ids = E_neurons.tolist()
+    I_ids = I_neurons.tolist()
+
+    # We extract the sources, targets and weights of all the connections between these populations
+    a_EE = nest.GetConnections(E_neurons, E_neurons).get(["source", "target", "weight"])
+
+    # Repeat the previous step for all other connection types
+    a_EI = nest.GetConnections(I_neurons, E_neurons).get(["source", "target", "weight"])
+    a_IE = nest.GetConnections(E_neurons, I_neurons).get(["source", "target", "weight"])
+    a_II = nest.GetConnections(I_neurons, I_neurons).get(["source", "target", "weight"])
+
+    # We now gather the weights of each connection type in a matrix with
+    # the sources as rows and the targets as columns, where the weights of
+    # multiple connections between the same neurons are added.
+    W_EE = weight_matrix(a_EE["source"], a_EE["target"], a_EE["weight"], E_ids, E_ids)
+    W_EI = weight_matrix(a_EI["source"], a_EI["target"], a_EI["weight"], I_ids, E_ids)
+    W_IE = weight_matrix(a_IE["source"], a_IE["target"], a_IE["weight"], E_ids, I_ids)
+    W_II = weight_matrix(a_II["source"], a_II["target"], a_II["weight"], I_ids, I_ids)
 
     fig = plt.figure()
     fig.suptitle("Weight matrices", fontsize=14)
@@ -137,7 +107,7 @@ def plot_weight_matrices(E_neurons, I_neurons):
     ax3 = plt.subplot(gs[-1, :-1])
     ax4 = plt.subplot(gs[-1, -1])
 
-    plt1 = ax1.imshow(W_EE, cmap="jet")
+    plt1 = ax1.imshow(block_average(W_EE, max_shape), cmap="jet")
 
     divider = make_axes_locatable(ax1)
     cax = divider.append_axes("right", "5%", pad="3%")
@@ -146,7 +116,7 @@ def plot_weight_matrices(E_neurons, I_neurons):
     ax1.set_title("$W_{EE}$")
     plt.tight_layout()
 
-    plt2 = ax2.imshow(W_IE)
+    plt2 = ax2.imshow(block_average(W_IE, max_shape))
     plt2.set_cmap("jet")
     divider = make_axes_locatable(ax2)
     cax = divider.append_axes("right", "5%", pad="3%")
@@ -154,7 +124,7 @@ def plot_weight_matrices(E_neurons, I_neurons):
     ax2.set_title("$W_{EI}$")
     plt.tight_layout()
 
-    plt3 = ax3.imshow(W_EI)
+    plt3 = ax3.imshow(block_average(W_EI, max_shape))
     plt3.set_cmap("jet")
     divider = make_axes_locatable(ax3)
     cax = divider.append_axes("right", "5%", pad="3%")
@@ -162,7 +132,7 @@ def plot_weight_matrices(E_neurons, I_neurons):
     ax3.set_title("$W_{IE}$")
     plt.tight_layout()
 
-    plt4 = ax4.imshow(W_II)
+    plt4 = ax4.imshow(block_average(W_II, max_shape))
     plt4.set_cmap("jet")
     divider = make_axes_locatable(ax4)
     cax = divider.append_axes("right", "5%", pad="3%")
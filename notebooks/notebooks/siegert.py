@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+#
+# siegert.py
+#
+# This file is part of NEST.
+#
+# Copyright (C) 2004 The NEST Initiative
+#
+# NEST is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# NEST is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NEST.  If not, see <http://www.gnu.org/licenses/>.
+
+
+r"""Siegert rate of a leaky integrate-and-fire neuron
+----------------------------------------------------------------
+
+The function ``siegert_rate`` computes the firing rate of a leaky
+integrate-and-fire neuron driven by white noise with Siegert's formula
+
+.. math::
+
+    \nu = \left( t_\mathrm{ref} + \tau_m \sqrt{\pi}
+    \int_{y_r}^{y_\theta} e^{u^2} (1 + \mathrm{erf}(u)) \, du \right)^{-1},
+    \quad y = \frac{V - \mu}{\sqrt{2} \sigma},
+
+where :math:`\mu` and :math:`\sigma` are the mean and the standard deviation
+of the free membrane potential. It takes arrays of :math:`\mu` and
+:math:`\sigma` and evaluates the integral for all of them at once by
+Gauss-Legendre quadrature. The integrand is computed as ``erfcx(-u)``, which
+does not overflow for negative ``u``, and the integral is split at ``u = 0``,
+so that the quadrature is accurate to about ``1e-12`` relative to the rate
+also for strongly hyperpolarized neurons.
+
+For mean-field calculations that need the rates of very many
+:math:`(\mu, \sigma)` pairs, ``SiegertTable`` tabulates the rate on a grid
+once and interpolates it with a bicubic spline, and
+``get_siegert_table`` keeps the tables of recently used parameters.
+
+It is used by :doc:`CampbellSiegert`.
+"""
+import functools
+
+import numpy as np
+from scipy.interpolate import RectBivariateSpline
+from scipy.special import erfcx
+
+
+def siegert_rate(mu, sigma, tau_m, t_ref, V_th, V_reset, n_nodes=100, chunk_size=10000):
+    """Returns the firing rate of a leaky integrate-and-fire neuron.
+
+    All parameters are given in consistent units, for example, potentials in V and times in s, which yield rates
+    in 1/s.
+
+    Parameters
+    ----------
+    mu : float or np.array
+        mean of the free membrane potential
+    sigma : float or np.array
+        standard deviation of the free membrane potential, broadcast against ``mu``
+    tau_m : float
+        membrane time constant
+    t_ref : float
+        refractory period
+    V_th : float
+        firing threshold
+    V_reset : float
+        reset potential
+    n_nodes : int
+        number of Gauss-Legendre nodes on either side of ``u = 0``
+    chunk_size : int
+        number of rates computed at once, which bounds the memory needed for the quadrature
+
+    Returns
+    -------
+    float or np.array
+        firing rate of the shape of ``mu`` and ``sigma`` broadcast against each other
+    """
+    mu, sigma = np.broadcast_arrays(np.asarray(mu, dtype=float), np.asarray(sigma, dtype=float))
+    y_th = ((V_th - mu) / (np.sqrt(2.0) * sigma)).ravel()
+    y_r = ((V_reset - mu) / (np.sqrt(2.0) * sigma)).ravel()
+
+    nodes, weights = np.polynomial.legendre.leggauss(n_nodes)
+
+    # The integrand decays slowly for negative u and grows rapidly for positive
+    # u, so both parts of the integral are computed separately.
+    integral = np.zeros(len(y_th))
+    for start in range(0, len(y_th), chunk_size):
+        lower = y_r[start : start + chunk_size]
+        upper = y_th[start : start + chunk_size]
+
+        for a, b in [
+            (np.minimum(lower, 0.0), np.minimum(upper, 0.0)),
+            (np.maximum(lower, 0.0), np.maximum(upper, 0.0)),
+        ]:
+            u = 0.5 * (b + a)[:, np.newaxis] + 0.5 * (b - a)[:, np.newaxis] * nodes
+            integral[start : start + chunk_size] += 0.5 * (b - a) * (erfcx(-u) @ weights)
+
+    with np.errstate(over="ignore"):
+        rate = 1.0 / (t_ref + tau_m * np.sqrt(np.pi) * integral)
+
+    return rate.reshape(mu.shape) if mu.ndim > 0 else rate[0]
+
+
+class SiegertTable:
+    """Firing rates of a leaky integrate-and-fire neuron interpolated from a table.
+
+    The rates are computed with ``siegert_rate`` on a regular grid of ``shape`` points over ``mu_range`` and
+    ``sigma_range`` and interpolated with a bicubic spline. The largest deviation of the interpolated rates from
+    the exact rates at the centers of the grid cells, where the interpolation error is largest, is stored in
+    ``max_error`` as an estimate of the error of the table. Rates outside the grid are computed exactly.
+
+    Parameters
+    ----------
+    tau_m : float
+        membrane time constant
+    t_ref : float
+        refractory period
+    V_th : float
+        firing threshold
+    V_reset : float
+        reset potential
+    mu_range : tuple
+        smallest and largest mean of the free membrane potential
+    sigma_range : tuple
+        smallest and largest standard deviation of the free membrane potential, which must be positive
+    shape : tuple
+        number of grid points along ``mu`` and ``sigma``
+    """
+
+    def __init__(self, tau_m, t_ref, V_th, V_reset, mu_range, sigma_range, shape=(200, 200)):
+        if sigma_range[0] <= 0.0:
+            raise ValueError("sigma_range must only contain positive standard deviations")
+
+        self.neuron_params = {"tau_m": tau_m, "t_ref": t_ref, "V_th": V_th, "V_reset": V_reset}
+        self.mu = np.linspace(mu_range[0], mu_range[1], shape[0])
+        self.sigma = np.linspace(sigma_range[0], sigma_range[1], shape[1])
+
+        rates = siegert_rate(self.mu[:, np.newaxis], self.sigma[np.newaxis, :], **self.neuron_params)
+        self.spline = RectBivariateSpline(self.mu, self.sigma, rates)
+
+        mu_centers = 0.5 * (self.mu[1:] + self.mu[:-1])
+        sigma_centers = 0.5 * (self.sigma[1:] + self.sigma[:-1])
+        exact = siegert_rate(mu_centers[:, np.newaxis], sigma_centers[np.newaxis, :], **self.neuron_params)
+        self.max_error = np.max(np.abs(self.spline(mu_centers, sigma_centers) - exact))
+
+    def __call__(self, mu, sigma):
+        """Returns the firing rates for the given means and standard deviations, see ``siegert_rate``."""
+        mu, sigma = np.broadcast_arrays(np.asarray(mu, dtype=float), np.asarray(sigma, dtype=float))
+
+        # the spline may slightly overshoot the range of possible rates
+        rate = np.asarray(np.clip(self.spline.ev(mu, sigma), 0.0, 1.0 / self.neuron_params["t_ref"]))
+
+        outside = (mu < self.mu[0]) | (mu > self.mu[-1]) | (sigma < self.sigma[0]) | (sigma > self.sigma[-1])
+        if np.any(outside):
+            rate[outside] = siegert_rate(mu[outside], sigma[outside], **self.neuron_params)
+
+        return rate if rate.ndim > 0 else rate[()]
+
+
+@functools.lru_cache(maxsize=16)
+def get_siegert_table(tau_m, t_ref, V_th, V_reset, mu_range, sigma_range, shape=(200, 200)):
+    """Returns the ``SiegertTable`` of the given parameters, which is only computed on the first call.
+
+    All arguments must be hashable, that is, the ranges and the shape must be given as tuples.
+    """
+    return SiegertTable(tau_m, t_ref, V_th, V_reset, mu_range, sigma_range, shape)
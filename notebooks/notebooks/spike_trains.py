@@ -0,0 +1,273 @@
+# -*- coding: utf-8 -*-
+#
+# spike_trains.py
+#
+# This file is part of NEST.
+#
+# Copyright (C) 2004 The NEST Initiative
+#
+# NEST is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# NEST is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NEST.  If not, see <http://www.gnu.org/licenses/>.
+
+r"""Spike trains of a group of neurons
+----------------------------------------------------------------
+
+The ``SpikeTrains`` class stores the spike trains of a group of neurons in
+compressed sparse row (CSR) layout: a single array of spike times, sorted by
+neuron and then by time, and an array of offsets, such that the spike train of
+the ``i``-th neuron is ``times[offsets[i]:offsets[i + 1]]``.
+
+The container is built from the ``senders`` and ``times`` of the events of a
+spike recorder with a single sort, and all statistics, such as rates,
+inter-spike intervals, coefficients of variation, binned spike counts,
+correlations, and peri-stimulus time histograms, are computed on the whole
+arrays at once instead of looping over the neurons.
+
+It is used by :doc:`brunel_alpha_evolution_strategies`,
+:doc:`wang_decision_making`, and :doc:`gif_pop_psc_exp`.
+"""
+import numpy as np
+from scipy import sparse
+
+
+class SpikeTrains:
+    """Spike trains of a group of neurons in CSR layout.
+
+    Parameters
+    ----------
+    times : np.array
+        spike times sorted by neuron and, within each neuron, by time
+    offsets : np.array
+        index of the first spike of every neuron in ``times``, followed by the total number of spikes
+    node_ids : np.array
+        node IDs of the neurons
+    """
+
+    def __init__(self, times, offsets, node_ids):
+        self.times = np.asarray(times)
+        self.offsets = np.asarray(offsets)
+        self.node_ids = np.asarray(node_ids)
+
+    @classmethod
+    def from_events(cls, senders, times, node_ids=None):
+        """Creates the spike trains from the events of a spike recorder.
+
+        Parameters
+        ----------
+        senders : np.array
+            node IDs of the spiking neurons
+        times : np.array
+            spike times
+        node_ids : list or np.array, optional
+            node IDs of the neurons to include; spikes of other neurons are dropped. By default, all neurons that
+            spiked at least once are included.
+
+        Returns
+        -------
+        SpikeTrains
+            spike trains of the neurons in the order of the sorted node IDs
+        """
+        senders = np.asarray(senders)
+        times = np.asarray(times)
+
+        if node_ids is None:
+            node_ids = np.unique(senders)
+        else:
+            node_ids = np.unique(node_ids)
+            included = np.isin(senders, node_ids)
+            senders = senders[included]
+            times = times[included]
+
+        order = np.lexsort((times, senders))
+        neuron_idc = np.searchsorted(node_ids, senders[order])
+
+        offsets = np.zeros(len(node_ids) + 1, dtype=int)
+        np.cumsum(np.bincount(neuron_idc, minlength=len(node_ids)), out=offsets[1:])
+
+        return cls(times[order], offsets, node_ids)
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def __getitem__(self, i):
+        """Returns the spike times of the ``i``-th neuron."""
+        return self.times[self.offsets[i] : self.offsets[i + 1]]
+
+    @property
+    def n_spikes(self):
+        """Number of spikes of every neuron."""
+        return np.diff(self.offsets)
+
+    @property
+    def neuron_indices(self):
+        """Index of the neuron of every spike."""
+        return np.repeat(np.arange(len(self)), self.n_spikes)
+
+    def rates(self, duration):
+        """Returns the firing rate of every neuron in spikes/s.
+
+        Parameters
+        ----------
+        duration : float
+            recording duration in ms
+        """
+        return self.n_spikes / duration * 1e3
+
+    def isis(self):
+        """Returns the inter-spike intervals of all neurons and the index of the neuron of every interval."""
+        neuron_idc = self.neuron_indices
+        same_neuron = neuron_idc[1:] == neuron_idc[:-1]
+        return np.diff(self.times)[same_neuron], neuron_idc[1:][same_neuron]
+
+    def cv(self, pooled=True):
+        """Returns the coefficient of variation of the inter-spike intervals.
+
+        Parameters
+        ----------
+        pooled : bool
+            if True, the coefficient of variation of the intervals of all neurons taken together, which is 0.0 if
+            there are fewer than two intervals; otherwise, the coefficient of variation of every neuron, which is
+            nan for neurons with fewer than two intervals
+
+        Returns
+        -------
+        float or np.array
+            coefficient of variation
+        """
+        isis, neuron_idc = self.isis()
+
+        if pooled:
+            if len(isis) > 1:
+                return np.std(isis) / np.mean(isis)
+            return 0.0
+
+        n = np.bincount(neuron_idc, minlength=len(self)).astype(float)
+        with np.errstate(invalid="ignore", divide="ignore"):
+            mean = np.bincount(neuron_idc, isis, minlength=len(self)) / n
+            var = np.bincount(neuron_idc, (isis - mean[neuron_idc]) ** 2, minlength=len(self)) / n
+            cv = np.sqrt(var) / mean
+        cv[n < 2] = np.nan
+        return cv
+
+    def bin_indices(self, bins):
+        """Returns the index of the bin of every spike, or -1 for spikes outside the bins.
+
+        The bins follow the convention of ``np.histogram``: all bins are half-open except the last one, which
+        includes its right edge.
+        """
+        bins = np.asarray(bins)
+        bin_idc = np.searchsorted(bins, self.times, side="right") - 1
+        bin_idc[self.times == bins[-1]] = len(bins) - 2
+        bin_idc[(self.times < bins[0]) | (self.times > bins[-1])] = -1
+        return bin_idc
+
+    def binned(self, bins, as_sparse=False):
+        """Returns the spike counts of every neuron in every bin.
+
+        Parameters
+        ----------
+        bins : np.array
+            bin edges as for ``np.histogram``
+        as_sparse : bool
+            whether to return a ``scipy.sparse.csr_matrix``, whose memory scales with the number of spikes rather
+            than the number of bins
+
+        Returns
+        -------
+        np.array or scipy.sparse.csr_matrix
+            spike counts of shape (number of neurons, number of bins)
+        """
+        n_bins = len(bins) - 1
+        bin_idc = self.bin_indices(bins)
+        included = bin_idc >= 0
+        neuron_idc = self.neuron_indices[included]
+        bin_idc = bin_idc[included]
+
+        if as_sparse:
+            counts = sparse.csr_matrix(
+                (np.ones(len(bin_idc), dtype=int), (neuron_idc, bin_idc)), shape=(len(self), n_bins)
+            )
+            counts.sum_duplicates()
+            return counts
+
+        counts = np.bincount(neuron_idc * n_bins + bin_idc, minlength=len(self) * n_bins)
+        return counts.reshape((len(self), n_bins))
+
+    def psth(self, bins):
+        """Returns the number of spikes of all neurons together in every bin, see ``binned``."""
+        bin_idc = self.bin_indices(bins)
+        return np.bincount(bin_idc[bin_idc >= 0], minlength=len(bins) - 1)
+
+    def mean_correlation(self, bins, method="exact", n_pairs=1000, seed=None):
+        """Returns the average pairwise correlation coefficient of the binned spike counts.
+
+        Three methods are available:
+
+        ``"exact"``
+            the mean of the off-diagonal entries of the dense correlation matrix computed with ``np.corrcoef``,
+            which takes O(n² · number of bins) time and O(n · number of bins) memory
+        ``"population"``
+            the same value from the variance of the population sum of the standardized spike counts, since
+            the sum of all entries of the correlation matrix equals this variance. Only the sparse spike counts
+            and one population signal are needed, and the result agrees with ``"exact"`` up to rounding errors
+            (relative deviations of about 1e-12).
+        ``"pairs"``
+            an estimate from ``n_pairs`` randomly drawn pairs of distinct neurons, computed from the sparse spike
+            counts. Its standard error is the standard deviation of the pairwise correlations divided by the
+            square root of ``n_pairs``.
+
+        Parameters
+        ----------
+        bins : np.array
+            bin edges as for ``np.histogram``
+        method : str
+            ``"exact"``, ``"population"``, or ``"pairs"``
+        n_pairs : int
+            number of pairs drawn by the ``"pairs"`` method
+        seed : int, optional
+            seed for drawing the pairs
+
+        Returns
+        -------
+        float
+            average pairwise correlation coefficient, 0.0 for fewer than two neurons and nan if a neuron has the
+            same spike count in every bin
+        """
+        if method not in ("exact", "population", "pairs"):
+            raise ValueError(f"unknown method {method}, choose from 'exact', 'population', and 'pairs'")
+
+        n = len(self)
+        if n < 2:
+            return 0.0
+
+        if method == "exact":
+            cc = np.corrcoef(self.binned(bins))
+            return 1.0 / (n * (n - 1.0)) * (np.sum(cc) - n)
+
+        n_bins = len(bins) - 1
+        counts = self.binned(bins, as_sparse=True)
+        mean = np.asarray(counts.sum(axis=1)).ravel() / n_bins
+        std = np.sqrt(np.asarray(counts.multiply(counts).sum(axis=1)).ravel() / n_bins - mean**2)
+        if np.any(std == 0.0):
+            return np.nan
+
+        if method == "population":
+            population_sum = sparse.diags(1.0 / std).dot(counts).sum(axis=0)
+            variance = np.mean((np.asarray(population_sum).ravel() - np.sum(mean / std)) ** 2)
+            return 1.0 / (n * (n - 1.0)) * (variance - n)
+
+        rng = np.random.default_rng(seed)
+        i = rng.integers(0, n, n_pairs)
+        j = (i + rng.integers(1, n, n_pairs)) % n  # distinct from i
+        products = np.asarray(counts[i].multiply(counts[j]).sum(axis=1)).ravel() / n_bins
+        return np.mean((products - mean[i] * mean[j]) / (std[i] * std[j]))
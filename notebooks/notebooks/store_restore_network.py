@@ -42,7 +42,10 @@ the same network using the stored weights.
    clear to all which aspects of a network are carried from one simulation
    to another and thus contributes to good scientific practice.
 
-   Storing and restoring is currently not supported for MPI-parallel simulations.
+   In MPI-parallel simulations, every rank stores its local neurons and
+   synapses in its own shard. A stored network can be restored with any
+   number of ranks and threads, for example, by running this example with
+   ``mpirun -np 2 python store_restore_network.py``.
 
 """
 
@@ -50,14 +53,18 @@ the same network using the stored weights.
 # Import necessary modules.
 
 import nest
-import pickle
+import json
+import itertools
+import numpy as np
+import os
+import shutil
+import zlib
 
 ###############################################################################
 # These modules are only needed for illustrative plotting.
 
 import matplotlib.pyplot as plt
 from matplotlib import gridspec
-import numpy as np
 import pandas as pd
 import textwrap
 
@@ -73,6 +80,37 @@ import textwrap
 # and inhibitory population, both driven by external excitatory poisson
 # input. Excitatory connections are plastic (STDP). Spike activity of
 # the excitatory population is recorded.
+#
+# The network is stored as a directory of binary files, one for the membrane
+# potentials and one per synapse model, together with a ``network.json`` file
+# describing their contents. Each MPI rank writes such files for its local
+# neurons and the synapses to them, a shard, in parallel with the other ranks.
+# Each synapse file is an array of records with the typed columns given in
+# ``syn_dtype``, that is, source and target as ``uint32`` and weight and delay
+# as ``float32``. Further plastic state variables of a synapse model can be
+# stored by adding columns to ``syn_dtype``.
+#
+# Synapses are written in chunks of about ``chunk_size`` synapses, each
+# obtained from ``GetConnections`` for a block of source neurons, and are
+# reconnected chunk by chunk from the memory-mapped files. The memory needed
+# for storing and restoring is thus bounded by the chunk size rather than by
+# the size of the network.
+#
+# On restore, every rank reads all shards and connects only the synapses whose
+# targets are local, so the network can be distributed differently than when
+# it was stored. Only with the same number of virtual processes, however, the
+# random numbers and thus the continued simulation are the same.
+#
+# A stored network is the first checkpoint of a chain, to which further
+# checkpoints can be added during a long simulation. As the connectivity does
+# not change, these only contain the membrane potentials and the changes of
+# the weights of the plastic synapse models since the previous checkpoint. The
+# weights are quantized in steps of ``weight_quantum``, and the changes of
+# every chunk are compressed and only written if any weight of the chunk
+# changed. Any checkpoint of the chain can be restored. Checkpoints can only be
+# added by a kernel whose ranks hold the synapses in the same chunks and order
+# as when the network was stored, typically the kernel that stored it, which is
+# checked before any change is written.
 
 
 class EINetwork:
@@ -101,6 +139,16 @@ class EINetwork:
         self.nrn_params = {"V_m": nest.random.normal(-65.0, 5.0)}
         self.poisson_rate = 800.0
 
+        self.nrn_dtype = np.dtype([("node_id", "u4"), ("V_m", "f8")])
+        self.syn_dtype = {
+            "e_syn": np.dtype([("source", "u4"), ("target", "u4"), ("weight", "f4"), ("delay", "f4")]),
+            "i_syn": np.dtype([("source", "u4"), ("target", "u4"), ("weight", "f4"), ("delay", "f4")]),
+        }
+        self.chunk_size = 100000
+
+        self.plastic_synapse_models = ["e_syn"]
+        self.weight_quantum = 1e-6
+
     def build(self):
         """
         Construct network from scratch, including instrumentation.
@@ -128,58 +176,238 @@ class EINetwork:
         nest.Connect(self.pg, self.neurons, "all_to_all", {"weight": self.JE})
         nest.Connect(self.e_neurons, self.sr)
 
-    def store(self, dump_filename):
+    def get_projections(self):
         """
-        Store neuron membrane potential and synaptic weights to given file.
+        Return synapse model, source neurons and indegree of all projections.
         """
 
-        assert nest.NumProcesses() == 1, "Cannot dump MPI parallel"
+        return [("e_syn", self.e_neurons, self.indeg_e), ("i_syn", self.i_neurons, self.indeg_i)]
+
+    def store(self, dump_dirname):
+        """
+        Store neuron membrane potential and synapses to given directory.
+        """
 
         ###############################################################################
-        # Build dictionary with relevant network information:
-        #
-        #   - membrane potential for all neurons in each population
-        #   - source, target and weight of all connections
+        # Write the network information to a temporary directory first, which is
+        # only moved to its final place when all ranks are done:
         #
-        # Dictionary entries are Pandas Dataframes.
+        #   - node ID and membrane potential of all local neurons
+        #   - source, target, weight and delay of all local connections
         #
         # Strictly speaking, we would not need to store the weight of the inhibitory
         # synapses since they are fixed, but we do so out of symmetry and to make it
         # easier to add plasticity for inhibitory connections later.
 
-        network = {}
-        network["n_vp"] = nest.total_num_virtual_procs
-        network["e_nrns"] = self.neurons.get(["V_m"], output="pandas")
-        network["i_nrns"] = self.neurons.get(["V_m"], output="pandas")
+        rank = nest.Rank()
+        tmp_dirname = self.make_tmp_dir(dump_dirname)
 
-        network["e_syns"] = nest.GetConnections(synapse_model="e_syn").get(
-            ("source", "target", "weight"), output="pandas"
-        )
-        network["i_syns"] = nest.GetConnections(synapse_model="i_syn").get(
-            ("source", "target", "weight"), output="pandas"
-        )
+        self.store_neurons(tmp_dirname)
+
+        shard = {"n_neurons": len(nest.GetLocalNodeCollection(self.neurons)), "chunks": {}}
+        for synapse_model, sources, indegree in self.get_projections():
+            shard["chunks"][synapse_model] = self.store_synapses(
+                os.path.join(tmp_dirname, f"{synapse_model}_{rank}.bin"), synapse_model, sources, indegree
+            )
 
-        with open(dump_filename, "wb") as f:
-            pickle.dump(network, f, pickle.HIGHEST_PROTOCOL)
+        with open(os.path.join(tmp_dirname, f"shard_{rank}.json"), "w") as f:
+            json.dump(shard, f)
+        nest.SyncProcesses()
 
-    def restore(self, dump_filename):
+        ###############################################################################
+        # The manifest lists the sizes of all shards and is written by the first
+        # rank once all shards are complete.
+
+        if rank == 0:
+            network = {
+                "n_vp": nest.total_num_virtual_procs,
+                "nrn_columns": self.nrn_dtype.descr,
+                "syn_columns": {synapse_model: dtype.descr for synapse_model, dtype in self.syn_dtype.items()},
+                "weight_quantum": self.weight_quantum,
+                "shards": [],
+            }
+            for shard_rank in range(nest.NumProcesses()):
+                with open(os.path.join(tmp_dirname, f"shard_{shard_rank}.json")) as f:
+                    network["shards"].append(json.load(f))
+
+            with open(os.path.join(tmp_dirname, "network.json"), "w") as f:
+                json.dump(network, f)
+
+        self.move_tmp_dir(tmp_dirname, dump_dirname)
+
+    def store_checkpoint(self, dump_dirname):
         """
-        Restore network from data in file combined with base information in the class.
+        Add membrane potentials and changes of plastic weights as next checkpoint to a stored network.
         """
 
-        assert nest.NumProcesses() == 1, "Cannot load MPI parallel"
+        with open(os.path.join(dump_dirname, "network.json")) as f:
+            network = json.load(f)
+
+        assert len(network["shards"]) == nest.NumProcesses(), "Number of MPI processes must match"
 
-        with open(dump_filename, "rb") as f:
-            network = pickle.load(f)
+        rank = nest.Rank()
+        checkpoint = self.get_n_checkpoints(dump_dirname)
 
-        assert network["n_vp"] == nest.total_num_virtual_procs, "N_VP must match"
+        tmp_dirname = self.make_tmp_dir(os.path.join(dump_dirname, f"checkpoint_{checkpoint}"))
+
+        self.store_neurons(tmp_dirname)
+
+        ###############################################################################
+        # The changes of the quantized weights are written chunk by chunk to one
+        # file per synapse model, and the index maps each changed chunk to the
+        # position of its compressed changes in the file. The weights of the
+        # previous checkpoint are read alongside from the stored chain, so that
+        # only one chunk of weights is held in memory at a time. The changes are
+        # only meaningful if every chunk holds the same synapses in the same
+        # order as when the network was stored, which a differently distributed
+        # or restored kernel does not guarantee, so this is checked chunk by chunk.
+
+        for synapse_model, sources, indegree in self.get_projections():
+            if synapse_model not in self.plastic_synapse_models:
+                continue
+
+            chunk_sizes = network["shards"][rank]["chunks"][synapse_model]
+            chunks = self.get_synapse_chunks(synapse_model, sources, indegree, ["source", "target", "weight"])
+            previous_chunks = self.read_synapses(dump_dirname, network, synapse_model, rank, checkpoint - 1)
+
+            index = {}
+            offset = 0
+            with open(os.path.join(tmp_dirname, f"{synapse_model}_{rank}.bin"), "wb") as f:
+                for i, (values, previous) in enumerate(itertools.zip_longest(chunks, previous_chunks)):
+                    assert values is not None and previous is not None, "Number of chunks must not change"
+                    previous_chunk, previous_weights = previous
+                    assert len(values["weight"]) == chunk_sizes[i], "Connectivity must not change"
+                    assert np.array_equal(values["source"], previous_chunk["source"]) and np.array_equal(
+                        values["target"], previous_chunk["target"]
+                    ), "Synapses must be in the same order as when stored"
+
+                    weights = np.rint(values["weight"] / network["weight_quantum"]).astype(np.int64)
+                    changes = weights - np.rint(previous_weights / network["weight_quantum"]).astype(np.int64)
+
+                    if np.any(changes != 0):
+                        data = zlib.compress(changes.astype(np.int32).tobytes())
+                        f.write(data)
+                        index[i] = [offset, len(data)]
+                        offset += len(data)
+
+            with open(os.path.join(tmp_dirname, f"{synapse_model}_{rank}.json"), "w") as f:
+                json.dump(index, f)
+
+        nest.SyncProcesses()
+        self.move_tmp_dir(tmp_dirname, os.path.join(dump_dirname, f"checkpoint_{checkpoint}"))
+
+    def get_n_checkpoints(self, dump_dirname):
+        """
+        Return the number of checkpoints of a stored network, including the network itself.
+        """
+
+        n_checkpoints = 1
+        while os.path.exists(os.path.join(dump_dirname, f"checkpoint_{n_checkpoints}")):
+            n_checkpoints += 1
+        return n_checkpoints
+
+    def make_tmp_dir(self, dirname):
+        """
+        Create an empty temporary directory on the first rank and return its name.
+        """
+
+        tmp_dirname = f"{dirname}.tmp"
+
+        if nest.Rank() == 0:
+            if os.path.exists(tmp_dirname):
+                shutil.rmtree(tmp_dirname)
+            os.makedirs(tmp_dirname)
+        nest.SyncProcesses()
+
+        return tmp_dirname
+
+    def move_tmp_dir(self, tmp_dirname, dirname):
+        """
+        Move a completed temporary directory to its final place on the first rank.
+        """
+
+        if nest.Rank() == 0:
+            if os.path.exists(dirname):
+                shutil.rmtree(dirname)
+            os.rename(tmp_dirname, dirname)
+        nest.SyncProcesses()
+
+    def store_neurons(self, dirname):
+        """
+        Store node ID and membrane potential of all local neurons.
+        """
+
+        local_neurons = nest.GetLocalNodeCollection(self.neurons)
+        nrns = np.empty(len(local_neurons), dtype=self.nrn_dtype)
+        if len(local_neurons) > 0:
+            nrns["node_id"] = local_neurons.tolist()
+            nrns["V_m"] = np.atleast_1d(local_neurons.get("V_m"))
+        nrns.tofile(os.path.join(dirname, f"V_m_{nest.Rank()}.bin"))
+
+    def get_synapse_chunks(self, synapse_model, sources, indegree, names):
+        """
+        Yield the given properties of all local synapses of a synapse model chunk by chunk.
+        """
+
+        # Every neuron receives indegree synapses, so a block of sources has
+        # about chunk_size synapses on average on each rank.
+        n_sources = max(1, self.chunk_size * nest.NumProcesses() * len(sources) // (indegree * self.n))
+
+        for start in range(0, len(sources), n_sources):
+            conns = nest.GetConnections(source=sources[start : start + n_sources], synapse_model=synapse_model)
+            if len(conns) == 0:
+                continue
+
+            values = conns.get(list(names))
+            yield {name: np.atleast_1d(values[name]) for name in names}
+
+    def store_synapses(self, filename, synapse_model, sources, indegree):
+        """
+        Append all synapses of a synapse model to a binary file chunk by chunk
+        and return the numbers of synapses of the chunks.
+        """
+
+        dtype = self.syn_dtype[synapse_model]
+
+        chunk_sizes = []
+        with open(filename, "wb") as f:
+            for values in self.get_synapse_chunks(synapse_model, sources, indegree, dtype.names):
+                chunk = np.empty(len(values["source"]), dtype=dtype)
+                for name in dtype.names:
+                    chunk[name] = values[name]
+                chunk.tofile(f)
+                chunk_sizes.append(len(chunk))
+
+        return chunk_sizes
+
+    def restore(self, dump_dirname, checkpoint=0):
+        """
+        Restore network from data in directory combined with base information in the class.
+
+        By default, the network as stored is restored; later checkpoints are restored by their number.
+        """
+
+        with open(os.path.join(dump_dirname, "network.json")) as f:
+            network = json.load(f)
+
+        assert checkpoint < self.get_n_checkpoints(dump_dirname), "Checkpoint does not exist"
 
         ###############################################################################
         # Reconstruct neurons
-        # Since NEST does not understand Pandas Series, we must pass the values as
-        # NumPy arrays
-        self.e_neurons = nest.Create(self.neuron_model, n=self.nE, params={"V_m": network["e_nrns"].V_m.values})
-        self.i_neurons = nest.Create(self.neuron_model, n=self.nI, params={"V_m": network["i_nrns"].V_m.values})
+        # Every rank reads the membrane potentials of all shards and passes them
+        # in the order of the node IDs.
+        nrn_dirname = dump_dirname if checkpoint == 0 else os.path.join(dump_dirname, f"checkpoint_{checkpoint}")
+        nrn_dtype = np.dtype([tuple(column) for column in network["nrn_columns"]])
+        nrns = np.concatenate(
+            [
+                np.fromfile(os.path.join(nrn_dirname, f"V_m_{shard_rank}.bin"), dtype=nrn_dtype)
+                for shard_rank in range(len(network["shards"]))
+            ]
+        )
+        V_m = nrns["V_m"][np.argsort(nrns["node_id"])]
+
+        self.e_neurons = nest.Create(self.neuron_model, n=self.nE, params={"V_m": V_m[: self.nE]})
+        self.i_neurons = nest.Create(self.neuron_model, n=self.nI, params={"V_m": V_m[self.nE :]})
         self.neurons = self.e_neurons + self.i_neurons
 
         ###############################################################################
@@ -189,25 +417,78 @@ class EINetwork:
 
         ###############################################################################
         # Reconstruct connectivity
-        nest.Connect(
-            network["e_syns"].source.values,
-            network["e_syns"].target.values,
-            "one_to_one",
-            {"synapse_model": "e_syn", "weight": network["e_syns"].weight.values},
-        )
-
-        nest.Connect(
-            network["i_syns"].source.values,
-            network["i_syns"].target.values,
-            "one_to_one",
-            {"synapse_model": "i_syn", "weight": network["i_syns"].weight.values},
-        )
+        # The synapses of all shards are read by every rank, which only connects
+        # those to its local neurons. Since NEST expects node IDs as integers and
+        # parameters as floats, only the current chunk is converted.
+        is_local = np.zeros(max(self.neurons.tolist()) + 1, dtype=bool)
+        is_local[nest.GetLocalNodeCollection(self.neurons).tolist()] = True
+
+        for synapse_model in network["syn_columns"]:
+            for shard_rank in range(len(network["shards"])):
+                for chunk, weights in self.read_synapses(dump_dirname, network, synapse_model, shard_rank, checkpoint):
+                    local = is_local[chunk["target"]]
+                    if not np.any(local):
+                        continue
+
+                    syn_spec = {name: chunk[name][local].astype(np.float64) for name in chunk.dtype.names[2:]}
+                    syn_spec["weight"] = weights[local]
+                    syn_spec["synapse_model"] = synapse_model
+                    nest.Connect(
+                        chunk["source"][local].astype(np.int64),
+                        chunk["target"][local].astype(np.int64),
+                        "one_to_one",
+                        syn_spec,
+                    )
 
         ###############################################################################
         # Reconnect instruments
         nest.Connect(self.pg, self.neurons, "all_to_all", {"weight": self.JE})
         nest.Connect(self.e_neurons, self.sr)
 
+    def read_synapses(self, dump_dirname, network, synapse_model, shard_rank, checkpoint):
+        """
+        Yield the synapses of a synapse model in a shard chunk by chunk, together
+        with their weights at the given checkpoint.
+        """
+
+        dtype = np.dtype([tuple(column) for column in network["syn_columns"][synapse_model]])
+        chunk_sizes = network["shards"][shard_rank]["chunks"][synapse_model]
+        if sum(chunk_sizes) == 0:
+            # a rank without synapses of this model wrote an empty file, which cannot be mapped
+            return
+
+        synapses = np.memmap(
+            os.path.join(dump_dirname, f"{synapse_model}_{shard_rank}.bin"),
+            dtype=dtype,
+            mode="r",
+            shape=(sum(chunk_sizes),),
+        )
+
+        changes = []
+        if synapse_model in self.plastic_synapse_models:
+            for i in range(1, checkpoint + 1):
+                filename = os.path.join(dump_dirname, f"checkpoint_{i}", f"{synapse_model}_{shard_rank}")
+                with open(f"{filename}.json") as f:
+                    index = json.load(f)
+                if index:
+                    changes.append((index, np.memmap(f"{filename}.bin", dtype=np.uint8, mode="r")))
+
+        start = 0
+        for i, chunk_size in enumerate(chunk_sizes):
+            chunk = synapses[start : start + chunk_size]
+            start += chunk_size
+
+            weights = chunk["weight"].astype(np.float64)
+            if synapse_model in self.plastic_synapse_models and checkpoint > 0:
+                weights = np.rint(weights / network["weight_quantum"]).astype(np.int64)
+                for index, data in changes:
+                    if str(i) in index:
+                        offset, n_bytes = index[str(i)]
+                        weights += np.frombuffer(zlib.decompress(data[offset : offset + n_bytes]), dtype=np.int32)
+                weights = weights * network["weight_quantum"]
+
+            yield chunk, weights
+
 
 class DemoPlot:
     """
@@ -328,7 +609,7 @@ if __name__ == "__main__":
     ###############################################################################
     # Store network state to file with state after 1s.
     print("\n*** Storing simulation ...", end="", flush=True)
-    ein.store("ein_1000.pkl")
+    ein.store("ein_1000")
     print(" done ***\n")
 
     ###############################################################################
@@ -337,13 +618,19 @@ if __name__ == "__main__":
     nest.Simulate(T_sim)
     dplot.add_to_plot(ein, lbl="Continued simulation", t_min=T_sim, t_max=2 * T_sim)
 
+    ###############################################################################
+    # Add the network state after 2s as checkpoint to the stored network. Only
+    # the membrane potentials and the changes of the excitatory weights are
+    # written. This checkpoint could be restored with ``restore("ein_1000", 1)``.
+    ein.store_checkpoint("ein_1000")
+
     ###############################################################################
     # Clear kernel, restore network from file and simulate for 1s.
     print("\n*** Reloading and resuming simulation ***")
     nest.ResetKernel()
     nest.local_num_threads = 4
     ein2 = EINetwork()
-    ein2.restore("ein_1000.pkl")
+    ein2.restore("ein_1000")
     nest.Simulate(T_sim)
     dplot.add_to_plot(ein2, lbl="Reloaded simulation")
 
@@ -354,7 +641,7 @@ if __name__ == "__main__":
     nest.ResetKernel()
     nest.local_num_threads = 4
     ein2 = EINetwork()
-    ein2.restore("ein_1000.pkl")
+    ein2.restore("ein_1000")
     nest.Simulate(T_sim)
     dplot.add_to_plot(ein2, lbl="Reloaded simulation (same seed)")
 
@@ -366,7 +653,7 @@ if __name__ == "__main__":
     nest.local_num_threads = 4
     nest.rng_seed = 987654321
     ein2 = EINetwork()
-    ein2.restore("ein_1000.pkl")
+    ein2.restore("ein_1000")
     nest.Simulate(T_sim)
     dplot.add_to_plot(ein2, lbl="Reloaded simulation (different seed)")
 
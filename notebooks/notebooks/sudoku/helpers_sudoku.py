@@ -172,25 +172,15 @@ def validate_solution(puzzle, solution):
         True wherever a column is valid
     """
 
-    boxes = np.ones((3, 3), dtype=bool)
-    rows = np.ones(9, dtype=bool)
-    cols = np.ones(9, dtype=bool)
+    expected_numbers = np.arange(1, 10)
 
-    expected_numbers = set(range(1, 10))
+    # A row, column or box is valid iff its sorted digits are exactly 1..9.
+    rows = (np.sort(solution, axis=1) == expected_numbers).all(axis=1)
+    cols = (np.sort(solution, axis=0) == expected_numbers[:, np.newaxis]).all(axis=0)
 
-    # validate boxes
-    for i in range(3):
-        for j in range(3):
-            box = solution[3 * i : 3 * i + 3, 3 * j : 3 * j + 3]
-            if expected_numbers != set(box.flatten()):
-                boxes[i, j] = False
-
-    # validate rows and columns
-    for i in range(9):
-        if expected_numbers != set(solution[i, :]):
-            rows[i] = False
-        if expected_numbers != set(solution[:, i]):
-            cols[i] = False
+    # rearrange the field to shape (box row, box column, cell within box)
+    box_cells = np.reshape(solution, (3, 3, 3, 3)).transpose(0, 2, 1, 3).reshape(3, 3, 9)
+    boxes = (np.sort(box_cells, axis=2) == expected_numbers).all(axis=2)
 
     # It is possible (in rare cases) that the network finds a valid
     # solution that does not conform to the initial puzzle configuration, that is,
@@ -205,6 +195,24 @@ def validate_solution(puzzle, solution):
     return valid, boxes, rows, cols
 
 
+def read_benchmark_results(filename):
+    """Reads the result table written by ``sudoku_benchmark.py``.
+
+    Parameters
+    ----------
+    filename : str
+        path of the CSV file
+
+    Returns
+    -------
+    np.array
+        structured array with one entry per run and the fields ``puzzle``,
+        ``noise_rate``, ``pop_size``, ``seed``, ``solved``, ``time_to_solution``
+        (simulated time in ms, NaN for unsolved runs) and ``wall_time`` (s).
+    """
+    return np.atleast_1d(np.genfromtxt(filename, delimiter=",", names=True, dtype=None, encoding=None))
+
+
 def plot_field(puzzle, solution, ax, with_color=False):
     """Generates a graphical representation of a Sudoku field. Digits that are
     given by the puzzle are represented as bold and black, while calculated
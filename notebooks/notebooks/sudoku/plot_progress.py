@@ -29,11 +29,17 @@ Note that the script generates the images individually, storing
 them to disk first, assembling them into a GIF and then,
 by default, deleting the images and folder.
 
+If ``benchmark_file`` is set to a .csv file generated by
+``sudoku_benchmark.py``, the script instead plots the distributions
+of the time to solution for every noise rate.
+
 See Also
 ~~~~~~~~
 
 :doc:`sudoku_solver`
 
+:doc:`sudoku_benchmark`
+
 :doc:`helpers_sudoku`
 
 :Authors: J Gille
@@ -56,12 +62,53 @@ def get_progress(puzzle, solution):
     return (boxes.sum() + rows.sum() + cols.sum()) / 27
 
 
+def plot_benchmark(results_file, out_file):
+    """Plots the distribution of the time to solution for every noise rate
+    (and population size) in a benchmark result table, together with the
+    fraction of runs that found a solution.
+    """
+    results = helpers_sudoku.read_benchmark_results(results_file)
+    groups = sorted(set(zip(results["noise_rate"], results["pop_size"])))
+
+    times = []
+    solved_fraction = []
+    labels = []
+    for noise_rate, pop_size in groups:
+        group = results[(results["noise_rate"] == noise_rate) & (results["pop_size"] == pop_size)]
+        solved = group["solved"].astype(bool)
+        times.append(group["time_to_solution"][solved])
+        solved_fraction.append(solved.mean())
+        labels.append(f"{noise_rate:g}Hz" if len(set(results["pop_size"])) == 1 else f"{noise_rate:g}Hz\n{pop_size}n")
+
+    fig, (ax_time, ax_solved) = plt.subplots(2, 1, sharex=True, figsize=(8, 6), gridspec_kw={"height_ratios": (3, 1)})
+    positions = np.arange(len(groups))
+    ax_time.boxplot(times, positions=positions, whis=(10, 90), showfliers=True)
+    ax_time.set_ylabel("time to solution (ms)")
+
+    ax_solved.bar(positions, solved_fraction, color="gray")
+    ax_solved.set_ylim(0, 1)
+    ax_solved.set_ylabel("solved")
+    ax_solved.set_xticks(positions, labels)
+    ax_solved.set_xlabel("noise rate")
+
+    fig.savefig(out_file)
+    print(f"benchmark plot created under: {out_file}")
+
+
 # Name of the .pkl files to read from.
 in_files = ["350Hz_puzzle_4.pkl"]
 temp_dir = "tmp"  # Name of directory for temporary files
 out_file = "sudoku.gif"  # Name of the output GIF
 keep_temps = False  # If True, temporary files will not be deleted
 
+# Name of a .csv file generated by sudoku_benchmark.py. If set, the benchmark
+# results are plotted to benchmark_out_file instead of generating a GIF.
+benchmark_file = None
+benchmark_out_file = "sudoku_benchmark.png"
+
+if benchmark_file is not None:
+    plot_benchmark(benchmark_file, benchmark_out_file)
+    sys.exit()
 
 if os.path.exists(out_file):
     print(f"Target file ({out_file}) already exists! Aborting.")
@@ -0,0 +1,217 @@
+# -*- coding: utf-8 -*-
+#
+# sudoku_benchmark.py
+#
+# This file is part of NEST.
+#
+# Copyright (C) 2004 The NEST Initiative
+#
+# NEST is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# NEST is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NEST.  If not, see <http://www.gnu.org/licenses/>.
+
+r"""Time-to-solution benchmark for the Sudoku network
+----------------------------------------------------------------
+
+This script measures how long the network takes to solve Sudoku puzzles
+for a grid of puzzles, noise rates, population sizes and random seeds.
+
+Every run is carried out in a fresh NEST kernel inside a worker process,
+so that several runs can be simulated in parallel. As in
+:doc:`sudoku_solver`, the network is simulated in windows of ``sim_time``
+and decoded after each window; a run stops as soon as
+``validate_solution`` accepts the decoded state or ``max_sim_time`` is
+reached.
+
+For every run, the puzzle index, noise rate, population size, seed, whether
+the puzzle was solved, the simulated time to solution and the wall-clock
+time are appended to a CSV file as soon as the run finishes. Afterwards,
+percentiles of the time to solution are printed for every noise rate and
+population size. The distributions can be plotted with
+:doc:`plot_progress` by setting its ``benchmark_file``.
+
+See Also
+~~~~~~~~
+
+:doc:`sudoku_solver`
+
+:doc:`Network class <sudoku_net>`
+
+:doc:`Helper functions <helpers_sudoku>`
+
+:Authors: J Gille
+"""
+import argparse
+import csv
+import itertools
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+from helpers_sudoku import get_puzzle, read_benchmark_results, validate_solution
+
+result_fields = ["puzzle", "noise_rate", "pop_size", "seed", "solved", "time_to_solution", "wall_time"]
+
+
+def solve(puzzle_index, noise_rate, pop_size, seed, sim_time, max_sim_time, n_threads):
+    """Simulates the network on a single puzzle until it is solved or the
+    maximum simulation time is reached.
+
+    Parameters
+    ----------
+    puzzle_index : int
+        index of the puzzle, see get_puzzle()
+    noise_rate : float
+        rate of the background Poisson generator in spks/s
+    pop_size : int
+        number of neurons per population
+    seed : int
+        seed for the NEST and NumPy random number generators
+    sim_time : float
+        length of the simulation window after which the network is decoded (ms)
+    max_sim_time : float
+        simulation time after which the run is aborted (ms)
+    n_threads : int
+        number of NEST threads used by the worker process
+
+    Returns
+    -------
+    dict
+        one row of the result table, see ``result_fields``
+    """
+    # NEST is imported in the worker so that every process has its own kernel
+    import nest
+    import sudoku_net
+
+    start = time.time()
+
+    nest.ResetKernel()
+    nest.set_verbosity("M_WARNING")
+    nest.SetKernelStatus({"local_num_threads": n_threads, "rng_seed": seed})
+    # NumPy is used to break ties during decoding
+    np.random.seed(seed)
+
+    puzzle = get_puzzle(puzzle_index)
+    network = sudoku_net.SudokuNet(pop_size=pop_size, input=puzzle, noise_rate=noise_rate)
+
+    solved = False
+    simulated = 0.0
+    while simulated < max_sim_time:
+        network.reset_spike_recorders()
+        nest.Simulate(sim_time)
+        simulated += sim_time
+
+        solved = validate_solution(puzzle, network.get_solution())[0]
+        if solved:
+            break
+
+    return {
+        "puzzle": puzzle_index,
+        "noise_rate": noise_rate,
+        "pop_size": pop_size,
+        "seed": seed,
+        "solved": int(solved),
+        # simulated time at the end of the window in which the solution was found
+        "time_to_solution": simulated if solved else np.nan,
+        "wall_time": time.time() - start,
+    }
+
+
+def run_benchmark(puzzles, noise_rates, pop_sizes, seeds, out_file, sim_time, max_sim_time, n_processes, n_threads):
+    """Runs all combinations of puzzles, noise rates, population sizes and
+    seeds in parallel worker processes and appends every result to a CSV file
+    as soon as it is available.
+    """
+    runs = list(itertools.product(puzzles, noise_rates, pop_sizes, seeds))
+    logging.info(f"running {len(runs)} simulations in {n_processes} processes...")
+
+    # Worker processes are spawned rather than forked so that they do not
+    # inherit any state of an already initialized NEST kernel.
+    context = multiprocessing.get_context("spawn")
+
+    with open(out_file, "w", newline="") as f, ProcessPoolExecutor(n_processes, mp_context=context) as executor:
+        writer = csv.DictWriter(f, fieldnames=result_fields)
+        writer.writeheader()
+
+        futures = [executor.submit(solve, *run, sim_time, max_sim_time, n_threads) for run in runs]
+        for n_done, future in enumerate(as_completed(futures), start=1):
+            result = future.result()
+            writer.writerow(result)
+            f.flush()
+
+            status = f"solved after {result['time_to_solution']:.0f}ms" if result["solved"] else "not solved"
+            logging.info(
+                f"[{n_done}/{len(runs)}] puzzle {result['puzzle']}, {result['noise_rate']}Hz, "
+                f"pop_size {result['pop_size']}, seed {result['seed']}: {status} "
+                f"({result['wall_time']:.1f}s)"
+            )
+
+
+def summarize(results, percentiles=(10, 50, 90)):
+    """Prints the fraction of solved runs and percentiles of the time to
+    solution for every combination of noise rate and population size.
+
+    Parameters
+    ----------
+    results : np.array
+        structured array as returned by read_benchmark_results()
+    percentiles : tuple
+        percentiles of the time to solution to report
+    """
+    header = ["noise_rate", "pop_size", "runs", "solved"] + [f"p{p} (ms)" for p in percentiles] + ["wall (s)"]
+    print("".join(f"{h:>12}" for h in header))
+
+    for noise_rate, pop_size in sorted(set(zip(results["noise_rate"], results["pop_size"]))):
+        group = results[(results["noise_rate"] == noise_rate) & (results["pop_size"] == pop_size)]
+        solved = group["solved"].astype(bool)
+        if solved.any():
+            times = np.percentile(group["time_to_solution"][solved], percentiles)
+        else:
+            times = np.full(len(percentiles), np.nan)
+
+        row = [f"{noise_rate:g}", f"{pop_size:d}", f"{len(group)}", f"{solved.mean():.2f}"]
+        row += [f"{t:.0f}" for t in times] + [f"{np.median(group['wall_time']):.1f}"]
+        print("".join(f"{r:>12}" for r in row))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--puzzles", nargs="+", type=int, default=list(range(8)), help="Puzzle indices (0-7).")
+    parser.add_argument("--noise_rates", nargs="+", type=float, default=[250.0, 300.0, 350.0, 400.0])
+    parser.add_argument("--pop_sizes", nargs="+", type=int, default=[5])
+    parser.add_argument("--seeds", nargs="+", type=int, default=list(range(1, 6)))
+    parser.add_argument("--sim_time", type=float, default=100.0, help="Decoding interval (ms).")
+    parser.add_argument("--max_sim_time", type=float, default=10000.0, help="Time after which a run is aborted (ms).")
+    parser.add_argument("--processes", type=int, default=os.cpu_count(), help="Number of worker processes.")
+    parser.add_argument("--threads", type=int, default=1, help="NEST threads per worker process.")
+    parser.add_argument("--out_file", type=str, default="sudoku_benchmark.csv")
+
+    args, unknown = parser.parse_known_args()
+    logging.basicConfig(level=logging.INFO)
+
+    run_benchmark(
+        args.puzzles,
+        args.noise_rates,
+        args.pop_sizes,
+        args.seeds,
+        args.out_file,
+        args.sim_time,
+        args.max_sim_time,
+        args.processes,
+        args.threads,
+    )
+
+    summarize(read_benchmark_results(args.out_file))
+    print(f"results stored in {args.out_file}")
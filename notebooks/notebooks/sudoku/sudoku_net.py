@@ -96,19 +96,24 @@ class SudokuNet:
         # one stimulation source for every digit in every cell
         self.stim = nest.Create("poisson_generator", self.n_populations, {"rate": self.stim_rate})
 
-        # one spike recorder for every digit in every cell
-        self.spikerecorders = nest.Create("spike_recorder", self.n_populations)
+        # a single spike recorder for the whole network; spikes are assigned
+        # to their populations by sender ID in get_spike_counts()
+        self.spikerecorder = nest.Create("spike_recorder")
 
         # Matrix that stores indices of all neurons in a structured way
         # for easy access during connection setup.
         # Dimensions: (row, column, digit value, individual neuron)
         self.neuron_indices = np.reshape(np.arange(self.n_total), (9, 9, 9, self.pop_size))
 
-        # Matrix that stores indices of inputs and outputs of the network
-        # (stimulation sources and spike recorders) to be connected to the
-        # neurons. Dimensions: (row, column, digit value)
+        # Matrix that stores indices of the stimulation sources to be
+        # connected to the neurons. Dimensions: (row, column, digit value)
         self.io_indices = np.reshape(np.arange(self.n_populations), (9, 9, 9))
 
+        # Lookup array mapping (sender ID - first neuron ID) to the flat index
+        # (row * 81 + column * 9 + digit) of the population the neuron belongs to.
+        self.first_neuron_id = self.neurons[0].global_id
+        self.population_of_neuron = np.repeat(np.arange(self.n_populations), self.pop_size)
+
         logging.info("Creating inter-neuron and IO-connections...")
         for row in range(9):
             # First and last row of the current 3x3 box.
@@ -165,8 +170,15 @@ class SudokuNet:
                         {"delay": delay, "weight": 0.0},
                     )
 
-                    # connect current population to a single spike_recorder
-                    nest.Connect(sources, self.spikerecorders[self.io_indices[row, column, digit]])
+        nest.Connect(self.neurons, self.spikerecorder)
+
+        # Cache the stimulation connections together with a lookup matrix of
+        # their positions in the SynapseCollection, so that input configurations
+        # can be changed without querying the connections again.
+        # Dimensions: (row, column, digit value, individual connection)
+        self.stim_connections = nest.GetConnections(self.stim)
+        stim_sources = np.asarray(self.stim_connections.source) - self.stim[0].global_id
+        self.stim_connection_indices = np.reshape(np.argsort(stim_sources, kind="stable"), (9, 9, 9, self.pop_size))
 
         if input is not None:
             logging.info("setting input...")
@@ -176,7 +188,7 @@ class SudokuNet:
 
     def reset_input(self):
         """Sets all weights between input and network neurons to 0."""
-        nest.GetConnections(self.stim).set({"weight": 0.0})
+        self.stim_connections.set({"weight": 0.0})
 
     def set_input_config(self, input):
         """Sets the connection weights from stimulation sources to populations
@@ -188,25 +200,70 @@ class SudokuNet:
             a np.array of shape (9,9) where each entry is the value of the corresponding
             cell in the sudoku field. Zero-valued entries are ignored.
         """
-        self.reset_input()
+        input = np.asarray(input)
 
-        for row in range(9):
-            for column in range(9):
-                value = input[row, column]
+        # only apply stimulation where the input configuration dictates a number
+        rows, columns = np.nonzero(input)
+        stimulated = self.stim_connection_indices[rows, columns, input[rows, columns] - 1]
+
+        weights = np.zeros(len(self.stim_connections))
+        weights[stimulated.ravel()] = weight_stim
+        self.stim_connections.set({"weight": weights.tolist()})
 
-                # only apply stimulation where the input configuration dictates a number
-                if value != 0:
-                    connections = nest.GetConnections(self.stim[self.io_indices[row, column, value - 1]])
-                    connections.set({"weight": weight_stim})
+    def load_puzzle(self, input):
+        """Prepares the network for solving a new puzzle: applies the input
+        configuration, resets the membrane potentials and deletes all recorded
+        spikes. No connections need to be queried.
+
+        Parameters
+        ----------
+        input : np.array
+            a np.array of shape (9,9) encoding the puzzle, see set_input_config().
+        """
+        self.set_input_config(input)
+        self.reset_V_m()
+        self.reset_spike_recorders()
 
     def get_spike_trains(self):
-        """Returns all events recorded by the spike recorders.
+        """Returns all events recorded by the spike recorder.
+
+        Returns:
+            dict
+                events of the spike recorder, containing the arrays
+                ``senders`` and ``times``
+        """
+        return self.spikerecorder.get("events")
+
+    def get_spike_counts(self):
+        """Returns the number of spikes emitted by every population since the
+        spike recorder was last reset.
+
+        Returns:
+            np.array
+                integer array of shape (9,9,9) holding the spike count for
+                every (row, column, digit value)
+        """
+        senders = np.asarray(self.spikerecorder.get("events", "senders"), dtype=np.int64)
+        populations = self.population_of_neuron[senders - self.first_neuron_id]
+        counts = np.bincount(populations, minlength=self.n_populations)
+        return counts.reshape((9, 9, 9))
+
+    def get_solution(self):
+        """Decodes the current state of the network into a Sudoku field.
+
+        In every cell, the digit whose population emitted the most spikes
+        wins. If two digits have the same activation, one of them is picked
+        at random.
 
         Returns:
             np.array
-                array of all the data from all spike recorders
+                array of shape (9,9) containing the winning digit of every cell
         """
-        return np.array(self.spikerecorders.get("events"))
+        spike_counts = self.get_spike_counts()
+        # Adding uniform noise in [0, 1) to the integer counts breaks ties
+        # randomly without changing the order of distinct counts.
+        jittered = spike_counts + np.random.random_sample(spike_counts.shape)
+        return (np.argmax(jittered, axis=2) + 1).astype(np.uint8)
 
     def reset(self):
         """Resets the network in three steps:
@@ -223,8 +280,8 @@ class SudokuNet:
         self.neurons.V_m = nest.random.uniform(-65, 55)
 
     def reset_spike_recorders(self):
-        """Deletes all recorded spikes from the spike recorders connected to the network."""
-        self.spikerecorders.n_events = 0
+        """Deletes all recorded spikes from the spike recorder connected to the network."""
+        self.spikerecorder.n_events = 0
 
     def set_noise_rate(self, rate):
         """Sets the rate of the Poisson generator that feeds noise into the network.
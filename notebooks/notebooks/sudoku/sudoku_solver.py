@@ -87,22 +87,8 @@ while not valid:
     network.reset_spike_recorders()
     nest.Simulate(sim_time)
 
-    spiketrains = network.get_spike_trains()
-    solution = np.zeros((9, 9), dtype=np.uint8)
-
-    for row in range(9):
-        for col in range(9):
-            # obtain indices of the spike recorders coding for digits in
-            # the current cell
-            spike_recorders = network.io_indices[row, col]
-
-            # spiketrains for all digits in the current cells
-            cell_spikes = spiketrains[spike_recorders]
-            spike_counts = np.array([len(s["times"]) for s in cell_spikes])
-
-            # if two digits have the same activation, pick one at random
-            winning_digit = int(np.random.choice(np.flatnonzero(spike_counts == spike_counts.max()))) + 1
-            solution[row, col] = winning_digit
+    # winner-take-all decoding of the spike counts of all 729 populations
+    solution = network.get_solution()
 
     solution_states[run] = solution
     valid, cells, rows, cols = validate_solution(puzzle, solution)
@@ -31,27 +31,17 @@ source and targets.
 
 import matplotlib.pyplot as plt
 import nest
-import numpy as np
-
-
-def makeMatrix(sources, targets, weights):
-    """
-    Returns a matrix with the weights between the source and target node_ids.
-    """
-    aa = np.zeros((max(sources) + 1, max(targets) + 1))
-
-    for src, trg, wght in zip(sources, targets, weights):
-        aa[src, trg] += wght
-
-    return aa
+from weight_matrices import weight_matrix
 
 
 def plotMatrix(srcs, tgts, weights, title, pos):
     """
     Plots weight matrix.
+
+    The matrix holds the weights between the source and target node_ids, see :doc:`weight_matrices`.
     """
     plt.subplot(pos)
-    plt.matshow(makeMatrix(srcs, tgts, weights), fignum=False)
+    plt.matshow(weight_matrix(srcs, tgts, weights, as_sparse=False), fignum=False)
     plt.xlim([min(tgts) - 0.5, max(tgts) + 0.5])
     plt.xlabel("target")
     plt.ylim([max(srcs) + 0.5, min(srcs) - 0.5])
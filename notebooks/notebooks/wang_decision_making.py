@@ -45,6 +45,7 @@ import matplotlib.pyplot as plt
 import nest
 import numpy as np
 from matplotlib.gridspec import GridSpec
+from spike_trains import SpikeTrains
 
 # Use approximate model, can be replaced by "iaf_bw_2001_exact"
 model = "iaf_bw_2001"
@@ -201,9 +202,6 @@ def run_sim(coherence, seed=123):
     sr_selective2 = nest.Create("spike_recorder", {"time_in_steps": True})
     sr_inhibitory = nest.Create("spike_recorder", {"time_in_steps": True})
 
-    sr_selective1_raster = nest.Create("spike_recorder", 100, {"time_in_steps": True})
-    sr_selective2_raster = nest.Create("spike_recorder", 100, {"time_in_steps": True})
-
     ##################################################
     # Define synapse specifications
 
@@ -336,9 +334,7 @@ def run_sim(coherence, seed=123):
     nest.Connect(selective_pop1 + selective_pop2, inhibitory_pop, conn_spec="all_to_all", syn_spec=ei_syn_spec_NMDA)
 
     nest.Connect(selective_pop1, sr_selective1)
-    nest.Connect(selective_pop1[:100], sr_selective1_raster, "one_to_one")
     nest.Connect(selective_pop2, sr_selective2)
-    nest.Connect(selective_pop2[:100], sr_selective2_raster, "one_to_one")
 
     # from inhibitory pop
     nest.Connect(
@@ -355,20 +351,24 @@ def run_sim(coherence, seed=123):
     ##################################################
     # Collect data from simulation
     spikes_nonselective = sr_nonselective.events["times"]
-    spikes_selective1 = sr_selective1.events["times"]
-    spikes_selective2 = sr_selective2.events["times"]
     spikes_inhibitory = sr_inhibitory.events["times"]
 
-    spikes_selective1_raster = sr_selective1_raster.get("events", "times")
-    spikes_selective2_raster = sr_selective2_raster.get("events", "times")
+    # spike trains of the selective populations; spikes are recorded in steps,
+    # multiply by dt to get time
+    events_selective1 = sr_selective1.events
+    events_selective2 = sr_selective2.events
+    spikes_selective1 = SpikeTrains.from_events(
+        events_selective1["senders"], events_selective1["times"] * dt, selective_pop1.tolist()
+    )
+    spikes_selective2 = SpikeTrains.from_events(
+        events_selective2["senders"], events_selective2["times"] * dt, selective_pop2.tolist()
+    )
 
     return {
         "nonselective": spikes_nonselective,
         "selective1": spikes_selective1,
         "selective2": spikes_selective2,
         "inhibitory": spikes_inhibitory,
-        "selective1_raster": spikes_selective1_raster,
-        "selective2_raster": spikes_selective2_raster,
     }
 
 
@@ -397,11 +397,9 @@ num = 0.15 * NE
 
 for j in range(3):
     # compute firing rates as moving averages over 50 ms windows with 5 ms strides
-    hist1, _ = np.histogram(
-        results[j]["selective1"] * dt, bins=bins
-    )  # spikes are recorded in steps, multiply på dt to get time
+    hist1 = results[j]["selective1"].psth(bins)
     hist1 = hist1.reshape((-1, 5)).sum(-1)
-    hist2, _ = np.histogram(results[j]["selective2"] * dt, bins=bins)
+    hist2 = results[j]["selective2"].psth(bins)
     hist2 = hist2.reshape((-1, 5)).sum(-1)
 
     pop1_rate = np.convolve(hist1, np.ones(10) * 0.1, mode="same") / num / 5 * 1000
@@ -414,12 +412,12 @@ for j in range(3):
     ax[j * 3 + 1, 0].set_ylim(0, 40)
     ax[j * 3 + 1, 1].set_ylim(0, 40)
     for k in range(100):
-        sp = results[j]["selective1_raster"][k] * dt / 5.0
+        sp = results[j]["selective1"][k] / 5.0
         ax[j * 3, 0].scatter(sp, np.ones_like(sp) * k, s=1.0, marker="|", c="black")
         ax[j * 3, 0].vlines([200, 400], 0, 100, colors="black", linewidths=1.0)
         ax[j * 3, 0].set_yticks([])
         ax[j * 3, 0].set_ylim(0, 99)
-        sp = results[j]["selective2_raster"][k] * dt / 5.0
+        sp = results[j]["selective2"][k] / 5.0
         ax[j * 3, 1].scatter(sp, np.ones_like(sp) * k, s=1.0, marker="|", c="black")
         ax[j * 3, 1].vlines([200, 400], 0, 100, colors="black", linewidths=1.0)
         ax[j * 3, 1].set_yticks([])
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+#
+# weight_matrices.py
+#
+# This file is part of NEST.
+#
+# Copyright (C) 2004 The NEST Initiative
+#
+# NEST is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 2 of the License, or
+# (at your option) any later version.
+#
+# NEST is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with NEST.  If not, see <http://www.gnu.org/licenses/>.
+
+
+r"""Weight matrices of connections between populations
+----------------------------------------------------------------
+
+The function ``weight_matrix`` gathers the weights of a set of connections,
+as obtained with ``GetConnections(...).get(["source", "target", "weight"])``,
+into a matrix with one row per source and one column per target. All weights
+are added in a single scatter operation, so that the weights of multapses are
+summed, instead of looping over the connections. Sparsely connected
+populations yield a ``scipy.sparse`` matrix, whose memory scales with the
+number of connections rather than with the number of neuron pairs.
+
+Weight matrices of populations too large to be shown pixel by pixel can be
+reduced with ``block_average`` to an image of bounded size, which works on
+sparse matrices without converting them to dense ones.
+
+It is used by :doc:`plot_weight_matrices` and :doc:`synapsecollection`.
+"""
+import numpy as np
+from scipy import sparse
+
+
+def weight_matrix(sources, targets, weights, source_ids=None, target_ids=None, as_sparse=None, max_density=0.1):
+    """Returns the summed weights of all connections between every source and target.
+
+    Parameters
+    ----------
+    sources : list or np.array
+        node IDs of the sources of the connections
+    targets : list or np.array
+        node IDs of the targets of the connections
+    weights : list or np.array
+        weights of the connections
+    source_ids : list or np.array, optional
+        node IDs of the sources corresponding to the rows; by default, row ``i`` corresponds to node ID ``i``, and
+        the number of rows is the largest node ID in ``sources`` plus one
+    target_ids : list or np.array, optional
+        node IDs of the targets corresponding to the columns, as ``source_ids`` for the rows
+    as_sparse : bool, optional
+        whether to return a ``scipy.sparse.csr_matrix``; by default, a sparse matrix is returned if the fraction of
+        connected pairs is at most ``max_density``
+    max_density : float
+        largest fraction of connected pairs for which a sparse matrix is returned by default
+
+    Returns
+    -------
+    np.array or scipy.sparse.csr_matrix
+        weight matrix of shape (number of sources, number of targets)
+    """
+    sources = np.asarray(sources, dtype=int).ravel()
+    targets = np.asarray(targets, dtype=int).ravel()
+    weights = np.asarray(weights, dtype=float).ravel()
+
+    rows, n_rows = get_indices(sources, source_ids)
+    cols, n_cols = get_indices(targets, target_ids)
+
+    if as_sparse is None:
+        as_sparse = len(weights) <= max_density * n_rows * n_cols
+
+    if as_sparse:
+        # duplicate entries of multapses are summed by the conversion to CSR
+        return sparse.coo_matrix((weights, (rows, cols)), shape=(n_rows, n_cols)).tocsr()
+
+    matrix = np.bincount(rows * n_cols + cols, weights, minlength=n_rows * n_cols)
+    return matrix.reshape((n_rows, n_cols))
+
+
+def get_indices(node_ids, ids=None):
+    """Returns the row or column index of every node ID and the number of rows or columns, see ``weight_matrix``."""
+    if ids is None:
+        return node_ids, (np.max(node_ids) + 1 if len(node_ids) > 0 else 0)
+
+    ids = np.asarray(ids, dtype=int).ravel()
+    order = np.argsort(ids)
+    positions = np.searchsorted(ids, node_ids, sorter=order)
+    indices = order[np.minimum(positions, len(ids) - 1)]
+    if np.any(ids[indices] != node_ids):
+        raise ValueError("connections contain node IDs that are not in the given node IDs")
+
+    return indices, len(ids)
+
+
+def block_average(matrix, max_shape=(500, 500)):
+    """Returns a dense matrix of at most ``max_shape`` entries with the average weight of every block of entries.
+
+    Rows and columns are combined in consecutive blocks of equal size, where the blocks at the end may be smaller.
+    Each entry of the result is the sum of the weights in a block divided by the number of entries of the block.
+    Matrices that are not larger than ``max_shape`` are returned as dense matrices unchanged.
+
+    Parameters
+    ----------
+    matrix : np.array or scipy.sparse matrix
+        weight matrix
+    max_shape : tuple
+        largest number of rows and columns of the result
+
+    Returns
+    -------
+    np.array
+        block-averaged weight matrix
+    """
+    n_rows, n_cols = matrix.shape
+    block_rows = int(np.ceil(n_rows / max_shape[0]))
+    block_cols = int(np.ceil(n_cols / max_shape[1]))
+
+    if sparse.issparse(matrix):
+        matrix = matrix.tocoo()
+        rows, cols, weights = matrix.row, matrix.col, matrix.data
+    else:
+        matrix = np.asarray(matrix)
+        if block_rows == 1 and block_cols == 1:
+            return matrix.copy()
+        rows, cols = np.indices(matrix.shape).reshape((2, -1))
+        weights = matrix.ravel()
+
+    shape = (int(np.ceil(n_rows / block_rows)), int(np.ceil(n_cols / block_cols)))
+    sums = np.bincount(rows // block_rows * shape[1] + cols // block_cols, weights, minlength=shape[0] * shape[1])
+
+    # number of entries of every block, accounting for the smaller blocks at the end
+    rows_per_block = np.bincount(np.arange(n_rows) // block_rows, minlength=shape[0])
+    cols_per_block = np.bincount(np.arange(n_cols) // block_cols, minlength=shape[1])
+
+    return sums.reshape(shape) / np.outer(rows_per_block, cols_per_block)